@@ -6,10 +6,12 @@ import ais as libais
 from ais import DecodeError
 
 from ais_tools.ais import AISMessageTranscoder
-from ais_tools.nmea import split_multipart
-from ais_tools.nmea import expand_nmea
+from ais_tools.nmea import split_multipart_sentences
+from ais_tools.nmea import expand_sentence
+from ais_tools.nmea import vdm_sentence
 from ais_tools.core import checksum_str
 from ais_tools.message import Message
+from ais_tools.record import Record
 
 
 class LibaisDecoder:
@@ -67,11 +69,13 @@ class AIVDM:
     """
     AIVDM message encoder/decoder
 
-    On construction, pass in the encoder and decoder to use
+    On construction, pass in the encoder and decoder to use.  Optionally pass in a tagblock_decoder
+    such as a TagblockCache to use in place of decode_tagblock()
     """
-    def __init__(self, decoder=None, encoder=None):
+    def __init__(self, decoder=None, encoder=None, tagblock_decoder=None):
         self.decoder = decoder or AisToolsDecoder()
         self.encoder = encoder or AisToolsEncoder()
+        self.tagblock_decoder = tagblock_decoder
 
     def safe_decode(self, nmea, best_effort=False):
         """
@@ -97,14 +101,34 @@ class AIVDM:
             or a concatenated set of AIVDM messages that make up the parts for a multi-part message
         Returns a dict with the passed in nmea string in the "nmea" field
 
+        If all the sentences are well formed VDM or VDO sentences, the returned Message also has an attribute
+        nmea_sentences with the concatenated sentences with tagblocks removed.  This is the same type as the
+        line that was parsed, either str or bytes
+
+        nmea may also be passed as bytes, in which case it is parsed directly without first converting to str
+
         raises DecodeError if the message cannot be decoded.
         """
 
         msg = Message(nmea)
-        nmea = msg.nmea
-        parts = [expand_nmea(part, validate_checksum=validate_checksum) for part in split_multipart(nmea)]
+        line = msg.nmea
+        if isinstance(nmea, bytes):
+            nmea = nmea.strip()
+            if nmea[:1] != b'{':
+                line = nmea
+
+        sentences = split_multipart_sentences(line)
+        parts = [expand_sentence(tagblock_str, sentence, validate_checksum=validate_checksum,
+                                 tagblock_decoder=self.tagblock_decoder)
+                 for tagblock_str, sentence in sentences]
+
+        # keep the sentences with tagblocks removed so that normalize_dedup_key() does not need to find them again
+        vdm_sentences = [vdm_sentence(sentence) for _, sentence in sentences]
+        if vdm_sentences and None not in vdm_sentences:
+            msg.nmea_sentences = line[:0].join(vdm_sentences)
+
         if len(parts) == 0:
-            raise DecodeError('No valid AIVDM found in {}'.format(nmea))
+            raise DecodeError('No valid AIVDM found in {}'.format(msg.nmea))
         elif len(parts) == 1:
             # single part message
             tagblock, body, pad = parts[0]
@@ -142,6 +166,23 @@ class AIVDM:
 
         return msg
 
+    def decode_record(self, nmea, safe_decode_payload=False, validate_checksum=False):
+        """
+        Same as decode(), but returns a compact record from ais_tools.record instead of a Message.
+        Use this when holding large numbers of decoded messages in memory.  The message is decoded to a
+        Message first and then converted, so this is slightly slower than decode()
+
+        raises DecodeError if the message cannot be decoded.
+        """
+        return Record.from_message(self.decode(nmea, safe_decode_payload=safe_decode_payload,
+                                               validate_checksum=validate_checksum))
+
+    def safe_decode_record(self, nmea, best_effort=False):
+        """
+        Same as safe_decode(), but returns a compact record from ais_tools.record instead of a Message.
+        """
+        return Record.from_message(self.safe_decode(nmea, best_effort=best_effort))
+
     def decode_payload(self, body, pad):
         """
         decode just the payload part of an AIVDM message
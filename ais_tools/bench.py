@@ -0,0 +1,230 @@
+"""
+Benchmarks for the main parsing, decoding and normalizing functions
+
+Each benchmark calls a function once per message over a corpus of nmea, and reports the throughput in messages per
+second and percentiles of the per-message latency.  Latency is measured over chunks of messages, since timing each
+call individually would add more overhead than some of the calls being measured, so the percentiles are of the
+average latency within each chunk.
+
+Results can be saved as JSON and compared against a saved baseline, see compare_results()
+"""
+
+import itertools
+import platform
+import statistics
+import time
+
+import ais_tools
+from ais_tools.aivdm import AIVDM
+from ais_tools.core import checksum_str
+from ais_tools.fileio import open_compressed
+from ais_tools.nmea import expand_nmea
+from ais_tools.nmea import join_multipart_stream
+from ais_tools.nmea import split_multipart
+from ais_tools.nmea import split_multipart_sentences
+from ais_tools.nmea import MultipartJoiner
+from ais_tools.normalize import compile_transforms
+from ais_tools.normalize import filter_message
+from ais_tools.normalize_transform import DEFAULT_FIELD_TRANSFORMS
+from ais_tools.normalize_transform import LineNormalizer
+from ais_tools.synthetic import SyntheticAIS
+from ais_tools.tagblock import TagblockFactory
+from ais_tools.tagblock import add_tagblock
+from ais_tools.tagblock import decode_tagblock
+
+
+# one message of each of the common message types, used when no corpus is given
+DEFAULT_CORPUS = [
+    '!AIVDM,1,1,,A,13VPgj0viKV8dtr3Fc7:m`e000SA,0*16',
+    '!AIVDM,1,1,,B,232S8IhP01Q;WDrKSntnowwn0>@<,0*19',
+    '!AIVDM,1,1,,B,33VPgj0wALV8e4t3Fc3bd`dd0CeM,0*37',
+    '!AIVDM,1,1,,A,404kRsQu2`000:jlmGdANCA00L0@,0*59',
+    '\\g:1-2-1278,s:66,c:1661782369*43\\!AIVDM,2,1,3,A,56=nR7D00003A<I@E=@TmDh637OS60mA:222220N1@6427?P00888888,0*66'
+    '\\g:2-2-1278*51\\!AIVDM,2,2,3,A,888888888888880,2*27',
+    '!AIVDM,1,1,,B,83`hBjhj2d<dttdd>0N0N?mm0000,0*03',
+    '!AIVDM,1,1,,A,933?id1v028T<<lFjh2h07@L0D16,0*0E',
+    '!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73',
+    '!AIVDM,1,1,,A,C2Gajeh012;uPp5;C76=@001QQSkgKW11gW:00000001vPH21QR0,0*5D',
+    '!AIVDM,1,1,,B,E>jAal2S0a7h4aV0ah1TRah36DIOcV76<4uah:1AB@P02:Eh,0*19',
+    '!AIVDM,1,1,,B,H>cSnNP@4eEL544000000000000,0*3E',
+    '!AIVDM,1,1,,A,KmMsIt?uItk2F4mp,0*42',
+]
+
+
+def default_corpus():
+    """
+    Returns the lines in DEFAULT_CORPUS with a tagblock added to lines that do not have one
+    """
+    factory = TagblockFactory('bench', add_tagblock_t=False)
+    return [line if line.startswith('\\') else add_tagblock(factory.create(1700000000 + i), line)
+            for i, line in enumerate(DEFAULT_CORPUS)]
+
+
+def load_corpus(paths=None, synthetic=0):
+    """
+    Read the lines from one or more nmea files, which may be compressed.  Multipart messages may be either on
+    separate lines or already joined.  Returns (raw_lines, joined_lines) where raw_lines has one line per message
+    part and joined_lines has one line per message.
+
+    If synthetic is given, generates that many messages with SyntheticAIS instead.  If neither is given, uses
+    default_corpus()
+    """
+    if synthetic:
+        lines = list(SyntheticAIS(seed=0).lines(synthetic))
+    elif paths:
+        lines = []
+        for path in paths:
+            with open_compressed(path, 'rt') as f:
+                lines.extend(line.strip() for line in f if line.strip())
+    else:
+        lines = default_corpus()
+
+    joined = list(join_multipart_stream(lines, ignore_decode_errors=True))
+    raw = [part for line in joined for part in _safe_split_multipart(line)]
+    return raw, joined
+
+
+def _safe_split_multipart(line):
+    try:
+        return split_multipart(line)
+    except Exception:
+        return [line]
+
+
+def _safe_call(fn):
+    def call(arg):
+        try:
+            fn(arg)
+        except Exception:
+            pass
+    return call
+
+
+def build_cases(raw_lines, joined_lines):
+    """
+    Build the benchmark cases for a corpus.  Returns a dict of case name to (fn, inputs), where fn is called once
+    for each input
+    """
+    decoder = AIVDM()
+    messages = [decoder.safe_decode(line).add_uuid() for line in joined_lines]
+
+    sentences = [pair for line in joined_lines for pair in _safe_split_sentences(line)]
+    bodies = [sentence[sentence.find('!') + 1:sentence.rfind('*')] for _, sentence in sentences]
+    tagblocks = [tagblock for tagblock, _ in sentences if tagblock]
+
+    cases = {
+        'checksum': (checksum_str, bodies),
+        'tagblock_parse': (_safe_call(decode_tagblock), tagblocks),
+        'expand_nmea': (_safe_call(expand_nmea), [tagblock and '\\{}\\{}'.format(tagblock, sentence) or sentence
+                                                   for tagblock, sentence in sentences]),
+    }
+
+    by_type = {}
+    for line, message in zip(joined_lines, messages):
+        if 'error' not in message:
+            by_type.setdefault(message['id'], []).append(line)
+    for message_type, lines in sorted(by_type.items()):
+        cases[f'decode_type_{message_type}'] = (decoder.decode, lines)
+
+    encodable = [message for message in messages
+                 if 'error' not in message and decoder.encoder.transcoder.can_encode(message)]
+    cases['encode'] = (decoder.encode, encodable)
+
+    joiner = MultipartJoiner(ignore_decode_errors=True)
+    cases['join_multipart'] = (joiner.process, raw_lines)
+
+    cases['normalize'] = (compile_transforms(DEFAULT_FIELD_TRANSFORMS), [m for m in messages if filter_message(m)])
+
+    normalizer = LineNormalizer()
+    cases['decode_and_normalize'] = (lambda line: list(normalizer.normalize([line])), joined_lines)
+
+    return {name: case for name, case in cases.items() if case[1]}
+
+
+def _safe_split_sentences(line):
+    try:
+        return split_multipart_sentences(line)
+    except Exception:
+        return []
+
+
+def run_case(fn, inputs, count=10000, chunk_size=100):
+    """
+    Call fn for count inputs, cycling through the inputs as many times as needed
+
+    Returns a dict with the number of messages, the total time, messages per second and the 50th, 90th and 99th
+    percentile latency in microseconds per message
+    """
+    perf_counter = time.perf_counter_ns
+    inputs = itertools.cycle(inputs)
+
+    # warm up
+    for arg in itertools.islice(inputs, chunk_size):
+        fn(arg)
+
+    latencies = []
+    total = 0
+    done = 0
+    while done < count:
+        chunk = list(itertools.islice(inputs, min(chunk_size, count - done)))
+        start = perf_counter()
+        for arg in chunk:
+            fn(arg)
+        elapsed = perf_counter() - start
+        total += elapsed
+        done += len(chunk)
+        latencies.append(elapsed / len(chunk) / 1000)
+
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+    else:
+        p50 = p90 = p99 = latencies[0]
+
+    seconds = total / 1e9
+    return dict(count=done,
+                seconds=round(seconds, 6),
+                msgs_per_sec=round(done / seconds, 1) if seconds else None,
+                p50_us=round(p50, 3),
+                p90_us=round(p90, 3),
+                p99_us=round(p99, 3))
+
+
+def run_benchmarks(paths=None, count=10000, names=None, chunk_size=100, synthetic=0):
+    """
+    Run the benchmarks over the corpus in paths, a synthetic corpus of that many messages, or the default corpus,
+    see load_corpus().  names is an optional list of case names or name prefixes to run.  Returns a dict with
+    information about the environment and the results for each case
+    """
+    raw_lines, joined_lines = load_corpus(paths, synthetic)
+    cases = build_cases(raw_lines, joined_lines)
+    if names:
+        cases = {name: case for name, case in cases.items() if any(name.startswith(n) for n in names)}
+
+    results = {name: run_case(fn, inputs, count=count, chunk_size=chunk_size) for name, (fn, inputs) in cases.items()}
+    return dict(version=ais_tools.__version__,
+                python=platform.python_version(),
+                platform=platform.platform(),
+                corpus=f'synthetic:{synthetic}' if synthetic else list(paths) if paths else 'default',
+                results=results)
+
+
+def compare_results(results, baseline, threshold=0.1):
+    """
+    Compare benchmark results with a baseline from an earlier run.  A case has regressed if its throughput is lower
+    than the baseline by more than threshold, for example 0.1 for 10%.  Cases that are not in both are ignored
+
+    Returns a dict of case name to a dict with the baseline and current msgs_per_sec, the relative change and
+    whether the case regressed
+    """
+    comparison = {}
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+        if not base or not base.get('msgs_per_sec') or not result.get('msgs_per_sec'):
+            continue
+        change = result['msgs_per_sec'] / base['msgs_per_sec'] - 1
+        comparison[name] = dict(baseline=base['msgs_per_sec'],
+                                current=result['msgs_per_sec'],
+                                change=round(change, 4),
+                                regressed=change < -threshold)
+    return comparison
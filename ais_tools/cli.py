@@ -3,23 +3,37 @@ Command-line interface for ais-tools.
 """
 
 import click
+import io
 import json
+import os
+import signal
+import sys
 
 import ais_tools
 from ais_tools import message
 from ais_tools import cloud
+from ais_tools import jsoncodec
 from ais_tools.aivdm import AIVDM
+from ais_tools.fileio import CompressedFile
+from ais_tools.fileio import compression_for_path
 from ais_tools import tagblock
-from ais_tools.nmea import safe_join_multipart_stream
 from ais_tools.nmea import join_multipart_stream
+from ais_tools.nmea import join_multipart_stream_sharded
+from ais_tools.nmea import MultipartJoiner
 from ais_tools.message import Message
+from ais_tools.message import uuid_algorithms
+from ais_tools.normalize_transform import LineNormalizer
+from ais_tools.normalize_transform import MessageDeduplicator
 
 
 @click.group(invoke_without_command=True)
 # @click.group()
 @click.option('-v', '--version', is_flag=True, help='Display version number and exit')
+@click.option('--compression-level', type=int, envvar='AIS_TOOLS_COMPRESSION_LEVEL',
+              help='Compression level for output files that are compressed based on the file extension '
+                   '(.gz, .bz2 or .zst)')
 @click.pass_context
-def cli(ctx, version):
+def cli(ctx, version, compression_level):
     if version:
         click.echo('Version: {}'.format(ais_tools.__version__))
 
@@ -32,7 +46,7 @@ def cli(ctx, version):
     help="Stream NMEA messages to cloud ais-stream API"
 )
 @click.argument('url', )
-@click.argument('input', type=click.File('r'), default='-')
+@click.argument('input', type=CompressedFile('r'), default='-')
 @click.option('-s', '--source', default='ais_tools',
               help="identifier for the source of this AIS stream"
                    "eg. orbcomm | spire | ais_receiver_123")
@@ -64,14 +78,15 @@ def cloud_stream(input, url, source, overwrite):
          "\n\n"
          "\\c:1577762601537,s:my-station,T:2019-12-30 22.23.21*5D\\!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49"
 )
-@click.argument('input', type=click.File('r'), default='-')
-@click.argument('output', type=click.File('w'), default='-')
+@click.argument('input', type=CompressedFile('r'), default='-')
+@click.argument('output', type=CompressedFile('w'), default='-')
 @click.option('-s', '--station', default='ais_tools',
               help="identifier for this receiving station.  Useful for filtering when  ais feeds from "
                    "multiple receivers are merged")
 def add_tagblock(input, output, station):
+    factory = tagblock.TagblockFactory(station)
     for nmea in input:
-        t = tagblock.create_tagblock(station)
+        t = factory.create()
         output.write(tagblock.add_tagblock(t, nmea.strip()))
         output.write('\n')
 
@@ -95,8 +110,8 @@ def add_tagblock(input, output, station):
          "\n\n"
          "\\c:1577762601537,s:my-station*5D\\!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49"
 )
-@click.argument('input', type=click.File('r'), default='-')
-@click.argument('output', type=click.File('w'), default='-')
+@click.argument('input', type=CompressedFile('r'), default='-')
+@click.argument('output', type=CompressedFile('w'), default='-')
 @click.option('-s', '--station',
               help="identifier for the receiving station")
 @click.option('-t', '--text',
@@ -105,7 +120,7 @@ def update_tagblock(input, output, station, text):
     fields = {'tagblock_station': station, 'tagblock_text': text}
     fields = {k: v for k, v in fields.items() if v is not None}
     for nmea in input:
-        output.write(tagblock.safe_update_tagblock(nmea.strip(), **fields))
+        output.write(tagblock.safe_rewrite_tagblock(nmea.strip(), **fields))
         output.write('\n')
 
 
@@ -122,17 +137,79 @@ def update_tagblock(input, output, station, text):
          "contains the decoding error message"
          "\n\n"
 )
-@click.argument('input', type=click.File('r'), default='-')
-@click.argument('output', type=click.File('w'), default='-')
+@click.argument('input', type=CompressedFile('rb'), default='-')
+@click.argument('output', type=CompressedFile('wb'), default='-')
 @click.option('-q', '--quiet', is_flag=True, help="Do not emit decode errors to console")
-def decode(input, output, quiet):
-    decoder = AIVDM()
-    for msg in Message.stream(input):
-        msg = decoder.safe_decode(msg)
-        if not quiet and  'error' in msg:
-            click.echo(msg['error'], err=True)
-        output.write(json.dumps(msg))
-        output.write('\n')
+@click.option('--tagblock-cache', default=0,
+              help="Cache up to this many parsed tagblocks. This is faster for feeds where the same tagblock "
+                   "appears many times.  The cache hit rate is written to the console at the end")
+@click.option('--mmap', 'use_mmap', is_flag=True,
+              help="Memory map INPUT and decode it in chunks in parallel using --workers processes.  INPUT must be "
+                   "a file.  The output order is preserved")
+@click.option('-w', '--workers', default=os.cpu_count(), help="Number of worker processes to use with --mmap")
+def decode(input, output, quiet, tagblock_cache, use_mmap, workers):
+    if use_mmap:
+        return decode_mmap(input, output, quiet, tagblock_cache, workers)
+
+    tagblock_decoder = tagblock.TagblockCache(maxsize=tagblock_cache) if tagblock_cache > 0 else None
+    decoder = AIVDM(tagblock_decoder=tagblock_decoder)
+    with jsoncodec.JSONLinesWriter(output) as writer:
+        for lines in read_line_batches(input):
+            for line in lines:
+                msg = decoder.safe_decode(line)
+                if not quiet and 'error' in msg:
+                    click.echo(msg['error'], err=True)
+                writer.write(msg)
+            # write out everything from this read before waiting for more input, so streaming input is not delayed
+            writer.flush()
+    if tagblock_decoder is not None:
+        click.echo('tagblock cache: {}'.format(json.dumps(tagblock_decoder.stats())), err=True)
+
+
+def read_line_batches(stream, size=1 << 16):
+    """
+    Read a binary stream up to size bytes at a time, and yield a list of the complete lines from each read.
+    Each read returns whatever data is available, so when reading from a pipe the lines are yielded as soon as
+    they arrive
+    """
+    read = stream.read1 if hasattr(stream, 'read1') else stream.read
+    partial = b''
+    while chunk := read(size):
+        data = partial + chunk
+        end = data.rfind(b'\n') + 1
+        partial = data[end:]
+        if end:
+            yield data[:end].splitlines(keepends=True)
+    if partial:
+        yield [partial]
+
+
+def mmap_input_path(input):
+    # compressed files are opened as a stream on top of the decompressor, so also check the underlying file object
+    path = getattr(input, 'name', None)
+    if (not isinstance(path, str) or not os.path.isfile(path) or compression_for_path(path) is not None
+            or not isinstance(getattr(input, 'raw', None), io.FileIO)):
+        raise click.UsageError('--mmap requires INPUT to be an uncompressed file')
+    return path
+
+
+def decode_mmap(input, output, quiet, tagblock_cache, workers):
+    from ais_tools.mmapfile import decode_file
+
+    hits = misses = 0
+    for data, errors, tagblock_stats in decode_file(mmap_input_path(input), workers=workers,
+                                                    tagblock_cache=tagblock_cache):
+        output.write(data)
+        if not quiet:
+            for error in errors:
+                click.echo(error, err=True)
+        if tagblock_stats:
+            hits += tagblock_stats['hits']
+            misses += tagblock_stats['misses']
+    output.flush()
+    if tagblock_cache > 0:
+        stats = dict(hits=hits, misses=misses, hit_rate=hits / (hits + misses) if hits + misses else 0.0)
+        click.echo('tagblock cache: {}'.format(json.dumps(stats)), err=True)
 
 
 @cli.command(
@@ -146,8 +223,8 @@ def decode(input, output, quiet):
          "timestamp"
          "\n\n"
 )
-@click.argument('input', type=click.File('r'), default='-')
-@click.argument('output', type=click.File('w'), default='-')
+@click.argument('input', type=CompressedFile('rb'), default='-')
+@click.argument('output', type=CompressedFile('w'), default='-')
 def encode(input, output):
     encoder = AIVDM()
     for msg in Message.stream(input):
@@ -161,8 +238,8 @@ def encode(input, output):
 @cli.command(
     short_help="Match up multipart nmea messages",
     help="Match up multipart nmea messages\n" + join_multipart_stream.__doc__)
-@click.argument('input', type=click.File('r'), default='-')
-@click.argument('output', type=click.File('w'), default='-')
+@click.argument('input', type=CompressedFile('rb'), default='-')
+@click.argument('output', type=CompressedFile('wb'), default='-')
 @click.option('-t', '--max-time', default=500,
               help="Retain an unmatched message part in the buffer until at least max_time milliseconds have"
                    "elapsed since the message part was added to the buffer"
@@ -171,9 +248,289 @@ def encode(input, output):
               help="Retain an unmatched message part in the buffer until at least max_count messages have"
                    "been seen after the message part was added to the buffer"
               )
-def join_multipart(input, output, max_time, max_count):
-    for nmea in safe_join_multipart_stream(input,
-                                           max_time_window=max_time,
-                                           max_message_window=max_count):
-        output.write(nmea)
+@click.option('--state-file', type=click.Path(dir_okay=False),
+              help="Save any unmatched message parts to this file when the input stream ends or the process is "
+                   "terminated, instead of flushing them to the output.  If the file exists on startup, the saved "
+                   "message parts are loaded back into the buffer")
+@click.option('-w', '--workers', default=1,
+              help="Number of worker processes.  With more than one worker, lines are divided between the workers "
+                   "by tagblock station or group id and joined in parallel.  The output order is only preserved "
+                   "for lines from the same station or group. Cannot be used with --state-file")
+def join_multipart(input, output, max_time, max_count, state_file, workers):
+    if workers > 1:
+        if state_file:
+            raise click.UsageError('--state-file cannot be used with more than one worker')
+        for nmea in join_multipart_stream_sharded(input,
+                                                  shards=workers,
+                                                  max_time_window=max_time,
+                                                  max_message_window=max_count,
+                                                  ignore_decode_errors=True):
+            output.write(nmea)
+            output.write(b'\n')
+        return
+
+    joiner = MultipartJoiner(max_time_window=max_time,
+                             max_message_window=max_count,
+                             ignore_decode_errors=True)
+
+    def write_lines(lines):
+        for nmea in lines:
+            output.write(nmea)
+            output.write(b'\n')
+
+    if state_file and os.path.exists(state_file):
+        with open(state_file) as f:
+            joiner.restore(json.load(f))
+
+    if state_file:
+        # make sure that the buffer gets saved when the process is stopped
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        for line in input:
+            write_lines(joiner.process(line))
+    finally:
+        if state_file:
+            with open(state_file, 'w') as f:
+                json.dump(joiner.snapshot(), f, separators=(',', ':'))
+
+    if not state_file:
+        write_lines(joiner.flush())
+
+
+@cli.command(
+    short_help="Join, decode and normalize NMEA in a single step",
+    help="Join multipart messages, decode and normalize AIS messages from NMEA in a single step"
+         "\n\n"
+         "INPUT should be a text stream with one NMEA message per line, and defaults to stdin.  Use '-' to explicitly "
+         "use stdin"
+         "\n\n"
+         "OUTPUT is the normalized messages that pass the normalize filter, as newline JSON or Parquet.  Counts of "
+         "messages that were skipped, decoded, filtered and output are written to the console at the end"
+         "\n\n"
+         "Parquet output requires pyarrow, which can be installed with pip install ais-tools[parquet]"
+)
+@click.argument('input', type=CompressedFile('rb'), default='-')
+@click.argument('output', type=CompressedFile('wb'), default='-')
+@click.option('-s', '--source', default=None,
+              help="identifier for the source of this AIS stream, eg. orbcomm | spire | ais_receiver_123.  This is "
+                   "added to messages that do not already have a source")
+@click.option('-f', '--format', 'output_format', type=click.Choice(['ndjson', 'parquet']), default='ndjson',
+              help="Output format")
+@click.option('--compression', default='zstd',
+              help="Compression codec for parquet output, eg. zstd | snappy | gzip | none")
+@click.option('--uuid-algorithm', type=click.Choice(list(uuid_algorithms)), default='md5',
+              help="Hash used to create the message uuid")
+@click.option('--dedup-window', default=0,
+              help="Drop duplicate messages seen within this many minutes.  Cannot be used with more than one worker")
+@click.option('-t', '--max-time', default=500,
+              help="Maximum time in milliseconds to wait for the remaining parts of a multipart message")
+@click.option('-c', '--max-count', default=1000,
+              help="Maximum number of lines to wait for the remaining parts of a multipart message")
+@click.option('-w', '--workers', default=1,
+              help="Number of worker processes for decoding and normalizing.  The output order is preserved")
+@click.option('--mmap', 'use_mmap', is_flag=True,
+              help="Memory map INPUT and process it in chunks in parallel using --workers processes, instead of "
+                   "reading the lines in this process.  INPUT must be a file")
+@click.option('-q', '--quiet', is_flag=True, help="Do not write the message counts to the console")
+def normalize(input, output, source, output_format, compression, uuid_algorithm, dedup_window, max_time, max_count,
+              workers, use_mmap, quiet):
+    if (workers > 1 or use_mmap) and dedup_window:
+        raise click.UsageError('--dedup-window cannot be used with more than one worker or with --mmap')
+
+    deduplicator = MessageDeduplicator(window_minutes=dedup_window) if dedup_window else None
+    normalizer = LineNormalizer(source=source, uuid_algorithm=uuid_algorithm, deduplicator=deduplicator)
+    if use_mmap:
+        from ais_tools.mmapfile import normalize_file
+        messages = normalize_file(mmap_input_path(input), normalizer, workers=workers, max_time_window=max_time,
+                                  max_message_window=max_count)
+    else:
+        lines = join_multipart_stream(input, max_time_window=max_time, max_message_window=max_count,
+                                      ignore_decode_errors=True)
+        if workers > 1:
+            messages = normalizer.normalize_parallel(lines, workers=workers)
+        else:
+            messages = normalizer.normalize(lines)
+
+    if output_format == 'parquet':
+        from ais_tools.parquet import ParquetMessageWriter
+        writer = ParquetMessageWriter(output, compression=compression)
+    else:
+        writer = jsoncodec.JSONLinesWriter(output)
+    with writer:
+        for msg in messages:
+            writer.write(msg)
+
+    if not quiet:
+        stats = normalizer.stats()
+        if deduplicator is not None:
+            stats['duplicates'] = deduplicator.dropped
+        click.echo('normalize: {}'.format(json.dumps(stats)), err=True)
+
+
+@cli.command(
+    short_help="Run performance benchmarks",
+    help="Measure throughput and per-message latency of the main parsing, decoding, encoding and normalizing "
+         "functions"
+         "\n\n"
+         "CORPUS is zero or more NMEA files to use as input.  If none are given, a small built in sample with one "
+         "message of each common type is used, or use --synthetic to generate a larger corpus"
+         "\n\n"
+         "Use --output to save the results as JSON, and --baseline to compare against results saved by an earlier "
+         "run.  Exits with status 1 if any benchmark is slower than the baseline by more than --threshold"
+)
+@click.argument('corpus', type=click.Path(exists=True, dir_okay=False), nargs=-1)
+@click.option('-n', '--count', default=10000, help="Number of messages to process for each benchmark")
+@click.option('--synthetic', default=0, help="Use a synthetic corpus with this many messages instead of CORPUS")
+@click.option('-b', '--bench', 'names', multiple=True,
+              help="Only run benchmarks whose name starts with this.  May be given more than once")
+@click.option('-o', '--output', type=click.File('w'), default=None, help="Save the results to this JSON file")
+@click.option('--baseline', type=click.File('r'), default=None, help="Compare with results saved in this JSON file")
+@click.option('--threshold', default=0.1,
+              help="Fractional drop in messages per second compared to the baseline that counts as a regression")
+def bench(corpus, count, synthetic, names, output, baseline, threshold):
+    from ais_tools.bench import compare_results
+    from ais_tools.bench import run_benchmarks
+
+    results = run_benchmarks(corpus, count=count, names=names, synthetic=synthetic)
+    comparison = compare_results(results, json.load(baseline), threshold) if baseline else {}
+
+    click.echo('{:<24}{:>14}{:>10}{:>10}{:>10}{:>10}'.format('benchmark', 'msgs/sec', 'p50 us', 'p90 us', 'p99 us',
+                                                             'change' if baseline else ''))
+    for name, result in results['results'].items():
+        change = ''
+        if name in comparison:
+            change = '{:+.1%}{}'.format(comparison[name]['change'], ' !' if comparison[name]['regressed'] else '')
+        click.echo('{:<24}{:>14,.0f}{:>10.2f}{:>10.2f}{:>10.2f}{:>10}'.format(
+            name, result['msgs_per_sec'], result['p50_us'], result['p90_us'], result['p99_us'], change))
+
+    if output:
+        json.dump(results, output, indent=2)
+
+    regressions = [name for name, c in comparison.items() if c['regressed']]
+    if regressions:
+        click.echo('regressions: {}'.format(', '.join(regressions)), err=True)
+        sys.exit(1)
+
+
+def _type_mix(ctx, param, value):
+    from ais_tools.synthetic import parse_type_mix
+    try:
+        return parse_type_mix(value) if value else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+@cli.command(
+    short_help="Generate synthetic AIS messages for load testing",
+    help="Generate a stream of synthetic AIS messages as NMEA with tagblocks, from a simulated fleet of vessels "
+         "received by one or more stations"
+         "\n\n"
+         "OUTPUT defaults to stdout.  Without --rate, messages are written as fast as possible with simulated "
+         "timestamps.  With --rate, messages are written at that many messages per second using the current time"
+)
+@click.argument('output', type=CompressedFile('w'), default='-')
+@click.option('-n', '--count', default=10000, help="Number of messages to generate")
+@click.option('--vessels', default=100, help="Number of simulated vessels")
+@click.option('--stations', default=1, help="Number of receiving stations")
+@click.option('--type-mix', callback=_type_mix, default=None,
+              help="Relative frequency of each message type, eg. '1:50,5:10,18:30,24:10'.  Supported types are "
+                   "1, 2, 3, 5, 18, 19 and 24")
+@click.option('--duplicate-ratio', default=0.0, help="Fraction of messages that are also received by a second station")
+@click.option('--corruption-rate', default=0.0, help="Fraction of lines that are corrupted")
+@click.option('--out-of-order-rate', default=0.0,
+              help="Fraction of multipart messages that are delivered with the parts in reverse order")
+@click.option('--max-delay', default=3, help="Maximum number of lines between the parts of a multipart message")
+@click.option('--start-time', default=1700000000.0, help="Unix timestamp of the first message, without --rate")
+@click.option('--rate', default=None, type=float, help="Messages per second to write in real time")
+@click.option('--seed', default=None, type=int, help="Random seed, to make the output repeatable")
+@click.option('-q', '--quiet', is_flag=True, help="Do not write the message counts to the console")
+def synthetic(output, count, vessels, stations, type_mix, duplicate_ratio, corruption_rate, out_of_order_rate,
+              max_delay, start_time, rate, seed, quiet):
+    from ais_tools.synthetic import SyntheticAIS
+
+    generator = SyntheticAIS(vessels=vessels, stations=stations, type_mix=type_mix, duplicate_ratio=duplicate_ratio,
+                             corruption_rate=corruption_rate, out_of_order_rate=out_of_order_rate,
+                             max_delay=max_delay, start_time=start_time, rate=rate, seed=seed)
+    for line in generator.lines(count):
+        output.write(line)
         output.write('\n')
+        if rate:
+            output.flush()
+
+    if not quiet:
+        click.echo('synthetic: {}'.format(json.dumps(generator.stats())), err=True)
+
+
+@cli.command(
+    short_help="Count messages in a feed by type, station and minute",
+    help="Profile a feed of NMEA without decoding it, and write a summary as JSON"
+         "\n\n"
+         "INPUT should be a text stream with one NMEA message per line, and defaults to stdin.  Multipart messages "
+         "may be either on separate lines or already joined"
+         "\n\n"
+         "OUTPUT defaults to stdout.  The summary has counts of messages by type, station and talker, lines by "
+         "tagblock minute, checksum failures, malformed lines and complete and incomplete multipart messages. "
+         "Message types come from the first character of the payload, so messages are only decoded with --decode"
+)
+@click.argument('input', type=CompressedFile('rb'), default='-')
+@click.argument('output', type=CompressedFile('w'), default='-')
+@click.option('--decode', 'decode_messages', is_flag=True,
+              help="Also decode the messages and count the decode errors by category.  This is much slower")
+@click.option('--mmap', 'use_mmap', is_flag=True,
+              help="Memory map INPUT and process it in chunks in parallel using --workers processes.  INPUT must be "
+                   "a file")
+@click.option('-w', '--workers', default=os.cpu_count(), help="Number of worker processes to use with --mmap")
+def stats(input, output, decode_messages, use_mmap, workers):
+    from ais_tools.feedstats import feed_stats
+    from ais_tools.feedstats import feed_stats_file
+
+    if use_mmap:
+        result = feed_stats_file(mmap_input_path(input), decode=decode_messages, workers=workers)
+    else:
+        result = feed_stats(input, decode=decode_messages)
+    json.dump(result.summary(), output, indent=2)
+    output.write('\n')
+
+
+@cli.command(
+    short_help="Split NMEA into files by station, time or message type",
+    help="Split a stream of NMEA into files with paths made from a template, using values from the tagblock and "
+         "the message type without decoding the messages"
+         "\n\n"
+         "OUTPUT_DIR is the directory to write the files to.  INPUT should be a text stream with one NMEA message per "
+         "line, and defaults to stdin"
+         "\n\n"
+         "The template can use the fields {station}, {date}, "
+         "{year}, {month}, {day}, {hour} and {type}, and fields that are missing from a message are 'unknown'. "
+         "Files are compressed according to their extension.  Later parts of multipart messages are written to "
+         "the same file as the first part"
+)
+@click.argument('output_dir', type=click.Path(file_okay=False))
+@click.argument('input', type=CompressedFile('rb'), default='-')
+@click.option('-t', '--template', default='{station}/{date}/{hour}.nmea', show_default=True,
+              help="Template for the path of each file, relative to OUTPUT_DIR")
+@click.option('--max-open', default=256, show_default=True,
+              help="Maximum number of files to keep open at once.  The least recently written file is closed "
+                   "when another needs to be opened")
+@click.option('--buffer-size', default=1 << 16, show_default=True,
+              help="Number of bytes to buffer for each open file")
+@click.option('--append', is_flag=True, help="Append to existing files instead of replacing them")
+@click.option('-q', '--quiet', is_flag=True, help="Do not write the line and file counts to the console")
+@click.pass_context
+def partition(ctx, output_dir, input, template, max_open, buffer_size, append, quiet):
+    from ais_tools.partition import Partitioner
+    from ais_tools.partition import template_fields
+
+    try:
+        template_fields(template)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="'--template'")
+
+    compression_level = ctx.find_root().params.get('compression_level')
+    with Partitioner(output_dir, template=template, max_open=max_open, buffer_size=buffer_size,
+                     compression_level=compression_level, append=append) as partitioner:
+        partitioner.write_lines(input)
+
+    if not quiet:
+        click.echo('partition: {}'.format(json.dumps(partitioner.stats())), err=True)
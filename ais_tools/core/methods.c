@@ -3,25 +3,54 @@
 #include <string.h>
 #include "core.h"
 #include "checksum.h"
+#include "tagblock.h"
+
+
+/*
+ * Get a pointer to the characters in a python bytes or str object without copying.
+ * Any other object is first converted with str()
+ *
+ * If a new object has to be created, it is returned in tmp and the caller must release it
+ * with Py_XDECREF after it is done with the returned pointer
+ *
+ * Returns NULL if an exception has been raised
+ */
+static const char *
+as_cstring(PyObject *obj, PyObject **tmp)
+{
+    *tmp = NULL;
+
+    if (PyBytes_Check(obj))
+        return PyBytes_AS_STRING(obj);
+    if (PyUnicode_Check(obj))
+        return PyUnicode_AsUTF8(obj);
+
+    *tmp = PyObject_Str(obj);
+    if (*tmp == NULL)
+        return NULL;
+    return PyUnicode_AsUTF8(*tmp);
+}
 
 
 PyObject *
 method_compute_checksum(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
 {
-    PyObject *py_str;
+    PyObject *tmp;
     PyObject *result;
     const char *str;
 
     if (nargs != 1)
         return PyErr_Format(PyExc_TypeError, "compute_checksum expects 1 argument");
 
-    py_str = PyObject_Str(args[0]);
-
-    str = PyUnicode_AsUTF8(py_str);
+    str = as_cstring(args[0], &tmp);
+    if (str == NULL) {
+        Py_XDECREF(tmp);
+        return NULL;
+    }
 
     result = PyLong_FromLong(checksum(str));
 
-    Py_DECREF(py_str);
+    Py_XDECREF(tmp);
 
     return result;
 }
@@ -29,7 +58,7 @@ method_compute_checksum(PyObject *module, PyObject *const *args, Py_ssize_t narg
 PyObject *
 method_compute_checksum_str(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
 {
-    PyObject *py_str;
+    PyObject *tmp;
     PyObject *result;
     const char *str;
     char c_str[3];
@@ -37,15 +66,17 @@ method_compute_checksum_str(PyObject *module, PyObject *const *args, Py_ssize_t
     if (nargs != 1)
         return PyErr_Format(PyExc_TypeError, "checksum_str expects 1 argument");
 
-    py_str = PyObject_Str(args[0]);
-
-    str = PyUnicode_AsUTF8(py_str);
+    str = as_cstring(args[0], &tmp);
+    if (str == NULL) {
+        Py_XDECREF(tmp);
+        return NULL;
+    }
 
     checksum_str(c_str, str, ARRAY_LENGTH(c_str));
 
     result = PyUnicode_FromString(c_str);
 
-    Py_DECREF(py_str);
+    Py_XDECREF(tmp);
 
     return result;
 }
@@ -53,7 +84,7 @@ method_compute_checksum_str(PyObject *module, PyObject *const *args, Py_ssize_t
 PyObject *
 method_is_checksum_valid(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
 {
-    PyObject *py_str;
+    PyObject *tmp;
     const char *str;
     char buffer[MAX_SENTENCE_LENGTH];
     size_t len;
@@ -61,13 +92,15 @@ method_is_checksum_valid(PyObject *module, PyObject *const *args, Py_ssize_t nar
     if (nargs != 1)
         return PyErr_Format(PyExc_TypeError, "checksum_str expects 1 argument");
 
-    py_str = PyObject_Str(args[0]);
-
-    str = PyUnicode_AsUTF8(py_str);
+    str = as_cstring(args[0], &tmp);
+    if (str == NULL) {
+        Py_XDECREF(tmp);
+        return NULL;
+    }
 
     len = safe_strcpy(buffer, str, ARRAY_LENGTH(buffer));
 
-    Py_DECREF(py_str);
+    Py_XDECREF(tmp);
 
     if (len >= ARRAY_LENGTH(buffer))
         return PyErr_Format(PyExc_ValueError, "String too long");
@@ -76,3 +109,126 @@ method_is_checksum_valid(PyObject *module, PyObject *const *args, Py_ssize_t nar
     else
         Py_RETURN_FALSE;
 }
+
+/*
+ * Convert the value of a tagblock field to a python object.  Values for the keys c, n and r are
+ * converted to int the same as decode_tagblock(), and a value for c in milliseconds is converted
+ * to seconds.  All other values are returned as str
+ */
+static PyObject *
+tagblock_field_value(const char *key, Py_ssize_t key_len, const char *value, size_t value_len, bool is_bytes)
+{
+    PyObject *value_str;
+    PyObject *number;
+    PyObject *divisor;
+    PyObject *result;
+    long long t;
+    int overflow;
+
+    if (is_bytes)
+        value_str = PyUnicode_DecodeASCII(value, value_len, "strict");
+    else
+        value_str = PyUnicode_FromStringAndSize(value, value_len);
+
+    if (value_str == NULL)
+        return PyErr_Format(PyExc_ValueError, "Unable to decode tagblock field %s", key);
+
+    if (key_len != 1 || strchr("cnr", key[0]) == NULL)
+        return value_str;
+
+    number = PyLong_FromUnicodeObject(value_str, 10);
+    Py_DECREF(value_str);
+    if (number == NULL)
+        return PyErr_Format(PyExc_ValueError, "Unable to decode tagblock field %s", key);
+
+    if (key[0] != 'c')
+        return number;
+
+    t = PyLong_AsLongLongAndOverflow(number, &overflow);
+    if (overflow < 0 || (overflow == 0 && t <= 40000000000LL))
+        return number;
+
+    divisor = PyFloat_FromDouble(1000.0);
+    if (divisor == NULL) {
+        Py_DECREF(number);
+        return NULL;
+    }
+    result = PyNumber_TrueDivide(number, divisor);
+    Py_DECREF(divisor);
+    Py_DECREF(number);
+    return result;
+}
+
+PyObject *
+method_extract_tagblock_fields(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    PyObject *keys;
+    PyObject *result;
+    PyObject *value;
+    const char *str;
+    const char *key;
+    const char *field_value;
+    Py_ssize_t len;
+    Py_ssize_t key_len;
+    Py_ssize_t num_keys;
+    size_t start = 0;
+    size_t end = 0;
+    size_t value_len;
+    bool is_bytes;
+    bool has_tagblock;
+
+    if (nargs != 2)
+        return PyErr_Format(PyExc_TypeError, "extract_tagblock_fields expects 2 arguments");
+
+    is_bytes = PyBytes_Check(args[0]);
+    if (is_bytes) {
+        str = PyBytes_AS_STRING(args[0]);
+        len = PyBytes_GET_SIZE(args[0]);
+    }
+    else if (PyUnicode_Check(args[0])) {
+        str = PyUnicode_AsUTF8AndSize(args[0], &len);
+        if (str == NULL)
+            return NULL;
+    }
+    else
+        return PyErr_Format(PyExc_TypeError, "extract_tagblock_fields expects str or bytes");
+
+    keys = PySequence_Fast(args[1], "keys must be a sequence");
+    if (keys == NULL)
+        return NULL;
+
+    num_keys = PySequence_Fast_GET_SIZE(keys);
+    result = PyTuple_New(num_keys);
+    if (result == NULL) {
+        Py_DECREF(keys);
+        return NULL;
+    }
+
+    has_tagblock = tagblock_bounds(str, len, &start, &end);
+
+    for (Py_ssize_t i = 0; i < num_keys; i++) {
+        key = PyUnicode_AsUTF8AndSize(PySequence_Fast_GET_ITEM(keys, i), &key_len);
+        if (key == NULL)
+            goto error;
+
+        field_value = has_tagblock ? tagblock_field(str, start, end, key, key_len, &value_len) : NULL;
+        if (field_value == NULL) {
+            Py_INCREF(Py_None);
+            value = Py_None;
+        }
+        else {
+            value = tagblock_field_value(key, key_len, field_value, value_len, is_bytes);
+            if (value == NULL)
+                goto error;
+        }
+        PyTuple_SET_ITEM(result, i, value);
+    }
+
+    Py_DECREF(keys);
+    return result;
+
+error:
+    Py_DECREF(keys);
+    Py_DECREF(result);
+    return NULL;
+}
@@ -3,3 +3,4 @@
 PyObject * method_compute_checksum    (PyObject *module, PyObject *const *args, Py_ssize_t nargs);
 PyObject * method_compute_checksum_str(PyObject *module, PyObject *const *args, Py_ssize_t nargs);
 PyObject * method_is_checksum_valid   (PyObject *module, PyObject *const *args, Py_ssize_t nargs);
+PyObject * method_extract_tagblock_fields(PyObject *module, PyObject *const *args, Py_ssize_t nargs);
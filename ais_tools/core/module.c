@@ -8,19 +8,26 @@ static PyMethodDef core_methods[] = {
         "checksum",
         (PyCFunction)(void(*)(void))method_compute_checksum,
         METH_FASTCALL,
-        PyDoc_STR("Compute checksum of a string. Returns an integer value.  The checksum for an empty string is 0")
+        PyDoc_STR("Compute checksum of a str or bytes. Returns an integer value.  The checksum for an empty string is 0")
     },
     {
         "checksum_str",
         (PyCFunction)(void(*)(void))method_compute_checksum_str,
         METH_FASTCALL,
-        PyDoc_STR("Compute checksum of a string. Returns a 2-character hex string")
+        PyDoc_STR("Compute checksum of a str or bytes. Returns a 2-character hex string")
     },
     {
         "is_checksum_valid",
         (PyCFunction)(void(*)(void))method_is_checksum_valid,
         METH_FASTCALL,
-        PyDoc_STR("Returns True if the given string is terminated with a valid checksum, else False")
+        PyDoc_STR("Returns True if the given str or bytes is terminated with a valid checksum, else False")
+    },
+    {
+        "extract_tagblock_fields",
+        (PyCFunction)(void(*)(void))method_extract_tagblock_fields,
+        METH_FASTCALL,
+        PyDoc_STR("Extract the values of selected keys from the tagblock at the start of a str or bytes. "
+                  "Returns a tuple with a value or None for each key")
     },
     {NULL, NULL, 0, NULL}   /* sentinel */
 };
@@ -28,7 +35,7 @@ static PyMethodDef core_methods[] = {
 static struct PyModuleDef core_module = {
     PyModuleDef_HEAD_INIT,
     "core",
-    PyDoc_STR("AIS Tools core methods implemented in C.  Supports computing checksums"),
+    PyDoc_STR("AIS Tools core methods implemented in C.  Supports computing checksums and extracting tagblock fields"),
     -1,
     core_methods
 };
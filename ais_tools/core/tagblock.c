@@ -0,0 +1,62 @@
+// tagblock module
+
+#include <stdbool.h>
+#include <string.h>
+#include <sys/types.h>
+#include "tagblock.h"
+
+/*
+ * Find the fields in the tagblock at the start of a line of nmea
+ *
+ * The tagblock starts after the leading '\' and ends at the closing '\' or at the '*' that starts
+ * the checksum, whichever comes first.  If there is no closing '\' then the tagblock runs to the
+ * end of the string.  A line that starts with "\!" has no tagblock
+ *
+ * On return, *start and *end are the offsets of the fields in the tagblock, not including the
+ * delimiters or the checksum.
+ *
+ * Returns false if there is no tagblock
+ */
+bool tagblock_bounds(const char *s, size_t len, size_t *start, size_t *end)
+{
+    size_t i;
+
+    if (len < 1 || s[0] != '\\' || (len > 1 && s[1] == '!'))
+        return false;
+
+    *start = 1;
+    for (i = 1; i < len && s[i] != '\\' && s[i] != '*'; i++)
+        ;
+    *end = i;
+    return true;
+}
+
+/*
+ * Find the value of a single field in a tagblock.  The tagblock is s[start:end] as returned
+ * by tagblock_bounds()
+ *
+ * The field is matched only at the start of the tagblock or immediately after a ','
+ *
+ * Returns a pointer to the start of the value and sets *value_len to the length of the value, or
+ * returns NULL if the key is not found
+ */
+const char * tagblock_field(const char *s, size_t start, size_t end,
+                            const char *key, size_t key_len, size_t *value_len)
+{
+    size_t i = start;
+    size_t field_end;
+
+    while (i < end) {
+        for (field_end = i; field_end < end && s[field_end] != ','; field_end++)
+            ;
+
+        if (field_end - i > key_len && s[i + key_len] == ':' && memcmp(s + i, key, key_len) == 0) {
+            *value_len = field_end - i - key_len - 1;
+            return s + i + key_len + 1;
+        }
+
+        i = field_end + 1;
+    }
+
+    return NULL;
+}
@@ -0,0 +1,5 @@
+/* AIS Tools tagblock functions */
+
+bool tagblock_bounds(const char *s, size_t len, size_t *start, size_t *end);
+const char * tagblock_field(const char *s, size_t start, size_t end,
+                            const char *key, size_t key_len, size_t *value_len);
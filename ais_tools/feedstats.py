@@ -0,0 +1,249 @@
+"""
+Profile a feed of nmea without decoding the AIS messages
+
+FeedStats counts messages by type, station and talker, lines by tagblock minute, along with checksum failures,
+malformed lines and the completeness of multipart messages.  The message type comes from the first armored
+character of the payload, the station and timestamp are extracted from the tagblock with
+ais_tools.core.extract_tagblock_fields() and checksums are validated with ais_tools.core.is_checksum_valid(), so
+no messages are decoded unless decode=True, in which case decode errors are also counted by category.
+
+Values are collected into lists for each batch of lines and counted with Counter.update(), which does the counting
+in C.  Stats from different parts of a file can be combined with merge(), and multipart message parts that are
+split between them are matched up when they are merged.
+"""
+
+import re
+from collections import Counter
+from datetime import datetime
+from datetime import timezone
+
+from ais_tools.aivdm import AIVDM
+from ais_tools.core import extract_tagblock_fields
+from ais_tools.core import is_checksum_valid
+from ais_tools.transcode import ARMORED_MESSAGE_TYPES
+
+
+def error_category(error):
+    """Group similar decode errors together by replacing numbers in the error message"""
+    return re.sub(r'\d+', 'N', error)
+
+
+class FeedStats:
+    """
+    Collect statistics about lines of nmea.  Call add_lines() with batches of lines as bytes, then call
+    finish() and summary() to get the results
+
+    If decode is True, complete messages are also decoded to count the decode errors.  Multipart messages are
+    matched up by tagblock group, or by station, sequence id and channel if there is no tagblock group
+    """
+
+    def __init__(self, decode=False):
+        self.decode = decode
+        self.decoder = AIVDM() if decode else None
+        self.lines = 0
+        self.no_tagblock = 0
+        self.tagblock_errors = 0
+        self.tagblock_checksum_errors = 0
+        self.malformed = 0
+        self.checksum_errors = 0
+        self.types = Counter()
+        self.talkers = Counter()
+        self.stations = Counter()
+        self.minutes = Counter()
+        self.multipart_parts = 0
+        self.multipart_joined = 0
+        self.multipart_complete = 0
+        self.multipart_incomplete = 0
+        self.decoded = 0
+        self.decode_errors = Counter()
+        # parts of multipart messages that have not been matched yet.  key -> (total parts, {part num: line})
+        self.pending = {}
+
+    def add_lines(self, lines):
+        """Add a batch of lines, as bytes"""
+        types = []
+        talkers = []
+        stations = []
+        minutes = []
+        complete = []
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            self.lines += 1
+
+            station = group = None
+            if line[:1] == b'\\' and line[1:2] != b'!':
+                tagblock_end = line.find(b'\\', 1)
+                if tagblock_end < 0:
+                    self.malformed += 1
+                    continue
+                try:
+                    timestamp, station, group = extract_tagblock_fields(line, ('c', 's', 'g'))
+                except ValueError:
+                    self.tagblock_errors += 1
+                    timestamp = None
+                if not is_checksum_valid(line[1:tagblock_end]):
+                    self.tagblock_checksum_errors += 1
+                if timestamp is not None:
+                    minutes.append(int(timestamp // 60))
+                sentence = line[tagblock_end + 1:]
+            else:
+                self.no_tagblock += 1
+                sentence = line.lstrip(b'\\')
+
+            # a line with more than one sentence is a multipart message that is already joined
+            end = sentence.find(b'\\')
+            if end < 0:
+                end = sentence.find(b'!', 1)
+            joined = end > 0
+            if joined:
+                sentence = sentence[:end]
+
+            fields = sentence.split(b',', 6)
+            if len(fields) < 7 or not fields[0].startswith(b'!'):
+                self.malformed += 1
+                continue
+            talkers.append(fields[0][1:])
+            if not is_checksum_valid(sentence):
+                self.checksum_errors += 1
+
+            total, part = fields[1], fields[2]
+            if part == b'1':
+                stations.append(station)
+                payload = fields[5]
+                types.append(ARMORED_MESSAGE_TYPES[payload[0]] if payload else None)
+
+            if total == b'1' or joined:
+                if joined:
+                    self.multipart_joined += 1
+                if self.decode:
+                    complete.append(line)
+            else:
+                self.multipart_parts += 1
+                try:
+                    total, part = int(total), int(part)
+                except ValueError:
+                    self.malformed += 1
+                    continue
+                key = group.split('-')[-1] if group else (station, fields[3], fields[4])
+                self._add_part(key, total, part, line, complete)
+
+        self.types.update(types)
+        self.talkers.update(talkers)
+        self.stations.update(stations)
+        self.minutes.update(minutes)
+        if self.decode:
+            self._decode(complete)
+
+    def _add_part(self, key, total, part, line, complete):
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = (total, {})
+        parts = entry[1]
+        parts[part] = line if self.decode else None
+        if len(parts) >= total:
+            self.multipart_complete += 1
+            del self.pending[key]
+            if self.decode:
+                complete.append(b''.join(parts[i] for i in sorted(parts)))
+
+    def _decode(self, lines):
+        errors = []
+        for line in lines:
+            message = self.decoder.safe_decode(line)
+            if 'error' in message:
+                errors.append(error_category(message['error']))
+            else:
+                self.decoded += 1
+        self.decode_errors.update(errors)
+
+    def merge(self, other):
+        """
+        Add the stats from another FeedStats, for the lines that follow the lines in this one.  Any multipart
+        message parts that are pending in both are matched up
+        """
+        for key in ['lines', 'no_tagblock', 'tagblock_errors', 'tagblock_checksum_errors', 'malformed',
+                    'checksum_errors', 'multipart_parts', 'multipart_joined', 'multipart_complete',
+                    'multipart_incomplete', 'decoded']:
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+        for key in ['types', 'talkers', 'stations', 'minutes', 'decode_errors']:
+            getattr(self, key).update(getattr(other, key))
+
+        complete = []
+        for key, (total, parts) in other.pending.items():
+            for part, line in parts.items():
+                self._add_part(key, total, part, line, complete)
+        if self.decode:
+            self._decode(complete)
+        return self
+
+    def finish(self):
+        """Count any multipart messages that are still missing parts as incomplete, and decode their parts"""
+        self.multipart_incomplete += len(self.pending)
+        if self.decode:
+            self._decode([line for _, parts in self.pending.values() for line in parts.values()])
+        self.pending = {}
+        return self
+
+    def summary(self):
+        sentences = sum(self.talkers.values())
+
+        def keyed(counter):
+            return {('unknown' if k is None else k.decode() if isinstance(k, bytes) else str(k)): v
+                    for k, v in sorted(counter.items(), key=lambda item: (item[0] is None, str(item[0])))}
+
+        summary = dict(
+            lines=self.lines,
+            no_tagblock=self.no_tagblock,
+            tagblock_errors=self.tagblock_errors,
+            tagblock_checksum_errors=self.tagblock_checksum_errors,
+            malformed=self.malformed,
+            checksum_errors=self.checksum_errors,
+            checksum_failure_rate=round(self.checksum_errors / sentences, 6) if sentences else 0.0,
+            types={str(k): v for k, v in sorted(self.types.items(), key=lambda item: (item[0] is None, item[0]))},
+            talkers=keyed(self.talkers),
+            stations=keyed(self.stations),
+            minutes={datetime.fromtimestamp(minute * 60, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M'): count
+                     for minute, count in sorted(self.minutes.items())},
+            multipart=dict(parts=self.multipart_parts, joined=self.multipart_joined,
+                           complete=self.multipart_complete, incomplete=self.multipart_incomplete),
+        )
+        if self.decode:
+            summary['decoded'] = self.decoded
+            summary['decode_errors'] = dict(self.decode_errors.most_common())
+        return summary
+
+
+def _stats_range(decode, path, start, end):
+    from ais_tools.mmapfile import read_range_lines
+    stats = FeedStats(decode=decode)
+    stats.add_lines(read_range_lines(path, start, end))
+    stats.decoder = None
+    return stats
+
+
+def feed_stats(lines, decode=False, batch_size=10000):
+    """Collect FeedStats for an iterable of lines as bytes.  Returns the finished FeedStats"""
+    stats = FeedStats(decode=decode)
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            stats.add_lines(batch)
+            batch = []
+    stats.add_lines(batch)
+    return stats.finish()
+
+
+def feed_stats_file(path, decode=False, workers=4, chunk_size=None):
+    """
+    Same as feed_stats() for an uncompressed file, using ais_tools.mmapfile to process ranges of the file in
+    parallel
+    """
+    from ais_tools.mmapfile import map_file_ranges
+    stats = FeedStats(decode=decode)
+    for range_stats in map_file_ranges(_stats_range, path, (decode,), workers=workers, chunk_size=chunk_size):
+        stats.merge(range_stats)
+    return stats.finish()
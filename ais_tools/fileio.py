@@ -0,0 +1,291 @@
+"""
+Read and write compressed files, with compression and decompression running on a background thread
+
+The compression is chosen from the file extension, see COMPRESSION_EXTENSIONS.  gzip and bz2 use the standard
+library, and zstd requires zstandard, which can be installed with
+
+    pip install ais-tools[zstd]
+
+Compressed data is read or written in large blocks by a background thread, which hands the blocks to the calling
+thread through a bounded queue.  The compression libraries release the GIL while they work, so decompressing the
+next block overlaps with processing the previous one, and the bounded queue keeps the two in step.
+
+CompressedFile is a click parameter type that can be used in place of click.File
+"""
+
+import bz2
+import gzip
+import io
+import os
+import queue
+import threading
+
+import click
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+}
+
+DEFAULT_COMPRESSION_LEVELS = {
+    'gzip': 6,
+    'bz2': 9,
+    'zstd': 3,
+}
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+
+def compression_for_path(path):
+    """Returns the compression to use for a file based on its extension, or None if it is not compressed"""
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(str(path))[1].lower())
+
+
+class ZstdReader(io.RawIOBase):
+    """
+    Read a zstd compressed binary stream that may contain more than one frame.  Unlike the zstandard stream
+    reader, this raises EOFError if the stream ends part way through a frame
+    """
+
+    def __init__(self, fileobj, block_size=DEFAULT_BUFFER_SIZE):
+        super().__init__()
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.decompressor = None
+        self.pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            data = self.fileobj.read(self.block_size)
+            if not data:
+                if self.decompressor is not None and not self.decompressor.eof:
+                    raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+                return 0
+            output = []
+            while data:
+                if self.decompressor is None or self.decompressor.eof:
+                    self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+                output.append(self.decompressor.decompress(data))
+                data = self.decompressor.unused_data if self.decompressor.eof else b''
+            self.pending = memoryview(b''.join(output))
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.close()
+        super().close()
+
+
+def _open_zstd(path, mode, level):
+    if zstandard is None:
+        raise ImportError('zstd compression requires zstandard.  Install it with pip install ais-tools[zstd]')
+    f = open(path, mode)
+    try:
+        if 'r' in mode:
+            return ZstdReader(f)
+        else:
+            return zstandard.ZstdCompressor(level=level).stream_writer(f, closefd=True)
+    except BaseException:
+        f.close()
+        raise
+
+
+def open_compressed_raw(path, mode='rb', compression=None, level=None):
+    """
+    Open a compressed file as an unbuffered binary stream, without a background thread.  mode is 'rb', 'wb'
+    or 'ab'.  If compression is None, it is found from the file extension and files with no recognized
+    extension are opened without compression.  level defaults to DEFAULT_COMPRESSION_LEVELS
+    """
+    compression = compression or compression_for_path(path)
+    if level is None:
+        level = DEFAULT_COMPRESSION_LEVELS.get(compression)
+
+    if compression is None:
+        return open(path, mode)
+    elif compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=level)
+    elif compression == 'bz2':
+        return bz2.open(path, mode, compresslevel=level)
+    elif compression == 'zstd':
+        return _open_zstd(path, mode, level)
+    else:
+        raise ValueError('Unknown compression {}.  Must be one of {}'.format(
+            compression, ', '.join(DEFAULT_COMPRESSION_LEVELS)))
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    Read a binary stream on a background thread in blocks of block_size bytes.  Up to queue_size blocks are read
+    ahead of the reader
+
+    Any error from the background thread, for example EOFError from a truncated compressed file, is raised by
+    read() as an OSError that includes name, or the name of the stream if it has one
+    """
+
+    def __init__(self, fileobj, block_size=DEFAULT_BUFFER_SIZE, queue_size=4, name=None):
+        super().__init__()
+        self.fileobj = fileobj
+        self.name = name or getattr(fileobj, 'name', None) or repr(fileobj)
+        self.block_size = block_size
+        self.queue = queue.Queue(queue_size)
+        self.pending = memoryview(b'')
+        self.eof = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._read_blocks, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read_blocks(self):
+        try:
+            while True:
+                block = self.fileobj.read(self.block_size)
+                if not self._put(block) or not block:
+                    break
+        except Exception as e:
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            if self.eof:
+                return 0
+            block = self.queue.get()
+            if isinstance(block, Exception):
+                self.eof = True
+                raise OSError('Error reading {}: {}'.format(self.name, block)) from block
+            if not block:
+                self.eof = True
+                return 0
+            self.pending = memoryview(block)
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            self.thread.join()
+            self.fileobj.close()
+        super().close()
+
+
+class ThreadedWriter(io.RawIOBase):
+    """
+    Write to a binary stream on a background thread.  Up to queue_size writes are buffered before write()
+    blocks.  Any error from the background thread is raised by the next call to write() or by close()
+    """
+
+    def __init__(self, fileobj, queue_size=4):
+        super().__init__()
+        self.fileobj = fileobj
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._write_blocks, daemon=True)
+        self.thread.start()
+
+    def _write_blocks(self):
+        while True:
+            block = self.queue.get()
+            if block is None:
+                break
+            if self.error is None:
+                try:
+                    self.fileobj.write(block)
+                except Exception as e:
+                    self.error = e
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.error is not None:
+            raise self.error
+        block = bytes(b)
+        self.queue.put(block)
+        return len(block)
+
+    def close(self):
+        if self.closed:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            self.fileobj.close()
+        finally:
+            super().close()
+        if self.error is not None:
+            raise self.error
+
+
+def open_compressed(path, mode='rb', compression=None, level=None, buffer_size=DEFAULT_BUFFER_SIZE,
+                    encoding='utf-8'):
+    """
+    Open a file that may be compressed, with the compression or decompression running on a background thread.
+    mode is one of 'rb', 'r', 'rt', 'wb', 'w', 'wt', 'ab', 'a' or 'at'.  See open_compressed_raw() for
+    compression and level.
+
+    Files with no recognized compression are opened with the built in open()
+    """
+    compression = compression or compression_for_path(path)
+    binary_mode = mode.replace('t', '').replace('b', '') + 'b'
+    if compression is None:
+        return open(path, mode if 'b' in mode else mode.replace('t', ''),
+                    encoding=None if 'b' in mode else encoding)
+
+    fileobj = open_compressed_raw(path, binary_mode, compression, level)
+    if 'r' in mode:
+        stream = io.BufferedReader(ThreadedReader(fileobj, block_size=buffer_size, name=str(path)), buffer_size)
+    else:
+        stream = io.BufferedWriter(ThreadedWriter(fileobj), buffer_size)
+
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+class CompressedFile(click.File):
+    """
+    A click parameter type that works like click.File, but opens files with a compressed extension using
+    open_compressed().  The compression level for output files is taken from the --compression-level option of
+    the top level command, if there is one.  '-' is stdin or stdout, without compression
+    """
+
+    name = 'filename'
+
+    def convert(self, value, param, ctx):
+        if hasattr(value, 'read') or hasattr(value, 'write') or value == '-' or not compression_for_path(value):
+            return super().convert(value, param, ctx)
+
+        level = ctx.find_root().params.get('compression_level') if ctx is not None else None
+        try:
+            f = open_compressed(value, self.mode, level=level)
+        except (OSError, ImportError, ValueError) as e:
+            self.fail(f'{click.format_filename(value)!r}: {getattr(e, "strerror", None) or e}', param, ctx)
+        if ctx is not None:
+            ctx.call_on_close(f.close)
+        return f
@@ -0,0 +1,183 @@
+"""
+JSON encoding and decoding for messages
+
+Uses orjson or msgspec when one of them is installed, and falls back to the standard library json module
+otherwise.  Install the fast backends with
+
+    pip install ais-tools[json]
+
+All backends write compact JSON as utf-8 bytes, with non-ascii characters written as utf-8 rather than escaped
+and NaN and infinity written as null, and all of them accept str or bytes to decode.  Use set_backend() to choose
+a backend explicitly, for example to compare output between backends.
+
+If a fast backend is unable to encode an object, for example because it contains an integer larger
+than 64 bits, the object is encoded with the standard library instead.
+"""
+
+import json
+import math
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+
+def _finite(obj):
+    # replace NaN and infinity with None, which is what orjson and msgspec write for them
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    return obj
+
+
+def _json_dumps(obj):
+    try:
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+    except ValueError:
+        return json.dumps(_finite(obj), separators=(',', ':'), ensure_ascii=False)
+
+
+def _json_dumpb(obj):
+    return _json_dumps(obj).encode('utf-8')
+
+
+class StdlibCodec:
+    name = 'json'
+    DecodeError = json.JSONDecodeError
+
+    loads = staticmethod(json.loads)
+    dumpb = staticmethod(_json_dumpb)
+
+    @staticmethod
+    def dumps_lines(objs):
+        return ''.join([_json_dumps(obj) + '\n' for obj in objs]).encode('utf-8')
+
+
+class OrjsonCodec:
+    name = 'orjson'
+    DecodeError = orjson.JSONDecodeError if orjson else None
+
+    loads = staticmethod(orjson.loads if orjson else None)
+
+    @staticmethod
+    def dumpb(obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return _json_dumpb(obj)
+
+    @staticmethod
+    def dumps_lines(objs):
+        dumps = orjson.dumps
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+        try:
+            return b''.join([dumps(obj, option=option) for obj in objs])
+        except TypeError:
+            return b''.join([OrjsonCodec.dumpb(obj) + b'\n' for obj in objs])
+
+
+class MsgspecCodec:
+    name = 'msgspec'
+    DecodeError = msgspec.DecodeError if msgspec else None
+
+    loads = staticmethod(msgspec.json.decode if msgspec else None)
+    _encoder = msgspec.json.Encoder() if msgspec else None
+
+    @staticmethod
+    def dumpb(obj):
+        try:
+            return MsgspecCodec._encoder.encode(obj)
+        except (TypeError, OverflowError):
+            return _json_dumpb(obj)
+
+    @staticmethod
+    def dumps_lines(objs):
+        if not isinstance(objs, list):
+            objs = list(objs)
+        try:
+            return MsgspecCodec._encoder.encode_lines(objs)
+        except (TypeError, OverflowError):
+            return b''.join([MsgspecCodec.dumpb(obj) + b'\n' for obj in objs])
+
+
+backends = {
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec,
+    'json': StdlibCodec,
+}
+
+
+def available_backends():
+    """Returns the names of the backends that can be used, fastest first"""
+    return [name for name, codec in backends.items() if codec.loads is not None]
+
+
+def set_backend(name=None):
+    """
+    Select the backend used by the module level functions in this module.  Pass None to select the
+    fastest available backend.
+
+    raises ValueError if the backend is unknown or is not installed
+    """
+    global backend, DecodeError, loads, dumpb, dumps_lines
+
+    name = name or available_backends()[0]
+    if name not in available_backends():
+        raise ValueError('JSON backend {} is not available.  Must be one of {}'.format(
+            name, ', '.join(available_backends())))
+
+    codec = backends[name]
+    backend = codec.name
+    DecodeError = codec.DecodeError
+    loads = codec.loads
+    dumpb = codec.dumpb
+    dumps_lines = codec.dumps_lines
+    return backend
+
+
+backend = None
+DecodeError = None
+loads = None
+dumpb = None
+dumps_lines = None
+set_backend()
+
+
+class JSONLinesWriter:
+    """
+    Write objects as newline delimited JSON to a binary stream
+
+    Objects are collected into batches of batch_size and each batch is serialized into a single buffer
+    with dumps_lines() and written with one call.  Use as a context manager, or call flush() when done
+    """
+
+    def __init__(self, stream, batch_size=1000):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.batch = []
+
+    def write(self, obj):
+        self.batch.append(obj)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.stream.write(dumps_lines(self.batch))
+            self.batch = []
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
@@ -2,17 +2,75 @@
 utilities for manipulating AIS messages as NMEA strings, json strings or dicts
 """
 
-import json
 from urllib.parse import quote as url_quote
 import posixpath as pp
 import uuid
 from hashlib import md5
+import xxhash
 import ais_tools
+from ais_tools import jsoncodec
 
 
 default_uuid_fields = ('source', 'tagblock_station', 'nmea', 'tagblock_timestamp')
 
 
+def md5_uuid(name):
+    """
+    Create a uuid string from the md5 hash of name.  This is the default, and the version and variant
+    bits are not set, so the result is compatible with uuids created by earlier versions of ais-tools
+    """
+    hex = md5(name.encode("utf-8")).hexdigest()
+    return f'{hex[:8]}-{hex[8:12]}-{hex[12:16]}-{hex[16:20]}-{hex[20:32]}'
+
+
+# maps the first hex digit of the variant field to the same digit with the RFC 9562 variant bits set
+_uuid_variant_digit = {c: '89ab'[int(c, 16) & 3] for c in '0123456789abcdef'}
+
+
+def xxh3_128_uuid(name):
+    """
+    Create a uuid string from the xxh3 128 bit hash of name.  This is much faster than md5_uuid.
+    The version and variant bits are set to make a valid version 8 (custom) RFC 9562 uuid
+    """
+    hex = xxhash.xxh3_128_hexdigest(name.encode("utf-8"))
+    return f'{hex[:8]}-{hex[8:12]}-8{hex[13:16]}-{_uuid_variant_digit[hex[16]]}{hex[17:20]}-{hex[20:32]}'
+
+
+# uuid algorithms that can be selected by name in create_uuid() and add_uuid()
+# Each one takes a string and returns a uuid string
+uuid_algorithms = {
+    'md5': md5_uuid,
+    'xxh3_128': xxh3_128_uuid,
+}
+
+
+def get_uuid_algorithm(algorithm):
+    """
+    Returns the uuid function for algorithm, which can be a name from uuid_algorithms or a callable
+    """
+    if callable(algorithm):
+        return algorithm
+    try:
+        return uuid_algorithms[algorithm]
+    except KeyError:
+        raise ValueError('Unknown uuid algorithm {}.  Must be one of {}'.format(algorithm, ', '.join(uuid_algorithms)))
+
+
+def add_uuids(messages, overwrite=False, fields=default_uuid_fields, algorithm='md5'):
+    """
+    Add a uuid to each message in an iterable of messages, as Message.add_uuid() does, and yield the messages
+
+    The field list and the uuid algorithm are resolved once for the whole batch
+    """
+    create_uuid = get_uuid_algorithm(algorithm)
+    join = '|'.join
+    for msg in messages:
+        get = msg.get
+        if overwrite or get('uuid') is None:
+            msg['uuid'] = create_uuid(join([str(get(f, '')) for f in fields]))
+        yield msg
+
+
 class UUID:
     """
     Create a UUID from a set of args
@@ -33,11 +91,46 @@ class UUID:
         return uuid.uuid5(uuid.NAMESPACE_URL, pp.join(cls.UUID_URL_BASE, *args).lower())
 
 
-class Message(dict):
+class MessageMethods:
+    """
+    Methods shared by Message and the compact record types in ais_tools.record
+
+    Requires the class to implement get() and __setitem__()
+    """
+    __slots__ = ()
+
+    def add_source(self, source, overwrite=False):
+        if self.get('source') is None or overwrite:
+            self['source'] = source
+        return self
+
+    def create_uuid(self, fields=default_uuid_fields, algorithm='md5'):
+        """
+        Create a uuid string from the values of the given fields.
+
+        algorithm is the name of one of the functions in uuid_algorithms, or a callable that takes a string
+        and returns a uuid string.  The default is 'md5'
+        """
+        name = '|'.join([str(self.get(f, '')) for f in fields])
+        return get_uuid_algorithm(algorithm)(name)
+
+    def add_uuid(self, overwrite=False, fields=default_uuid_fields, algorithm='md5'):
+        if self.get('uuid') is None or overwrite:
+            self['uuid'] = self.create_uuid(fields=fields, algorithm=algorithm)
+        return self
+
+    def add_parser_version(self, overwrite=False):
+        if self.get('parser') is None or overwrite:
+            self['parser'] = 'ais-tools-' + ais_tools.__version__
+        return self
+
+
+class Message(MessageMethods, dict):
     """
     A dict subclass representing an AIS message.
 
-    Can be constructed from an NMEA string, a JSON string, or a dict.
+    Can be constructed from an NMEA string, a JSON string, or a dict.  NMEA and JSON
+    may also be passed as bytes.
     The 'nmea' key holds the raw NMEA sentence(s) as a single string.
     Multi-part messages should be pre-concatenated.
     """
@@ -59,13 +152,25 @@ class Message(dict):
                 elif message[0] == '{':
                     # looks like json, try to parse it
                     try:
-                        self.update(json.loads(message))
-                    except json.JSONDecodeError as e:
+                        self.update(jsoncodec.loads(message))
+                    except jsoncodec.DecodeError as e:
                         # Nope - not JSON.  Giving up...
                         self.update(dict(nmea=message, error="JSONDecodeError: {}".format(str(e))))
                 else:
                     # assume it's an NMEA string
                     self['nmea'] = message
+            elif isinstance(message, bytes):
+                message = message.strip()
+                if len(message) == 0:
+                    pass
+                elif message[:1] == b'{':
+                    try:
+                        self.update(jsoncodec.loads(message))
+                    except jsoncodec.DecodeError as e:
+                        self.update(dict(nmea=message.decode('utf-8', errors='replace'),
+                                         error="JSONDecodeError: {}".format(str(e))))
+                else:
+                    self['nmea'] = message.decode('utf-8', errors='replace')
             elif isinstance(message, dict):
                 self.update(message)
             else:
@@ -75,28 +180,6 @@ class Message(dict):
     def nmea(self):
         return self.get('nmea', '')
 
-    def add_source(self, source, overwrite=False):
-        if self.get('source') is None or overwrite:
-            self['source'] = source
-        return self
-
-    def create_uuid(self, fields=default_uuid_fields):
-        name = '|'.join((str(self.get(f, '')) for f in fields))
-        hex = md5(bytes(name, "utf-8")).digest().hex()
-        return '%s-%s-%s-%s-%s' % (
-            hex[:8], hex[8:12], hex[12:16], hex[16:20], hex[20:32]
-        )
-
-    def add_uuid(self, overwrite=False, fields=default_uuid_fields):
-        if self.get('uuid') is None or overwrite:
-            self['uuid'] = self.create_uuid(fields=fields)
-        return self
-
-    def add_parser_version(self, overwrite=False):
-        if self.get('parser') is None or overwrite:
-            self['parser'] = 'ais-tools-' + ais_tools.__version__
-        return self
-
     @classmethod
     def stream(cls, messages):
         for msg in messages:
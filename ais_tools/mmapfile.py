@@ -0,0 +1,209 @@
+"""
+Decode and normalize large nmea files in parallel using a memory mapped file
+
+The file is split into byte ranges that end on a line boundary, and each range is processed by a worker process
+that maps the file itself and reads its lines directly from the mapping, so the input does not have to be read
+and passed to the workers by the parent process.  Results are returned in the order of the ranges, so the output
+is in the same order as the input file.
+
+Range boundaries are moved past any nearby lines that continue a multipart message, so that the parts of a message
+that arrive close together and in order are usually processed by the same worker.  When normalizing, the parts that
+a worker cannot match within its range are returned to the parent process, which joins any that belong to a message
+split between two ranges and puts the result back where the serial path would output it.
+"""
+
+import collections
+import itertools
+import math
+import mmap
+import multiprocessing
+import os
+
+from ais_tools import jsoncodec
+from ais_tools import normalize_transform
+from ais_tools.aivdm import AIVDM
+from ais_tools.nmea import MultipartJoiner
+from ais_tools.tagblock import TagblockCache
+
+
+def _is_continuation(line):
+    # True if this is the second or later part of a multipart message, eg. !AIVDM,2,2,...
+    fields = line[line.find(b'!'):].split(b',', 3)
+    return len(fields) > 3 and fields[1] != b'1' and fields[2] != b'1'
+
+
+def _skip_continuations(mm, end, size, lookahead):
+    # move end past any multipart continuation lines in the next lookahead lines, counting again from each one
+    pos = end
+    count = 0
+    while pos < size and count < lookahead:
+        newline = mm.find(b'\n', pos)
+        next_pos = size if newline == -1 else newline + 1
+        count += 1
+        if _is_continuation(mm[pos:next_pos]):
+            end = next_pos
+            count = 0
+        pos = next_pos
+    return end
+
+
+def file_ranges(path, chunk_size, lookahead=8):
+    """
+    Split a file into byte ranges of about chunk_size bytes, each of which ends at a line boundary.  Returns a
+    list of (start, end) tuples
+
+    Each boundary is moved past any lines in the next lookahead lines that continue a multipart message
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+
+    ranges = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                newline = mm.find(b'\n', end - 1)
+                end = size if newline == -1 else newline + 1
+            end = _skip_continuations(mm, end, size, lookahead)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def default_chunk_size(path, workers):
+    """Four ranges per worker, but no less than 1 MiB and no more than 64 MiB per range"""
+    return min(max(os.path.getsize(path) // (workers * 4), 1 << 20), 64 << 20)
+
+
+def read_range_lines(path, start, end):
+    """
+    Returns the lines in a byte range of a file, as bytes without the line ending.  Blank lines are included,
+    the same as when reading the file line by line
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = mm[start:end].split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    return lines
+
+
+def map_file_ranges(fn, path, args=(), workers=4, chunk_size=None, initializer=None, initargs=()):
+    """
+    Call fn(*args, path, start, end) for each range of the file in a pool of worker processes, and yield the
+    results in order.  See default_chunk_size() for the default size of the ranges.  If initializer is given, each
+    worker process calls initializer(*initargs) once when it starts
+    """
+    ranges = file_ranges(path, chunk_size or default_chunk_size(path, workers))
+    if not ranges:
+        return
+
+    ranges = iter(ranges)
+    pending = collections.deque()
+    with multiprocessing.Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        while True:
+            # keep a limited number of ranges in flight so that the results are not all held in memory
+            while len(pending) < workers * 2 and (r := next(ranges, None)):
+                pending.append(pool.apply_async(fn, args + (path,) + r))
+            if not pending:
+                break
+            yield pending.popleft().get()
+
+
+def _decode_range(tagblock_cache, path, start, end):
+    tagblock_decoder = TagblockCache(maxsize=tagblock_cache) if tagblock_cache > 0 else None
+    decoder = AIVDM(tagblock_decoder=tagblock_decoder)
+    messages = [decoder.safe_decode(line) for line in read_range_lines(path, start, end)]
+    errors = [msg['error'] for msg in messages if 'error' in msg]
+    tagblock_stats = tagblock_decoder.stats() if tagblock_decoder is not None else None
+    return jsoncodec.dumps_lines(messages), errors, tagblock_stats
+
+
+def decode_file(path, workers=4, tagblock_cache=0, chunk_size=None):
+    """
+    Decode a file of nmea with one message per line in parallel, with multipart messages already joined
+
+    Yields (output, errors, tagblock_stats) for each range of the file in order, where output is the decoded
+    messages as newline JSON bytes, errors is a list of the decode errors and tagblock_stats is the result of
+    TagblockCache.stats() for the range if tagblock_cache is greater than zero
+    """
+    yield from map_file_ranges(_decode_range, path, (tagblock_cache,), workers=workers, chunk_size=chunk_size)
+
+
+class _RangeJoiner(MultipartJoiner):
+    # Joins multipart messages within one range of a file.  Parts that expire within max_message_window lines of
+    # the start of the range may belong to a message that started in the previous range, so they are kept in held
+    # instead of being passed through
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.held = []
+
+    def flush_expired(self, index, now):
+        lines = []
+        for part in self._expired_parts(index, now):
+            if part['index'] < self.max_message_window:
+                self.held.append(part)
+            else:
+                lines.append(part['line'])
+        return lines
+
+
+def _normalize_range(max_time_window, max_message_window, path, start, end):
+    joiner = _RangeJoiner(max_time_window=max_time_window, max_message_window=max_message_window,
+                          ignore_decode_errors=True)
+    lines = []
+    positions = []
+    for line in read_range_lines(path, start, end):
+        positions.append(len(lines))
+        lines.extend(joiner.process(line))
+
+    # parts that are still unmatched at the end of the range may belong to a message that ends in the next range
+    held = sorted(joiner.held + [part for parts in joiner.buffer.values() for part in parts],
+                  key=lambda part: part['index'])
+
+    # normalize the lines between the positions where the held parts arrived separately, so that a message joined
+    # from a held part can be output in the same place as in the serial path
+    segments = []
+    segment_start = 0
+    for segment_end in [positions[part['index']] for part in held] + [len(lines)]:
+        segments.append(normalize_transform._normalize_batch(lines[segment_start:segment_end]))
+        segment_start = segment_end
+    return segments, [(part['index'], part['line']) for part in held], len(positions)
+
+
+def normalize_file(path, normalizer, workers=4, max_time_window=500, max_message_window=1000, chunk_size=None):
+    """
+    Join multipart messages, decode and normalize a file of nmea in parallel, using the settings of a
+    LineNormalizer.  The counts from each range are added to the normalizer, see LineNormalizer.stats()
+
+    Yields the normalized messages in the same order as the input.  The parts of a multipart message that is
+    split between two ranges are joined in this process, so the output is the same as joining the whole file
+    with join_multipart_stream() and normalizing it, as long as max_time_window does not expire any parts there
+
+    raises ValueError if the normalizer has a deduplicator
+    """
+    if normalizer.deduplicator is not None:
+        raise ValueError('Deduplication is not supported with more than one worker')
+
+    # match the parts that the workers could not match in their own range, using the line number in the file as
+    # the stream index.  Only max_message_window applies here, since the time spent waiting for the workers
+    # would otherwise expire the parts
+    joiner = MultipartJoiner(max_time_window=math.inf, max_message_window=max_message_window,
+                             ignore_decode_errors=True)
+    line_offset = 0
+    args = (max_time_window, max_message_window)
+    for segments, held, line_count in map_file_ranges(_normalize_range, path, args, workers=workers,
+                                                      chunk_size=chunk_size,
+                                                      initializer=normalize_transform._init_worker_normalizer,
+                                                      initargs=(normalizer._worker_config(),)):
+        for (messages, stats), part in itertools.zip_longest(segments, held):
+            normalizer._add_stats(stats)
+            yield from messages
+            if part is not None:
+                index, line = part
+                joiner.index = line_offset + index
+                yield from normalizer.normalize(joiner.process(line))
+        line_offset += line_count
+    yield from normalizer.normalize(joiner.flush())
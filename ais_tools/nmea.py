@@ -4,85 +4,197 @@ Utilities for parsing, splitting, and joining NMEA sentences including multi-par
 
 from collections import defaultdict
 from datetime import datetime, timezone
-import re
+import itertools
+import multiprocessing
+import queue
 
 from ais import DecodeError
 from ais_tools.core import is_checksum_valid
 from ais_tools.tagblock import split_tagblock
 from ais_tools.tagblock import decode_tagblock
+from ais_tools.tagblock import extract as extract_tagblock_fields
 
-REGEX_BANG = re.compile(r'(![^!]+)')
-REGEX_BACKSLASH = re.compile(r'(\\[^\\]+\\![^!\\]+)')
-REGEX_BACKSLASH_BANG = re.compile(r'(\\![^!\\]+)')
-
-
-def expand_nmea(line, validate_checksum=False):
+def expand_nmea(line, validate_checksum=False, tagblock_decoder=None):
     """
     Parse a single NMEA sentence into its components.
 
     Returns (tagblock, body, pad) where tagblock is a dict of parsed tagblock
     fields, body is the encoded AIS payload, and pad is the number of fill bits.
+
+    line may be either str or bytes.  The returned body and tagblock values are always str
+
+    tagblock_decoder is the function used to parse the tagblock, and defaults to decode_tagblock().  Pass a
+    TagblockCache to cache the parsed tagblocks
     """
     tagblock_str, nmea = split_tagblock(line)
-    tagblock = decode_tagblock(tagblock_str, validate_checksum=validate_checksum)
+    return expand_sentence(tagblock_str, nmea, validate_checksum=validate_checksum, tagblock_decoder=tagblock_decoder)
+
+
+def expand_sentence(tagblock_str, nmea, validate_checksum=False, tagblock_decoder=None):
+    """
+    Same as expand_nmea() but with the tagblock already split off from the sentence, for example
+    using the offsets returned by scan_multipart()
+    """
+    tagblock = (tagblock_decoder or decode_tagblock)(tagblock_str, validate_checksum=validate_checksum)
 
     nmea = nmea.strip()
-    fields = nmea.split(',')
+    is_bytes = isinstance(nmea, bytes)
+    comma, star = (b',', b'*') if is_bytes else (',', '*')
+
+    fields = nmea.split(comma)
     if len(fields) < 6:
         raise DecodeError('not enough fields in nmea message')
 
     if validate_checksum and not is_checksum_valid(nmea):
         raise DecodeError('Invalid checksum')
 
+    if is_bytes:
+        try:
+            talker_id = fields[0][1:3].decode('ascii')
+            channel = fields[4].decode('ascii')
+            body = fields[5].decode('ascii')
+        except UnicodeDecodeError:
+            raise DecodeError('Invalid characters in nmea message')
+    else:
+        talker_id, channel, body = fields[0][1:3], fields[4], fields[5]
+
     try:
-        tagblock['talker_id'] = fields[0][1:3]
+        tagblock['talker_id'] = talker_id
         if 'tagblock_groupsize' not in tagblock:
             tagblock['tagblock_groupsize'] = int(fields[1])
             tagblock['tagblock_sentence'] = int(fields[2])
-            if fields[3] != '':
+            if fields[3]:
                 tagblock['tagblock_id'] = int(fields[3])
         else:
             tagblock['tagblock_group_id'] = tagblock['tagblock_id']
-        tagblock['tagblock_channel'] = fields[4]
-        body = fields[5]
-        pad = int(nmea.split('*')[0][-1])
+        tagblock['tagblock_channel'] = channel
+        pad = int(nmea.split(star)[0][-1:])
     except ValueError:
         raise DecodeError('Unable to convert field to int in nmea message')
 
     return tagblock, body, pad
 
 
-def split_multipart(line):
+def scan_multipart(line):
     """
-    Split a single line of text that contains one or more nmea messages
-    Expects the combined lines to have been joined with join_multipart()
+    Find the boundaries of the message parts in a single line of text that contains one or more nmea
+    messages in a single pass.  Expects the combined lines to have been joined with join_multipart()
 
     Each message part is expected to be one of these
         !AIDVM....
         \\!AIDVM....
         \\tagblock\\!AIDVM....
 
-    and all parts in the line should have the same format
+    and the parts in a line may have different formats
+
+    Returns a list of (start, sentence_start, end) offsets for each part, where line[start:end] is the
+    whole part and line[sentence_start:end] is the part with the tagblock removed.  If the part has a
+    tagblock, it is in line[start + 1:sentence_start - 1], otherwise start == sentence_start.
+
+    line may be either str or bytes
     """
-    if line.startswith('!'):
-        regex = REGEX_BANG
-    elif line.startswith('\\!'):
-        regex = REGEX_BACKSLASH_BANG
-    elif line.startswith('\\'):
-        regex = REGEX_BACKSLASH
+    if isinstance(line, bytes):
+        backslash, bang = b'\\', b'!'
     else:
+        backslash, bang = '\\', '!'
+
+    if not line:
         raise DecodeError('no valid AIVDM message detected')
 
-    return regex.findall(line)
+    parts = []
+    length = len(line)
+    pos = 0
+    while pos < length:
+        start = pos
+        if line.startswith(bang, pos):
+            sentence_start = bang_pos = pos
+        elif not line.startswith(backslash, pos):
+            raise DecodeError('no valid AIVDM message detected')
+        elif line.startswith(bang, pos + 1):
+            # no tagblock, so keep the leading backslash in the sentence, same as split_tagblock()
+            sentence_start = pos
+            bang_pos = pos + 1
+        else:
+            bang_pos = sentence_start = line.find(backslash, pos + 1) + 1
+            if sentence_start == 0:
+                raise DecodeError('tagblock is missing the closing delimiter')
+
+        # the sentence ends at the start of the next part
+        end = line.find(bang, bang_pos + 1)
+        if end < 0:
+            end = length
+        next_backslash = line.find(backslash, bang_pos + 1, end)
+        if next_backslash >= 0:
+            end = next_backslash
+
+        # skip empty parts
+        if end - start > 1:
+            parts.append((start, sentence_start, end))
+        pos = end
+
+    return parts
+
+
+def split_multipart_sentences(line):
+    """
+    Split a single line of text that contains one or more nmea messages into a list of
+    (tagblock, sentence) for each message part, using scan_multipart()
+    """
+    empty = line[:0]
+    return [(line[start + 1:sentence_start - 1] if sentence_start > start else empty, line[sentence_start:end])
+            for start, sentence_start, end in scan_multipart(line)]
+
+
+_vdm_prefixes = frozenset(
+    '!{}VD{}'.format(talker, suffix) for talker in ('AB', 'AI', 'AN', 'BS') for suffix in ('M', 'O')
+)
+_vdm_prefixes = _vdm_prefixes | frozenset(prefix.encode('ascii') for prefix in _vdm_prefixes)
+_hex_digits = frozenset('0123456789abcdefABCDEF') | frozenset(b'0123456789abcdefABCDEF')
+
+
+def vdm_sentence(sentence):
+    """
+    Check that a sentence returned by split_multipart_sentences() is a well formed VDM or VDO sentence
+
+    Returns the sentence with any leading backslash removed, which is exactly the text that
+    normalize.REGEX_NMEA matches for the sentence, or None if the sentence is not well formed.
+
+    sentence may be either str or bytes
+    """
+    if sentence[:1] in ('\\', b'\\'):
+        sentence = sentence[1:]
+    star = b'*' if isinstance(sentence, bytes) else '*'
+    if (sentence[:6] in _vdm_prefixes
+            and len(sentence) > 9
+            and sentence.find(star) == len(sentence) - 3
+            and sentence[-2] in _hex_digits
+            and sentence[-1] in _hex_digits):
+        return sentence
+    return None
+
+
+def split_multipart(line):
+    """
+    Split a single line of text that contains one or more nmea messages
+    Expects the combined lines to have been joined with join_multipart()
+
+    Each message part is expected to be one of these
+        !AIDVM....
+        \\!AIDVM....
+        \\tagblock\\!AIDVM....
+
+    line may be either str or bytes, and the returned parts are the same type as line
+    """
+    return [line[start:end] for start, _, end in scan_multipart(line)]
 
 
 def join_multipart(lines):
     """
     takes a list of nmea text lines that form a single mulitpart message and concatenates them in the order given
     """
-    start_chars = {line[0] for line in lines}
-    if len(start_chars) == 1 and start_chars.issubset({'\\', '!'}):
-        return ''.join(lines)
+    start_chars = {line[:1] for line in lines}
+    if len(start_chars) == 1 and start_chars.issubset({'\\', '!', b'\\', b'!'}):
+        return lines[0][:0].join(lines)
     raise DecodeError("all lines to be joined must start with the same character, either '\\' or '!'")
 
 
@@ -112,44 +224,91 @@ def join_multipart_stream(lines,
     Matched message parts will be concatenated together into a single line using join_multipart()
     All other messages will come out with no changes
     """
-    buffer = defaultdict(list)
+    joiner = MultipartJoiner(max_time_window=max_time_window,
+                             max_message_window=max_message_window,
+                             ignore_decode_errors=ignore_decode_errors)
+    for line in lines:
+        yield from joiner.process(line)
+
+    # input stream ended, so flush whatever parts are left in the buffer in the order they arrived
+    yield from joiner.flush()
+
+
+class MultipartJoiner:
+    """
+    Stateful matcher for the parts of multipart nmea messages. This does the work for join_multipart_stream()
+
+    Call process() once for each line in the stream, and flush() when the stream ends.  Both return a list of
+    lines that are ready to be emitted.
+
+    The buffered message parts can be saved with snapshot() and loaded into a new joiner with restore(), so
+    that unmatched parts survive a process restart instead of being flushed out
+    """
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, max_time_window=500, max_message_window=1000, ignore_decode_errors=False,
+                 tagblock_decoder=None):
+        self.max_time_window = max_time_window
+        self.max_message_window = max_message_window
+        self.ignore_decode_errors = ignore_decode_errors
+        self.tagblock_decoder = tagblock_decoder
+
+        self.buffer = defaultdict(list)
+
+        # index of the next line in the stream.  This keeps counting across restore()
+        self.index = 0
+
+    @staticmethod
+    def part_key(tagblock):
+        """
+        make a key for matching message parts
+        - tagblock_groupsize is the number of parts we are looking for
+        - tagblock_station is the source of the message and may not have a value
+        - tagblock_id is a sequence number that is the same for all message parts, but it is
+                      a single digit only so not unique
+        - tagblock_group_id if present, is a sequence number that is the same for all message parts, and it
+                            should be locally unique within the stream. It is a 4-digit number
+        - tagblock_channel is the AIS RF channel (either A or B) that was used for transmission
+        - talker_id is the first two characters after the '!'.  For a message "!AIVDM..." the talker_id is "AI"
+        """
+        total_parts = tagblock['tagblock_groupsize']
+        tagblock_group_id = tagblock.get('tagblock_group_id')
+        if tagblock_group_id:
+            # only need this group id
+            return (total_parts, None, tagblock_group_id, None, None)
+        else:
+            # no group id present, so use everything else we have to try to make a locally unique signature
+            return (total_parts, tagblock.get('tagblock_station'), tagblock.get('tagblock_id'),
+                    tagblock.get('tagblock_channel'), tagblock.get('talker_id'))
+
+    def process(self, line):
+        """
+        Add a single line to the joiner
+
+        Returns a list of lines that are ready to be emitted, which may be empty
+        """
+        index = self.index
+        self.index += 1
 
-    for index, line in enumerate(lines):
         line = line.strip()
         try:
-            tagblock, body, pad = expand_nmea(line)
+            tagblock, body, pad = expand_nmea(line, tagblock_decoder=self.tagblock_decoder)
         except DecodeError:
-            if ignore_decode_errors:
-                yield line
-                continue
+            if self.ignore_decode_errors:
+                return [line]
             else:
                 raise
 
+        output = []
         now = datetime.now(timezone.utc).timestamp()
         total_parts = tagblock['tagblock_groupsize']
 
         if total_parts == 1:
             # this is a single part part message, so nothing to do, just pass it out
-            yield line
+            output.append(line)
         else:
-            # make a key for matching message parts
-            # - tagblock_groupsize is the number of parts we are looking for
-            # - tagblock_station is the source of the message and may not have a value
-            # - tagblock_id is a sequence number that is the same for all message parts, but it is
-            #               a single digit only so not unique
-            # - tagblock_group_id if present, is a sequence number that is the same for all message parts, and it
-            #                     should be locally unique within the stream. It is a 4-digit number
-            # - tagblock_channel is the AIS RF channel (either A or B) that was used for transmission
-            # - talker_id is the first two characters after the '!'.  For a message "!AIVDM..." the talker_id is "AI"
-
-            tagblock_group_id = tagblock.get('tagblock_group_id')
-            if tagblock_group_id:
-                # only need this group id
-                key = (total_parts, None, tagblock_group_id, None, None)
-            else:
-                # no group id present, so use everything else we have to try to make a locally unique signature
-                key = (total_parts, tagblock.get('tagblock_station'), tagblock.get('tagblock_id'),
-                       tagblock.get('tagblock_channel'), tagblock.get('talker_id'))
+            key = self.part_key(tagblock)
 
             # pack up the message part
             # - tagblock_sentence is the index of this part relative to the other parts, where the first part is 1
@@ -159,32 +318,47 @@ def join_multipart_stream(lines,
             new_part_num = tagblock['tagblock_sentence']
             new_part = dict(part_num=new_part_num, line=line, index=index, time_in=now)
 
-            buffered_parts = buffer[key]
+            buffered_parts = self.buffer[key]
             part_nums = set(part['part_num'] for part in buffered_parts)
 
             if new_part_num in part_nums:
                 # already another message part with this part_num in the buffer, so flush out the unmatched parts
                 for part in sorted(buffered_parts, key=lambda x: x['index']):
-                    yield part['line']
+                    output.append(part['line'])
                 # replace the slot in the buffer with the new part
-                buffer[key] = [new_part]
+                self.buffer[key] = [new_part]
 
             elif part_nums.union({new_part_num}) == set(range(1, total_parts + 1)):
                 # found all the parts.   Concatenate them in order and send the combined line out
-                buffer[key].append(new_part)
-                yield ''.join([part['line'] for part in sorted(buffer[key], key=lambda x:x['part_num'])])
-                del buffer[key]
+                buffered_parts.append(new_part)
+                lines = [part['line'] for part in sorted(buffered_parts, key=lambda x:x['part_num'])]
+                output.append(line[:0].join(lines))
+                del self.buffer[key]
 
             else:
-                buffer[key].append(new_part)
+                buffered_parts.append(new_part)
+
+        output.extend(self.flush_expired(index, now))
+        return output
+
+    def flush_expired(self, index, now):
+        """
+        Remove any buffered parts that are too old relative to the given stream index and timestamp.
+
+        Returns a list of the removed lines
+        """
+        return [part['line'] for part in self._expired_parts(index, now)]
+
+    def _expired_parts(self, index, now):
+        # same as flush_expired(), but returns the removed parts with their stream index instead of just the lines
 
         # prepare to flush old parts from the buffer
         flush_keys = set()
-        flush_time = now - (max_time_window / 1000)
-        flush_index = index - max_message_window
+        flush_time = now - (self.max_time_window / 1000)
+        flush_index = index - self.max_message_window
 
         # find any keys that have at least one part that is too old
-        for key, parts in buffer.items():
+        for key, parts in self.buffer.items():
             if any(part['time_in'] < flush_time or part['index'] < flush_index for part in parts):
                 flush_keys.add(key)
 
@@ -192,12 +366,169 @@ def join_multipart_stream(lines,
         # Send them out in the order they arrived
         flush_parts = []
         for key in flush_keys:
-            flush_parts += buffer[key]
-            del buffer[key]
-        for part in sorted(flush_parts, key=lambda x: x['index']):
-            yield part['line']
+            flush_parts += self.buffer[key]
+            del self.buffer[key]
+        return sorted(flush_parts, key=lambda x: x['index'])
+
+    def flush(self):
+        """
+        Remove all the parts from the buffer.  Returns a list of the removed lines in the order they arrived
+        """
+        output = []
+        for key, parts in self.buffer.items():
+            for part in sorted(parts, key=lambda x: x['index']):
+                output.append(part['line'])
+        self.buffer.clear()
+        return output
+
+    def snapshot(self):
+        """
+        Get the state of the joiner as a dict that can be serialized to json and passed to restore()
+
+        Only the line, stream index and arrival time of each buffered part are saved.  The part key is
+        recomputed from the line on restore.  Lines that were passed in as bytes are saved as str using the
+        latin-1 encoding, which maps every byte to a character, and converted back to bytes on restore
+        """
+        parts = [(part['line'], part['index'], part['time_in'])
+                 for parts in self.buffer.values() for part in parts]
+        is_bytes = any(isinstance(line, bytes) for line, _, _ in parts)
+        return dict(
+            version=self.SNAPSHOT_VERSION,
+            index=self.index,
+            time=datetime.now(timezone.utc).timestamp(),
+            bytes=is_bytes,
+            parts=sorted([(line.decode('latin-1') if is_bytes else line, index, time_in)
+                          for line, index, time_in in parts], key=lambda x: x[1]),
+        )
+
+    def restore(self, state):
+        """
+        Load a state previously created with snapshot() into this joiner, replacing anything in the buffer
+
+        The stream index continues counting from the saved index, and the arrival time of each part is shifted
+        forward by the time elapsed since the snapshot was taken, so the time that the process was not running
+        does not count against max_time_window.  Parts that were already stale when the snapshot was taken
+        will be flushed on the next call to process()
+        """
+        if state.get('version') != self.SNAPSHOT_VERSION:
+            raise ValueError('Unsupported joiner snapshot version {}'.format(state.get('version')))
+
+        time_offset = max(0, datetime.now(timezone.utc).timestamp() - state['time'])
+
+        self.buffer.clear()
+        self.index = state['index']
+        for line, index, time_in in state['parts']:
+            if state.get('bytes'):
+                line = line.encode('latin-1')
+            tagblock, body, pad = expand_nmea(line)
+            part = dict(part_num=tagblock['tagblock_sentence'], line=line, index=index,
+                        time_in=time_in + time_offset)
+            self.buffer[self.part_key(tagblock)].append(part)
 
-    # input stream ended, so flush whatever parts are left in the buffer in the order they arrived
-    for key, parts in buffer.items():
-        for part in sorted(parts, key=lambda x: x['index']):
-            yield part['line']
+
+def multipart_shard_key(line):
+    """
+    Get the value used to assign a line to a shard in join_multipart_stream_sharded()
+
+    This is the tagblock group id if there is one, otherwise the tagblock station, so that all the parts that
+    MultipartJoiner.part_key() could match together always end up in the same shard.  Returns None if neither
+    one is present.  This only scans the tagblock, it does not do a full decode
+    """
+    try:
+        group, station = extract_tagblock_fields(line.strip(), keys=('g', 's'))
+    except DecodeError:
+        return None
+    if group:
+        try:
+            return int(group.rsplit('-', 1)[-1])
+        except ValueError:
+            pass
+    return station
+
+
+def _join_multipart_shard(in_queue, out_queue, joiner_args):
+    joiner = MultipartJoiner(**joiner_args)
+    try:
+        while (lines := in_queue.get()) is not None:
+            out_queue.put([nmea for line in lines for nmea in joiner.process(line)])
+        out_queue.put(joiner.flush())
+    except Exception as e:
+        # send any error to the parent to raise, otherwise it would wait for this worker forever
+        out_queue.put(e)
+
+
+def join_multipart_stream_sharded(lines,
+                                  shards=4,
+                                  max_time_window=500,
+                                  max_message_window=1000,
+                                  ignore_decode_errors=False,
+                                  batch_size=1000):
+    """
+    Same as join_multipart_stream, but the lines are divided into shards using multipart_shard_key() and each
+    shard is joined in a separate worker process.
+
+    Lines are sent to the workers in batches of batch_size, and the output for each batch is emitted one shard
+    at a time, so the output order is only preserved within each shard.   Note that max_message_window is
+    counted separately within each shard
+    """
+    if shards <= 1:
+        yield from join_multipart_stream(lines, max_time_window=max_time_window,
+                                         max_message_window=max_message_window,
+                                         ignore_decode_errors=ignore_decode_errors)
+        return
+
+    joiner_args = dict(max_time_window=max_time_window,
+                       max_message_window=max_message_window,
+                       ignore_decode_errors=ignore_decode_errors)
+    in_queues = [multiprocessing.Queue() for _ in range(shards)]
+    out_queues = [multiprocessing.Queue() for _ in range(shards)]
+    workers = [multiprocessing.Process(target=_join_multipart_shard, args=(in_queue, out_queue, joiner_args),
+                                       daemon=True)
+               for in_queue, out_queue in zip(in_queues, out_queues)]
+    for worker in workers:
+        worker.start()
+
+    def send(batch):
+        sharded = [[] for _ in range(shards)]
+        for line in batch:
+            sharded[hash(multipart_shard_key(line)) % shards].append(line)
+        for in_queue, shard_lines in zip(in_queues, sharded):
+            in_queue.put(shard_lines)
+
+    def get(out_queue, worker):
+        while True:
+            try:
+                return out_queue.get(timeout=1)
+            except queue.Empty:
+                if not worker.is_alive() and out_queue.empty():
+                    raise RuntimeError('Multipart join worker exited unexpectedly with exit code {}'.format(
+                        worker.exitcode))
+
+    def receive():
+        for out_queue, worker in zip(out_queues, workers):
+            result = get(out_queue, worker)
+            if isinstance(result, Exception):
+                raise result
+            yield from result
+
+    try:
+        # keep one batch in flight in the workers while the next batch is being read and sharded
+        in_flight = False
+        lines = iter(lines)
+        while batch := list(itertools.islice(lines, batch_size)):
+            send(batch)
+            if in_flight:
+                yield from receive()
+            in_flight = True
+        if in_flight:
+            yield from receive()
+
+        # input stream ended, so flush whatever parts are left in the buffers
+        for in_queue in in_queues:
+            in_queue.put(None)
+        yield from receive()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
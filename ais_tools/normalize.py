@@ -2,12 +2,17 @@
 Normalize decoded AIS messages into a consistent schema with validated fields.
 """
 
-from typing import Optional, Any
+from typing import Optional, Any, Sequence
 from datetime import datetime, timezone
+from collections import OrderedDict
+from functools import lru_cache
+from math import isfinite
 import xxhash
 import re
 from enum import Enum
 
+from ais_tools.tagblock import timestamp_second
+
 
 REGEX_NMEA = re.compile(r'!(?:AB|AI|AN|BS)VD[MO][^*]+\*[0-9A-Fa-f]{2}')
 SKIP_MESSAGE_IF_FIELD_PRESENT = ['error']
@@ -24,31 +29,55 @@ def normalize_ssvid(message: dict) -> Optional[str]:
         return None
 
 
+@lru_cache(maxsize=4096)
+def format_timestamp_second(t: int) -> str:
+    """
+    Format a unix timestamp in whole seconds as an RFC3339 string, for example '2023-01-01T00:00:00Z'
+    Results are cached because many messages share the same second
+    """
+    return datetime.fromtimestamp(t, tz=timezone.utc).isoformat(timespec='seconds').replace("+00:00", "Z")
+
+
 def normalize_timestamp(message: dict) -> Optional[str]:
     # convert to RFC3339 string
     t = message.get('tagblock_timestamp')
-    if t is not None:
+    if t is None:
+        return None
+
+    t_type = type(t)
+    if t_type is int:
+        return format_timestamp_second(t)
+    elif t_type is float and isfinite(t):
+        return format_timestamp_second(timestamp_second(t))
+    else:
         t = datetime.fromtimestamp(t, tz=timezone.utc)
         return t.isoformat(timespec='seconds').replace("+00:00", "Z")
-    else:
-        return None
 
 
 def normalize_tx_timestamp(message: dict) -> Optional[str]:
+    get = message.get
+    return format_tx_timestamp(get('year'), get('month'), get('day'), get('hour'), get('minute'), get('second'))
+
+
+@lru_cache(maxsize=4096, typed=True)
+def format_tx_timestamp(year, month, day, hour, minute, second) -> Optional[str]:
+    """
+    Format the date and time fields from a message as an RFC3339 string, or return None if any of the
+    fields are missing or out of range.  Results are cached because many messages share the same second
+    """
     def in_range(value, valid_range):
         return value is not None and valid_range[0] <= value <= valid_range[1]
 
-    fields = {
-        'year': (1, 9999),
-        'month': (1, 12),
-        'day': (1, 31),
-        'hour': (0, 23),
-        'minute': (0, 59),
-        'second': (0, 59)
+    values = {
+        'year': (year, (1, 9999)),
+        'month': (month, (1, 12)),
+        'day': (day, (1, 31)),
+        'hour': (hour, (0, 23)),
+        'minute': (minute, (0, 59)),
+        'second': (second, (0, 59)),
     }
-    values = [(f, message.get(f), valid_range) for f, valid_range in fields.items()]
-    if all(in_range(value, valid_range) for _, value, valid_range in values):
-        values = {f: value for f, value, _ in values}
+    if all(in_range(value, valid_range) for value, valid_range in values.values()):
+        values = {f: value for f, (value, _) in values.items()}
         try:
             return datetime(**values).isoformat(timespec='seconds') + 'Z'
         except ValueError:
@@ -166,24 +195,42 @@ def normalize_shiptype(message: dict, ship_types) -> Optional[str]:
     return ship_types.get(message.get('type_and_cargo'))
 
 
-def normalize_dedup_key(message: dict) -> Optional[str]:
-    """
-    Compute a key using nmea and timestamp. This can be used later for deduplication of messages
-    that come late or from multiple sources. Tf the same nmea occurs in the same minute it is either
-    a true duplicate or you can probably live without it anyway
+def dedup_key_parts(message: dict) -> Optional[tuple]:
     """
+    Get the values used to compute the dedup key for a message
 
+    Returns (minute, data) where minute is the tagblock timestamp in whole minutes and data is the bytes that
+    are hashed to make the key, or None if the message has no key.  See normalize_dedup_key()
+    """
     if 'nmea' not in message or 'tagblock_timestamp' not in message:
         return None
 
-    nmea = ''.join(REGEX_NMEA.findall(message['nmea']))
-    if not nmea:
-        return None     # no nmea found in message
+    nmea = getattr(message, 'nmea_sentences', None)
+    if nmea is None:
+        nmea = ''.join(REGEX_NMEA.findall(message['nmea']))
+        if not nmea:
+            return None     # no nmea found in message
+    if isinstance(nmea, str):
+        nmea = nmea.encode('utf-8')
 
-    timestamp = int(message['tagblock_timestamp'] / 60)
+    minute = int(message['tagblock_timestamp'] / 60)
 
-    key = f'{nmea}_{timestamp}'.encode('utf-8')
-    return xxhash.xxh3_64_hexdigest(key)
+    return minute, nmea + b'_%d' % minute
+
+
+def normalize_dedup_key(message: dict) -> Optional[str]:
+    """
+    Compute a key using nmea and timestamp. This can be used later for deduplication of messages
+    that come late or from multiple sources. Tf the same nmea occurs in the same minute it is either
+    a true duplicate or you can probably live without it anyway
+
+    If the message has an attribute nmea_sentences, as set by AIVDM.decode(), this is used in place of
+    searching the nmea field for the sentences
+    """
+    parts = dedup_key_parts(message)
+    if parts is None:
+        return None
+    return xxhash.xxh3_64_hexdigest(parts[1])
 
 
 def map_field(message: dict, source_field: str = None) -> Optional[Any]:
@@ -216,3 +263,106 @@ def normalize_message(message: dict, transforms: list) -> dict:
             else:
                 new_message[key] = value
     return new_message
+
+
+# Transforms that compile_transforms() can replace with inline code.  Each entry maps the transform function
+# to a function that takes the output key and the transform kwargs, and returns a list of source lines that
+# compute `value`, or None if the kwargs cannot be inlined
+def _inline_map_field(key, kwargs):
+    if set(kwargs) == {'source_field'}:
+        return ['value = get({!r})'.format(kwargs['source_field'])]
+    return None
+
+
+def _inline_longitude(key, kwargs):
+    return ['value = round(x, 5) if x_type is _VALID else None']
+
+
+def _inline_latitude(key, kwargs):
+    return ['value = round(y, 5) if y_type is _VALID else None']
+
+
+def _inline_pos_type(key, kwargs):
+    return ["value = x_type.name if x_type is y_type else 'INVALID'",
+            "if value == 'NULL':",
+            "    value = None"]
+
+
+_inline_transforms = {
+    map_field: _inline_map_field,
+    normalize_longitude: _inline_longitude,
+    normalize_latitude: _inline_latitude,
+    normalize_pos_type: _inline_pos_type,
+}
+
+# inline transforms that use the position type computed in _position_type_lines
+_position_transforms = frozenset([normalize_longitude, normalize_latitude, normalize_pos_type])
+
+_position_type_lines = [
+    "x = get('x')",
+    "y = get('y')",
+    "x_type = _coord_type(x, -180, 180, 181)",
+    "y_type = _coord_type(y, -90, 90, 91)",
+]
+
+# maximum number of compiled transforms to keep, see compile_transforms()
+MAX_COMPILED_TRANSFORMS = 32
+
+_compiled_transforms = OrderedDict()
+
+
+def compile_transforms(transforms: Sequence):
+    """
+    Compile a sequence of transforms as used by normalize_message() into a single function that takes a message
+    and returns the same result as normalize_message(message, transforms)
+
+    The generated function calls each transform function directly, with the kwargs passed as constants, and
+    replaces the simplest transforms with inline code. Values that are shared between transforms, such as
+    the position type used by lon, lat and pos_type, are computed only once.
+
+    The most recently used MAX_COMPILED_TRANSFORMS compiled functions are cached, so calling this again with
+    the same transforms object is cheap.  The transforms should not be modified after they have been compiled.
+    """
+    # each cache entry keeps a reference to its transforms, so their id cannot be reused by another object while
+    # the entry exists.  The identity check makes sure an entry is only ever returned for the same object
+    cached = _compiled_transforms.get(id(transforms))
+    if cached is not None and cached[0] is transforms:
+        _compiled_transforms.move_to_end(id(transforms))
+        return cached[1]
+
+    namespace = {'_coord_type': coord_type, '_VALID': POSITION_TYPE.VALID}
+    lines = ['def normalize_compiled(message):',
+             '    get = message.get',
+             '    new_message = {}']
+    position_types_computed = False
+    for i, (key, fn, kwargs) in enumerate(transforms):
+        inline = _inline_transforms.get(fn)
+        code = inline(key, kwargs) if inline else None
+        if code is None:
+            namespace[f'_fn{i}'] = fn
+            args = ['message']
+            for j, (name, value) in enumerate(kwargs.items()):
+                if not name.isidentifier():
+                    raise ValueError(f'Invalid keyword argument {name!r} for transform {key!r}')
+                namespace[f'_arg{i}_{j}'] = value
+                args.append(f'{name}=_arg{i}_{j}')
+            code = ['value = _fn{}({})'.format(i, ', '.join(args))]
+        elif fn in _position_transforms and not position_types_computed:
+            code = _position_type_lines + code
+            position_types_computed = True
+
+        lines.extend('    ' + line for line in code)
+        lines.append('    if value is not None:')
+        if key == '*':
+            lines.append('        new_message.update(value)')
+        else:
+            lines.append(f'        new_message[{key!r}] = value')
+    lines.append('    return new_message')
+
+    exec('\n'.join(lines), namespace)
+    compiled = namespace['normalize_compiled']
+    _compiled_transforms[id(transforms)] = (transforms, compiled)
+    _compiled_transforms.move_to_end(id(transforms))
+    while len(_compiled_transforms) > MAX_COMPILED_TRANSFORMS:
+        _compiled_transforms.popitem(last=False)
+    return compiled
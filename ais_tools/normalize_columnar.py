@@ -0,0 +1,182 @@
+"""
+Normalize decoded AIS messages in columnar batches using numpy
+
+This applies the same validation and rounding as the per-message functions in ais_tools.normalize, but
+to whole columns at once, which is much faster for large backfills.  Requires numpy, which can be
+installed with
+
+    pip install ais-tools[numpy]
+
+Input columns are passed as a dict of column name to a sequence of values, for example a numpy array or a
+list, with one value per message.  Missing values can be given as None or NaN.  Numeric output columns are
+float64 arrays with NaN for missing values, and string output columns are object arrays with None for
+missing values.
+"""
+
+from ais_tools.normalize import AIS_TYPES
+from ais_tools.normalize import POSITION_TYPE
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    raise ImportError('ais_tools.normalize_columnar requires numpy.  Install it with pip install ais-tools[numpy]')
+
+
+# input fields used by normalize_columns()
+COLUMNAR_FIELDS = (
+    'id',
+    'mmsi',
+    'error',
+    'tagblock_timestamp',
+    'x',
+    'y',
+    'cog',
+    'true_heading',
+    'sog',
+    'imo_num',
+    'dim_a',
+    'dim_b',
+    'dim_c',
+    'dim_d',
+    'draught',
+)
+
+_position_type_names = np.array([None] + [t.name for t in POSITION_TYPE], dtype=object)
+
+
+def messages_to_columns(messages, fields=COLUMNAR_FIELDS):
+    """
+    Convert a list of message dicts into columns for normalize_columns()
+    Numeric fields are float64 arrays with NaN for missing values, and 'error' is a boolean array that is True
+    for messages that have an 'error' key, whatever its value, the same as normalize.filter_message()
+    """
+    columns = {}
+    for field in fields:
+        if field == 'error':
+            columns[field] = np.array([field in message for message in messages], dtype=bool)
+        else:
+            columns[field] = np.array([message.get(field) for message in messages], dtype=object).astype(np.float64)
+    return columns
+
+
+def _float_column(columns, name, size):
+    values = columns.get(name)
+    if values is None:
+        return np.full(size, np.nan)
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype(np.float64)
+    return values.astype(np.float64, copy=False)
+
+
+def round_half_even(values, ndigits):
+    """
+    Round an array of floats to ndigits decimal places, giving exactly the same result as python's round()
+
+    np.round() scales the values before rounding, so values that are very close to a tie can round the
+    other way.  Those values are rounded individually with round()
+    """
+    scale = 10.0 ** ndigits
+    scaled = values * scale
+    result = np.rint(scaled) / scale
+    near_tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6
+    if near_tie.any():
+        result[near_tie] = [round(v, ndigits) for v in values[near_tie].tolist()]
+    return result
+
+
+def coord_type_codes(values, _min, _max, unavailable):
+    """
+    Vectorized version of normalize.coord_type().  Returns an array of POSITION_TYPE values
+    """
+    codes = np.full(len(values), POSITION_TYPE.INVALID.value, dtype=np.int8)
+    codes[values == unavailable] = POSITION_TYPE.UNAVAILABLE.value
+    codes[(_min <= values) & (values <= _max)] = POSITION_TYPE.VALID.value
+    codes[np.isnan(values)] = POSITION_TYPE.NULL.value
+    return codes
+
+
+def _in_range_rounded(values, _min, _max, ndigits):
+    valid = (_min <= values) & (values <= _max)
+    return np.where(valid, round_half_even(np.where(valid, values, 0.0), ndigits), np.nan)
+
+
+def format_timestamps(timestamps):
+    """
+    Vectorized version of normalize.normalize_timestamp().  Returns an object array of RFC3339 strings
+    """
+    result = np.full(len(timestamps), None, dtype=object)
+    present = ~np.isnan(timestamps)
+    t = timestamps[present]
+
+    # get the whole second that datetime.fromtimestamp() will round t to
+    seconds = np.trunc(t)
+    microseconds = np.rint((t - seconds) * 1e6)
+    seconds = seconds + (microseconds >= 1000000) - (microseconds < 0)
+
+    result[present] = np.datetime_as_string(seconds.astype('datetime64[s]'), unit='s', timezone='UTC')
+    return result
+
+
+def filter_mask(columns):
+    """
+    Vectorized version of normalize.filter_message().  Returns a boolean array that is True for messages that
+    should be kept
+
+    The 'error' column is either a boolean array that is True for messages with an error, as returned by
+    messages_to_columns(), or the error values, where any value other than None is an error
+    """
+    size = len(next(iter(columns.values()))) if columns else 0
+    ids = _float_column(columns, 'id', size)
+    mmsi = _float_column(columns, 'mmsi', size)
+    timestamps = _float_column(columns, 'tagblock_timestamp', size)
+
+    mask = ~np.isnan(mmsi) & np.isin(ids, list(AIS_TYPES)) & (timestamps >= 946684800)    # Jan 1 2000 UTC
+    errors = columns.get('error')
+    if errors is not None:
+        errors = np.asarray(errors)
+        if errors.dtype == bool:
+            mask &= ~errors
+        else:
+            mask &= np.array([e is None for e in errors], dtype=bool)
+    return mask
+
+
+def normalize_columns(columns):
+    """
+    Normalize a batch of messages given as columns.  See COLUMNAR_FIELDS for the input columns that are used,
+    and any that are not present are treated as missing for every message.
+
+    Returns (normalized, mask) where normalized is a dict of output columns using the same names and values as
+    normalize_transform.DEFAULT_FIELD_TRANSFORMS, and mask is the result of filter_mask().  Output columns
+    contain values for every input row, so apply the mask to keep only the messages that pass the filter
+    """
+    size = len(next(iter(columns.values()))) if columns else 0
+
+    def column(name):
+        return _float_column(columns, name, size)
+
+    x = column('x')
+    y = column('y')
+    x_type = coord_type_codes(x, -180, 180, 181)
+    y_type = coord_type_codes(y, -90, 90, 91)
+    pos_type = np.where(x_type == y_type, x_type, POSITION_TYPE.INVALID.value)
+    pos_type[pos_type == POSITION_TYPE.NULL.value] = 0
+
+    imo = column('imo_num')
+    draught = column('draught')
+
+    normalized = {
+        'timestamp': format_timestamps(column('tagblock_timestamp')),
+        'lon': np.where(x_type == POSITION_TYPE.VALID.value, round_half_even(np.nan_to_num(x), 5), np.nan),
+        'lat': np.where(y_type == POSITION_TYPE.VALID.value, round_half_even(np.nan_to_num(y), 5), np.nan),
+        'pos_type': _position_type_names[pos_type],
+        'course': _in_range_rounded(column('cog'), 0, 359.9, 1),
+        'heading': _in_range_rounded(column('true_heading'), 0, 359, 0),
+        'speed': _in_range_rounded(column('sog'), 0.0, 102.2, 1),
+        'imo': np.where((1 <= imo) & (imo < 1073741824), imo, np.nan),
+        'length': column('dim_a') + column('dim_b'),
+        'width': column('dim_c') + column('dim_d'),
+        'draught': np.where(draught > 0, draught, np.nan),
+    }
+    return normalized, filter_mask(columns)
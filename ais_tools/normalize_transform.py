@@ -1,5 +1,21 @@
+import collections
+import itertools
+import multiprocessing
+from typing import Any
+from typing import Optional
+from typing import Union
+from typing import get_args
+from typing import get_origin
+from typing import get_type_hints
+import xxhash
+
+from ais import DecodeError
+
 from ais_tools import normalize
 from ais_tools import shiptypes
+from ais_tools.aivdm import AIVDM
+from ais_tools.tagblock import extract as extract_tagblock_fields
+from ais_tools.transcode import ARMORED_MESSAGE_TYPES
 
 
 DEFAULT_FIELD_TRANSFORMS = (
@@ -29,7 +45,309 @@ DEFAULT_FIELD_TRANSFORMS = (
     ('dedup_key', normalize.normalize_dedup_key, {}),
 )
 
+# types for fields in DEFAULT_FIELD_TRANSFORMS where the transform function does not specify the type
+DEFAULT_FIELD_TYPES = {
+    'msgid': str,
+    'source': str,
+    'receiver': str,
+    'status': int,
+    'class_b_cs_flag': int,
+}
+
+
+def transform_field_types(transforms=DEFAULT_FIELD_TRANSFORMS, overrides=None) -> dict:
+    """
+    Get the type of each output field of a list of transforms, from the return annotation of the transform function,
+    for example Optional[float] gives float.  Types in overrides take precedence, and DEFAULT_FIELD_TYPES is used
+    when overrides is None.
+
+    Returns a dict of field name to type, in the same order as the transforms.  Transforms with key '*' are skipped
+
+    raises ValueError if the type cannot be determined for a field
+    """
+    overrides = DEFAULT_FIELD_TYPES if overrides is None else overrides
+    types = {}
+    for key, fn, _ in transforms:
+        if key == '*':
+            continue
+        if key in overrides:
+            types[key] = overrides[key]
+            continue
+        return_type = get_type_hints(fn).get('return')
+        args = [arg for arg in get_args(return_type) if arg is not type(None)]
+        if get_origin(return_type) is Union and len(args) == 1:
+            return_type = args[0]
+        if return_type is Any or not isinstance(return_type, type):
+            raise ValueError(f'Unable to determine the type of field {key!r} from {return_type}.  Pass the type in overrides')
+        types[key] = return_type
+    return types
+
+
+class MessageDeduplicator:
+    """
+    Drop duplicate messages from a stream, using the same key as normalize_dedup_key() stored as a 64 bit int
+
+    Keys are kept in buckets by the minute of the message timestamp.  When a message arrives with a timestamp
+    more than window_minutes after the oldest bucket, whole buckets are expired, so memory is bounded by the
+    number of distinct messages in the time window.  A message that is older than the window cannot be checked
+    and is always kept, and is counted in `late`.  Messages without a key are always kept.
+
+    The stream should be roughly in timestamp order.  A single message with a timestamp far in the future will
+    expire all the current buckets.
+    """
+
+    def __init__(self, window_minutes=60):
+        self.window_minutes = window_minutes
+        self.buckets = {}
+        self.newest_minute = None
+        self.kept = 0
+        self.dropped = 0
+        self.late = 0
+
+    def is_duplicate(self, message) -> bool:
+        """
+        Returns True if the message has already been seen in the time window, otherwise records the message
+        and returns False
+        """
+        parts = normalize.dedup_key_parts(message)
+        if parts is None:
+            self.kept += 1
+            return False
+
+        minute, data = parts
+        bucket = self.buckets.get(minute)
+        if bucket is None:
+            if self.newest_minute is None or minute > self.newest_minute:
+                self.newest_minute = minute
+                self.expire(minute - self.window_minutes)
+            elif minute <= self.newest_minute - self.window_minutes:
+                self.late += 1
+                self.kept += 1
+                return False
+            bucket = self.buckets[minute] = set()
+
+        key = xxhash.xxh3_64_intdigest(data)
+        if key in bucket:
+            self.dropped += 1
+            return True
+        bucket.add(key)
+        self.kept += 1
+        return False
+
+    def expire(self, minute):
+        """Remove all buckets for minutes before or equal to minute"""
+        for m in [m for m in self.buckets if m <= minute]:
+            del self.buckets[m]
+
+    def dedup(self, messages):
+        """Yield the messages that are not duplicates"""
+        is_duplicate = self.is_duplicate
+        for message in messages:
+            if not is_duplicate(message):
+                yield message
+
+    def stats(self):
+        return dict(kept=self.kept, dropped=self.dropped, late=self.late,
+                    buckets=len(self.buckets), keys=sum(len(b) for b in self.buckets.values()))
+
+
+def dedup_messages(messages, window_minutes=60, deduplicator=None):
+    """
+    Drop duplicate messages from a stream of decoded messages.  See MessageDeduplicator
+
+    Pass in a MessageDeduplicator to get the drop and keep counts after the stream has been consumed
+    """
+    deduplicator = deduplicator or MessageDeduplicator(window_minutes=window_minutes)
+    yield from deduplicator.dedup(messages)
+
+
+def normalize_and_filter_messages(messages, transforms=DEFAULT_FIELD_TRANSFORMS, deduplicator=None):
+    """
+    Filter and normalize a stream of decoded messages
+
+    Pass in a MessageDeduplicator to also drop duplicate messages.  Duplicates are removed after filtering
+    and before normalizing
+    """
+    messages = filter(normalize.filter_message, messages)
+    if deduplicator is not None:
+        messages = deduplicator.dedup(messages)
+    yield from map(normalize.compile_transforms(transforms), messages)
+
+
+def armored_message_type(line) -> Optional[int]:
+    """
+    Get the AIS message type from the first armored character of the payload of a line of nmea, without
+    decoding the message.  Returns None if the type cannot be determined cheaply, which includes a multipart
+    message where the first part in the line is not sentence 1
+
+    line may be either str or bytes
+    """
+    if isinstance(line, bytes):
+        bang, comma, tagblock_end = b'!', b',', b'\\!'
+    else:
+        bang, comma, tagblock_end = '!', ',', '\\!'
+
+    if line[:1] == bang:
+        start = 0
+    else:
+        start = line.find(tagblock_end) + 1
+        if start == 0:
+            return None
+    fields = line[start:start + 40].split(comma, 6)
+    if len(fields) < 6 or fields[2] not in ('1', b'1') or not fields[5]:
+        return None
+
+    c = fields[5][0]
+    c = ord(c) if isinstance(c, str) else c
+    return ARMORED_MESSAGE_TYPES[c] if c < 256 else None
+
+
+class LineNormalizer:
+    """
+    Decode and normalize lines of nmea in a single step, applying the checks in normalize.filter_message()
+    to the raw line before decoding where possible.
+
+    Lines with a message type that would be filtered, found from the first armored character of the payload,
+    or with a tagblock timestamp that would be filtered or no tagblock at all, are skipped without being decoded.  Lines where this
+    cannot be determined cheaply are decoded and filtered as usual.  The counts of lines that were skipped,
+    decoded, filtered after decoding and output are kept on the instance, see stats()
+
+    If source is given it is added to each message before normalizing, and if uuid_algorithm is not None a
+    uuid is added using that algorithm.  Pass a MessageDeduplicator to drop duplicates before normalizing.
+    """
+
+    def __init__(self, decoder=None, transforms=DEFAULT_FIELD_TRANSFORMS, source=None, uuid_algorithm='md5',
+                 deduplicator=None):
+        self.decoder = decoder or AIVDM()
+        self.transforms = transforms
+        self.normalize_message = normalize.compile_transforms(transforms)
+        self.source = source
+        self.uuid_algorithm = uuid_algorithm
+        self.deduplicator = deduplicator
+        self.skipped_type = 0
+        self.skipped_timestamp = 0
+        self.decoded = 0
+        self.filtered = 0
+        self.normalized = 0
+
+    def skip_line(self, line) -> bool:
+        """
+        Returns True if the line would certainly be removed by normalize.filter_message() after decoding
+        """
+        first = line[:1]
+        if first in ('{', b'{'):
+            # json input may have any fields, so it has to be decoded to check
+            return False
+
+        message_type = armored_message_type(line)
+        if message_type is None:
+            return False
+        if message_type not in normalize.AIS_TYPES:
+            self.skipped_type += 1
+            return True
+
+        if first in ('!', b'!') and line.find(b'\\' if isinstance(line, bytes) else '\\') < 0:
+            # there are no tagblocks, so there is no timestamp
+            self.skipped_timestamp += 1
+            return True
+
+        try:
+            timestamp, = extract_tagblock_fields(line, keys=('c',))
+        except DecodeError:
+            return False
+        if timestamp is not None and timestamp < 946684800:       # Jan 1 2000 UTC
+            self.skipped_timestamp += 1
+            return True
+        return False
+
+    def decode(self, lines):
+        """Yield decoded messages for the lines that pass the pre-decode checks and normalize.filter_message()"""
+        for line in lines:
+            if self.skip_line(line):
+                continue
+            message = self.decoder.safe_decode(line)
+            self.decoded += 1
+            if not normalize.filter_message(message):
+                self.filtered += 1
+                continue
+            if self.source is not None:
+                message.add_source(self.source)
+            if self.uuid_algorithm is not None:
+                message.add_uuid(algorithm=self.uuid_algorithm)
+            yield message
+
+    def normalize(self, lines):
+        """Yield normalized messages for a stream of nmea lines"""
+        messages = self.decode(lines)
+        if self.deduplicator is not None:
+            messages = self.deduplicator.dedup(messages)
+        for message in messages:
+            self.normalized += 1
+            yield self.normalize_message(message)
+
+    def stats(self):
+        return dict(skipped_type=self.skipped_type, skipped_timestamp=self.skipped_timestamp, decoded=self.decoded,
+                    filtered=self.filtered, normalized=self.normalized)
+
+    def _reset_stats(self):
+        for key in self.stats():
+            setattr(self, key, 0)
+
+    def _add_stats(self, stats):
+        for key, value in stats.items():
+            setattr(self, key, getattr(self, key) + value)
+
+    def _worker_config(self):
+        # settings used to create the LineNormalizer in each worker process, see _init_worker_normalizer()
+        return dict(transforms=self.transforms, source=self.source, uuid_algorithm=self.uuid_algorithm)
+
+    def normalize_parallel(self, lines, workers=4, batch_size=1000):
+        """
+        Same as normalize(), but the lines are divided into batches of batch_size that are decoded and normalized
+        in worker processes.  The output order is preserved.
+
+        The workers use the default decoder, and the transforms must be picklable.  Deduplication is not supported
+        because it needs to see every message in one place
+
+        raises ValueError if this normalizer has a deduplicator
+        """
+        if self.deduplicator is not None:
+            raise ValueError('Deduplication is not supported with more than one worker')
+
+        lines = iter(lines)
+        pending = collections.deque()
+        with multiprocessing.Pool(workers, initializer=_init_worker_normalizer,
+                                  initargs=(self._worker_config(),)) as pool:
+            while True:
+                # keep a limited number of batches in flight so that the input is not read all at once
+                while len(pending) < workers * 2 and (batch := list(itertools.islice(lines, batch_size))):
+                    pending.append(pool.apply_async(_normalize_batch, (batch,)))
+                if not pending:
+                    break
+                messages, stats = pending.popleft().get()
+                self._add_stats(stats)
+                yield from messages
+
+
+# the LineNormalizer in a worker process, created once when the worker starts by _init_worker_normalizer()
+_worker_normalizer = None
+
+
+def _init_worker_normalizer(config):
+    global _worker_normalizer
+    _worker_normalizer = LineNormalizer(**config)
+
+
+def _normalize_batch(lines):
+    # normalize lines in a worker process, and return the messages and the stats for just these lines
+    normalizer = _worker_normalizer
+    normalizer._reset_stats()
+    messages = list(normalizer.normalize(lines))
+    return messages, normalizer.stats()
+
 
-def normalize_and_filter_messages(messages, transforms=DEFAULT_FIELD_TRANSFORMS):
-    yield from map(lambda message: normalize.normalize_message(message, transforms),
-                   filter(normalize.filter_message, messages))
+def decode_and_normalize(lines, **kwargs):
+    """
+    Decode, filter and normalize a stream of nmea lines.  See LineNormalizer for the arguments
+    """
+    yield from LineNormalizer(**kwargs).normalize(lines)
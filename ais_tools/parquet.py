@@ -0,0 +1,116 @@
+"""
+Write normalized messages to Parquet files using pyarrow
+
+Requires pyarrow, which can be installed with
+
+    pip install ais-tools[parquet]
+
+The schema is derived from the normalize transforms with normalize_transform.transform_field_types(), so each
+output field gets a typed column.  Records are collected into Arrow record batches as they are written, and the
+batches are written out as a row group when the row group reaches row_group_size rows or row_group_bytes bytes.
+"""
+
+from ais_tools.normalize_transform import DEFAULT_FIELD_TRANSFORMS
+from ais_tools.normalize_transform import transform_field_types
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    raise ImportError('ais_tools.parquet requires pyarrow.  Install it with pip install ais-tools[parquet]')
+
+
+ARROW_TYPES = {
+    str: pa.string(),
+    float: pa.float64(),
+    int: pa.int64(),
+    bool: pa.bool_(),
+}
+
+
+def transforms_schema(transforms=DEFAULT_FIELD_TRANSFORMS, overrides=None) -> pa.Schema:
+    """
+    Create an Arrow schema for the output of a list of normalize transforms.  overrides is a dict of field name to
+    either a python type or an Arrow DataType, see normalize_transform.transform_field_types()
+    """
+    fields = []
+    for key, field_type in transform_field_types(transforms, overrides).items():
+        if not isinstance(field_type, pa.DataType):
+            try:
+                field_type = ARROW_TYPES[field_type]
+            except KeyError:
+                raise ValueError(f'No Arrow type for field {key!r} with type {field_type}')
+        fields.append(pa.field(key, field_type))
+    return pa.schema(fields)
+
+
+class ParquetMessageWriter:
+    """
+    Stream normalized messages into a Parquet file
+
+    where is a file path or a writable binary file object.  Fields in the messages that are not in the
+    schema are ignored, and fields in the schema that are missing from a message are written as null.
+
+    Messages are converted to a record batch every batch_size messages, and a row group is written when the
+    buffered batches reach row_group_size rows or row_group_bytes bytes of Arrow data, whichever comes first.
+    compression is any codec supported by pyarrow, for example 'zstd', 'snappy', 'gzip' or 'none'
+
+    Use as a context manager, or call close() when done
+    """
+
+    def __init__(self, where, schema=None, transforms=DEFAULT_FIELD_TRANSFORMS, overrides=None,
+                 row_group_size=100000, row_group_bytes=64 * 1024 * 1024, compression='zstd', batch_size=10000):
+        self.schema = schema or transforms_schema(transforms, overrides)
+        self.row_group_size = row_group_size
+        self.row_group_bytes = row_group_bytes
+        self.batch_size = min(batch_size, row_group_size) if row_group_size else batch_size
+        self.writer = pq.ParquetWriter(where, self.schema, compression=compression)
+        self.names = self.schema.names
+        self.rows = []
+        self.batches = []
+        self.batch_rows = 0
+        self.batch_bytes = 0
+        self.row_groups = 0
+        self.count = 0
+
+    def write(self, message):
+        self.rows.append(message)
+        if len(self.rows) >= self.batch_size:
+            self._make_batch()
+
+    def write_all(self, messages):
+        for message in messages:
+            self.write(message)
+
+    def _make_batch(self):
+        if self.rows:
+            columns = [[row.get(name) for row in self.rows] for name in self.names]
+            batch = pa.record_batch(columns, schema=self.schema)
+            self.batches.append(batch)
+            self.batch_rows += batch.num_rows
+            self.batch_bytes += batch.nbytes
+            self.count += batch.num_rows
+            self.rows = []
+        if ((self.row_group_size and self.batch_rows >= self.row_group_size)
+                or (self.row_group_bytes and self.batch_bytes >= self.row_group_bytes)):
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if self.batches:
+            table = pa.Table.from_batches(self.batches, schema=self.schema)
+            self.writer.write_table(table, row_group_size=table.num_rows)
+            self.row_groups += 1
+            self.batches = []
+            self.batch_rows = 0
+            self.batch_bytes = 0
+
+    def close(self):
+        self._make_batch()
+        self._write_row_group()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
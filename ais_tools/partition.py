@@ -0,0 +1,288 @@
+"""
+Split a stream of nmea into files by station, time or message type
+
+Each line is written to a file with a path made from a template such as '{station}/{date}/{hour}.nmea.gz', using
+values taken from the tagblock with ais_tools.core.extract_tagblock_fields() and the message type from the first
+character of the payload, so the messages are never decoded.  See TEMPLATE_FIELDS for the fields that can be used
+in a template.  Files are compressed according to their extension, see ais_tools.fileio.
+
+Only a limited number of files are kept open at once, see OpenFileCache, so a stream can be split into many
+more partitions than there are available file descriptors.
+
+The later parts of a multipart message usually have no station or timestamp in their tagblock, so they are written
+to the same file as the first part of the message.  Parts that arrive before the first part are held until it
+arrives, and parts that are never matched are written with the value 'unknown' for every field.
+"""
+
+import collections
+import os
+import re
+import string
+from datetime import datetime
+from datetime import timezone
+
+from ais_tools.core import extract_tagblock_fields
+from ais_tools.fileio import open_compressed_raw
+from ais_tools.transcode import ARMORED_MESSAGE_TYPES
+
+
+DEFAULT_TEMPLATE = '{station}/{date}/{hour}.nmea'
+
+TEMPLATE_FIELDS = {
+    'station': 'the tagblock station (s)',
+    'date': 'the date of the tagblock timestamp (c) as YYYY-MM-DD',
+    'year': 'the year of the tagblock timestamp as YYYY',
+    'month': 'the month of the tagblock timestamp as MM',
+    'day': 'the day of the tagblock timestamp as DD',
+    'hour': 'the hour of the tagblock timestamp as HH',
+    'type': 'the AIS message type',
+}
+
+UNKNOWN = 'unknown'
+
+_time_fields = {'date', 'year', 'month', 'day', 'hour'}
+
+
+def template_fields(template):
+    """
+    Returns the set of fields used in a partition template
+
+    raises ValueError if the template uses a field that is not in TEMPLATE_FIELDS
+    """
+    fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+    for field in sorted(fields):
+        if field not in TEMPLATE_FIELDS:
+            raise ValueError('Unknown template field {{{}}}.  Must be one of {}'.format(
+                field, ', '.join(TEMPLATE_FIELDS)))
+    return fields
+
+
+def safe_path_value(value):
+    """Make a field value safe to use as part of a file path"""
+    value = re.sub(r'[^\w.-]', '_', str(value))
+    return UNKNOWN if value in ('', '.', '..') else value
+
+
+class OpenFileCache:
+    """
+    Write to many files while keeping at most max_open of them open.  Writes to each file are buffered until
+    there are buffer_size bytes.  When a file needs to be opened and max_open files are already open, the least
+    recently written file is flushed and closed.
+
+    Each file is truncated the first time it is opened, unless append is True, and appended to after that.
+    Reopened compressed files have another compressed stream appended, which all of the supported compression
+    formats read back as a single file
+    """
+
+    def __init__(self, max_open=256, buffer_size=1 << 16, compression_level=None, append=False):
+        self.max_open = max_open
+        self.buffer_size = buffer_size
+        self.compression_level = compression_level
+        self.append = append
+        self.files = collections.OrderedDict()
+        self.opened = set()
+        self.directories = set()
+        self.opens = 0
+        self.evictions = 0
+
+    def _open(self, path):
+        while len(self.files) >= self.max_open:
+            self._close(*self.files.popitem(last=False))
+            self.evictions += 1
+
+        directory = os.path.dirname(path)
+        if directory and directory not in self.directories:
+            os.makedirs(directory, exist_ok=True)
+            self.directories.add(directory)
+
+        mode = 'ab' if self.append or path in self.opened else 'wb'
+        entry = self.files[path] = [open_compressed_raw(path, mode, level=self.compression_level), [], 0]
+        self.opened.add(path)
+        self.opens += 1
+        return entry
+
+    @staticmethod
+    def _flush(entry):
+        f, buffer, _ = entry
+        if buffer:
+            f.write(b''.join(buffer))
+            buffer.clear()
+            entry[2] = 0
+
+    def _close(self, path, entry):
+        try:
+            self._flush(entry)
+        finally:
+            entry[0].close()
+
+    def write(self, path, data):
+        """Write bytes to the file at path, opening it if needed"""
+        entry = self.files.get(path)
+        if entry is None:
+            entry = self._open(path)
+        else:
+            self.files.move_to_end(path)
+        entry[1].append(data)
+        entry[2] += len(data)
+        if entry[2] >= self.buffer_size:
+            self._flush(entry)
+
+    def close(self):
+        """Flush and close all open files"""
+        while self.files:
+            self._close(*self.files.popitem(last=False))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Partitioner:
+    """
+    Write lines of nmea to files under output_dir with paths made from template.  See TEMPLATE_FIELDS for the
+    fields that can be used in the template, and OpenFileCache for max_open, buffer_size, compression_level
+    and append.
+
+    Up to max_groups multipart messages are tracked at once so that their later parts can be written to the same
+    file as the first part.  A message stops being tracked once all of its parts have been written, so that a
+    later message that reuses the same group or sequence id is not matched with it
+
+    raises ValueError if the template uses an unknown field
+    """
+
+    def __init__(self, output_dir, template=DEFAULT_TEMPLATE, max_open=256, buffer_size=1 << 16,
+                 compression_level=None, append=False, max_groups=10000):
+        self.output_dir = output_dir
+        self.template = template
+        self.fields = template_fields(template)
+        self.files = OpenFileCache(max_open=max_open, buffer_size=buffer_size,
+                                   compression_level=compression_level, append=append)
+        self.max_groups = max_groups
+        self.groups = collections.OrderedDict()
+        self.held = collections.OrderedDict()
+        self.paths = {}
+        self.hours = {}
+        self.lines = 0
+        self.unmatched_parts = 0
+
+    def _time_values(self, timestamp):
+        hour = int(timestamp // 3600)
+        values = self.hours.get(hour)
+        if values is None:
+            t = datetime.fromtimestamp(hour * 3600, tz=timezone.utc)
+            values = self.hours[hour] = dict(date=t.strftime('%Y-%m-%d'), year=t.strftime('%Y'),
+                                             month=t.strftime('%m'), day=t.strftime('%d'), hour=t.strftime('%H'))
+        return values
+
+    def _path(self, station, timestamp, message_type):
+        key = (station, timestamp // 3600 if timestamp is not None and self.fields & _time_fields else None,
+               message_type if 'type' in self.fields else None)
+        path = self.paths.get(key)
+        if path is None:
+            values = dict.fromkeys(TEMPLATE_FIELDS, UNKNOWN)
+            if station is not None:
+                values['station'] = safe_path_value(station)
+            if timestamp is not None:
+                values.update(self._time_values(timestamp))
+            if message_type is not None:
+                values['type'] = str(message_type)
+            if len(self.paths) > 100000:
+                self.paths.clear()
+            path = self.paths[key] = os.path.join(self.output_dir, self.template.format_map(values))
+        return path
+
+    def write_line(self, line):
+        """Write a line of nmea as bytes to its partition"""
+        line = line.rstrip(b'\r\n')
+        if not line.strip():
+            return
+        self.lines += 1
+        line += b'\n'
+
+        station = timestamp = group = None
+        if line[:1] == b'\\' and line[1:2] != b'!':
+            try:
+                timestamp, station, group = extract_tagblock_fields(line, ('c', 's', 'g'))
+            except ValueError:
+                pass
+        sentence = line[line.find(b'!'):]
+        fields = sentence.split(b',', 6)
+        if len(fields) < 7:
+            return self.files.write(self._path(station, timestamp, None), line)
+
+        total, part = fields[1], fields[2]
+        message_type = None
+        if part == b'1' and fields[5]:
+            message_type = ARMORED_MESSAGE_TYPES[fields[5][0]]
+
+        # a line with more than one sentence is a multipart message that is already joined
+        if total == b'1' or b'!' in sentence[1:]:
+            return self.files.write(self._path(station, timestamp, message_type), line)
+
+        key = group.split('-')[-1] if group else (station, fields[3], fields[4])
+        if part == b'1':
+            path = self._path(station, timestamp, message_type)
+            self.files.write(path, line)
+            try:
+                remaining = int(total) - 1
+            except ValueError:
+                return
+
+            # write any later parts of this message that arrived first
+            held = self.held.pop(key, [])
+            for held_line in held[:remaining]:
+                self.files.write(path, held_line)
+            if held[remaining:]:
+                self.held[key] = held[remaining:]
+            remaining -= len(held[:remaining])
+
+            # track the message until all of its parts have been written, since group and sequence ids are reused
+            self.groups.pop(key, None)
+            if remaining > 0:
+                self.groups[key] = [path, remaining]
+                if len(self.groups) > self.max_groups:
+                    self.groups.popitem(last=False)
+        elif key in self.groups:
+            entry = self.groups[key]
+            self.files.write(entry[0], line)
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self.groups[key]
+        else:
+            self.held.setdefault(key, []).append(line)
+            if len(self.held) > self.max_groups:
+                self._write_unmatched(self.held.popitem(last=False)[1])
+
+    def write_lines(self, lines):
+        """Write lines of nmea as bytes to their partitions"""
+        for line in lines:
+            self.write_line(line)
+
+    def _write_unmatched(self, lines):
+        path = self._path(None, None, None)
+        for line in lines:
+            self.unmatched_parts += 1
+            self.files.write(path, line)
+
+    def close(self):
+        """Write any multipart message parts that were never matched, and close all files"""
+        try:
+            while self.held:
+                self._write_unmatched(self.held.popitem(last=False)[1])
+        finally:
+            self.files.close()
+
+    def stats(self):
+        return dict(lines=self.lines,
+                    partitions=len(self.files.opened),
+                    opens=self.files.opens,
+                    evictions=self.files.evictions,
+                    unmatched_parts=self.unmatched_parts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,244 @@
+"""
+Compact record types for holding large numbers of decoded AIS messages in memory
+
+A Message is a dict, which costs around 1-2 KB per decoded message.  The record types here
+store the same values in __slots__ using a fixed field table for each message family, which is
+several times smaller.  Any keys that are not in the field table are kept in a small dict, and the
+order of the keys is kept in a tuple that is shared between records with the same keys, so
+to_message() returns the same keys, values and key order as the original message, including keys
+with a value of None.
+
+Records support the same get() / [] / in access as Message, and add_uuid(), add_source() and
+add_parser_version().
+
+Records are created from a decoded Message, so decoding to a record takes slightly longer than
+decoding to a Message.  The saving is in the memory used to hold the decoded messages
+"""
+
+from ais_tools.message import Message
+from ais_tools.message import MessageMethods
+
+
+common_fields = (
+    'nmea',
+    'source',
+    'uuid',
+    'parser',
+    'error',
+    'tagblock_timestamp',
+    'tagblock_station',
+    'tagblock_groupsize',
+    'tagblock_sentence',
+    'tagblock_id',
+    'tagblock_channel',
+    'talker_id',
+    'id',
+    'repeat_indicator',
+    'mmsi',
+    'spare',
+)
+
+position_fields = (
+    'nav_status',
+    'rot_over_range',
+    'rot',
+    'sog',
+    'position_accuracy',
+    'x',
+    'y',
+    'cog',
+    'true_heading',
+    'timestamp',
+    'special_manoeuvre',
+    'raim',
+    'sync_state',
+    'slot_timeout',
+    'slot_offset',
+    'slot_number',
+    'received_stations',
+    'utc_hour',
+    'utc_min',
+    'utc_spare',
+    'slot_increment',
+    'slots_to_allocate',
+    'keep_flag',
+    'spare2',
+    'unit_flag',
+    'display_flag',
+    'dsc_flag',
+    'band_flag',
+    'm22_flag',
+    'assigned_mode',
+    'commstate_flag',
+    'commstate',
+    'gnss',
+    'type_and_cargo',
+    'dim_a',
+    'dim_b',
+    'dim_c',
+    'dim_d',
+    'fix_type',
+    'dte',
+    'name',
+)
+
+static_fields = (
+    'ais_version',
+    'imo_num',
+    'callsign',
+    'name',
+    'type_and_cargo',
+    'dim_a',
+    'dim_b',
+    'dim_c',
+    'dim_d',
+    'fix_type',
+    'eta_month',
+    'eta_day',
+    'eta_hour',
+    'eta_minute',
+    'draught',
+    'destination',
+    'dte',
+    'part_num',
+    'vendor_id',
+    'vendor_id_1371_4',
+    'vendor_model',
+    'vendor_serial',
+)
+
+
+# maximum number of distinct key orders that are shared between records
+MAX_SHARED_KEY_ORDERS = 1024
+
+_shared_key_orders = {}
+
+_missing = object()
+
+
+def _shared_keys(keys):
+    # return the shared copy of a tuple of keys, so records with the same keys in the same order use one tuple
+    shared = _shared_key_orders.get(keys)
+    if shared is None:
+        if len(_shared_key_orders) >= MAX_SHARED_KEY_ORDERS:
+            return keys
+        shared = _shared_key_orders[keys] = keys
+    return shared
+
+
+class Record(MessageMethods):
+    """
+    Base class for compact message records.  Subclasses define the field table in `fields`,
+    and must also declare the same names in __slots__
+
+    Use Record.from_message() to create a record of the right type for a message
+    """
+    __slots__ = ('_extra', '_keys')
+    fields = ()
+
+    def __init__(self, **kwargs):
+        self._extra = None
+        self._keys = ()
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.field_set = frozenset(cls.fields)
+
+    @classmethod
+    def from_message(cls, message):
+        """
+        Create a record from a Message or other dict.  When called on Record, the record type is
+        chosen using the message id
+        """
+        if cls is Record:
+            cls = record_types.get(message.get('id'), MessageRecord)
+        record = cls.__new__(cls)
+        field_set = cls.field_set
+        extra = None
+        for key, value in message.items():
+            if key in field_set:
+                setattr(record, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        record._extra = extra
+        record._keys = _shared_keys(tuple(message))
+        return record
+
+    def to_message(self):
+        field_set = self.field_set
+        extra = self._extra
+        message = Message()
+        message.update((key, getattr(self, key) if key in field_set else extra[key]) for key in self._keys)
+        return message
+
+    def get(self, key, default=None):
+        if key in self.field_set:
+            return getattr(self, key, default)
+        elif self._extra:
+            return self._extra.get(key, default)
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._keys = _shared_keys(self._keys + (key,))
+        if key in self.field_set:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_message()
+        return self.to_message() == other
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, dict(self.to_message()))
+
+    @property
+    def nmea(self):
+        return self.get('nmea', '')
+
+
+class MessageRecord(Record):
+    """Record for any message type, holding just the common fields"""
+    fields = common_fields
+    __slots__ = fields
+
+
+class PositionRecord(Record):
+    """Record for position reports, message types 1, 2, 3, 18, 19 and 27"""
+    fields = common_fields + position_fields
+    __slots__ = fields
+
+
+class StaticRecord(Record):
+    """Record for static and voyage data, message types 5 and 24"""
+    fields = common_fields + static_fields
+    __slots__ = fields
+
+
+record_types = {
+    1: PositionRecord,
+    2: PositionRecord,
+    3: PositionRecord,
+    18: PositionRecord,
+    19: PositionRecord,
+    27: PositionRecord,
+    5: StaticRecord,
+    24: StaticRecord,
+}
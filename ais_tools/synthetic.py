@@ -0,0 +1,390 @@
+"""
+Generate synthetic AIS traffic as NMEA for load testing
+
+SyntheticAIS simulates a fleet of vessels moving along gpxpy tracks, and emits position and static reports for
+them as tagblock NMEA lines, received by one or more stations.  The mix of message types is configurable, and
+the stream can include the things that make real feeds hard to process: duplicate messages received by more
+than one station, multipart type 5 messages with the parts delayed or out of order, and corrupted lines.
+
+Types 18, 19 and 24 are encoded with the ais-tools encoders.  There are no encoders for types 1, 2, 3 and 5 in
+ais_tools.ais, so the bit layouts for those are defined here
+"""
+
+import heapq
+import random
+import time
+
+from gpxpy.geo import LocationDelta
+from gpxpy.gpx import GPXTrackPoint
+
+from ais_tools.ais18 import ais18_encode
+from ais_tools.ais19 import ais19_encode
+from ais_tools.ais24 import ais24_encode
+from ais_tools.ais_commstate import ais_commstate_ITDMA
+from ais_tools.ais_commstate import ais_commstate_SOTDMA
+from ais_tools.ais_commstate import ais_commstate_SOTDMA_timeout_0
+from ais_tools.core import checksum_str
+from ais_tools.tagblock import encode_tagblock
+from ais_tools.transcode import ASCII6Field as ASCII6
+from ais_tools.transcode import BoolField as Bool
+from ais_tools.transcode import LatLonField as LatLon
+from ais_tools.transcode import NmeaBits
+from ais_tools.transcode import NmeaStruct as Struct
+from ais_tools.transcode import Uint10Field as Uint10
+from ais_tools.transcode import UintField as Uint
+
+
+KNOTS_TO_METERS_PER_SECOND = 0.514444
+
+# relative frequency of each message type, roughly as seen in a terrestrial feed
+DEFAULT_TYPE_MIX = {
+    1: 45,
+    2: 2,
+    3: 8,
+    5: 10,
+    18: 20,
+    19: 1,
+    24: 14,
+}
+
+# maximum length of the payload in a single sentence
+MAX_SENTENCE_PAYLOAD = 60
+
+
+position_report_fields = Struct(
+    Uint(name='id', nbits=6, default=1),
+    Uint(name='repeat_indicator', nbits=2, default=0),
+    Uint(name='mmsi', nbits=30),
+    Uint(name='nav_status', nbits=4, default=15),
+    Uint(name='rot_raw', nbits=8, default=128),     # -128 as 8 bit two's complement, meaning not available
+    Uint10(name='sog', nbits=10, default=102.3),
+    Uint(name='position_accuracy', nbits=1, default=0),
+    LatLon(name='x', nbits=28, default=181),
+    LatLon(name='y', nbits=27, default=91),
+    Uint10(name='cog', nbits=12, default=360),
+    Uint(name='true_heading', nbits=9, default=511),
+    Uint(name='timestamp', nbits=6, default=60),
+    Uint(name='special_manoeuvre', nbits=2, default=0),
+    Uint(name='spare', nbits=3, default=0),
+    Bool(name='raim', nbits=1, default=0),
+)
+
+static_voyage_fields = Struct(
+    Uint(name='id', nbits=6, default=5),
+    Uint(name='repeat_indicator', nbits=2, default=0),
+    Uint(name='mmsi', nbits=30),
+    Uint(name='ais_version', nbits=2, default=0),
+    Uint(name='imo_num', nbits=30, default=0),
+    ASCII6(name='callsign', nbits=42, default='@@@@@@@'),
+    ASCII6(name='name_1', nbits=60),
+    ASCII6(name='name_2', nbits=60),
+    Uint(name='type_and_cargo', nbits=8, default=0),
+    Uint(name='dim_a', nbits=9, default=0),
+    Uint(name='dim_b', nbits=9, default=0),
+    Uint(name='dim_c', nbits=6, default=0),
+    Uint(name='dim_d', nbits=6, default=0),
+    Uint(name='fix_type', nbits=4, default=0),
+    Uint(name='eta_month', nbits=4, default=0),
+    Uint(name='eta_day', nbits=5, default=0),
+    Uint(name='eta_hour', nbits=5, default=24),
+    Uint(name='eta_minute', nbits=6, default=60),
+    Uint10(name='draught', nbits=8, default=0),
+    ASCII6(name='destination_1', nbits=60),
+    ASCII6(name='destination_2', nbits=60),
+    Uint(name='dte', nbits=1, default=0),
+    Uint(name='spare', nbits=1, default=0),
+)
+
+
+def position_report_encode(message):
+    """
+    Encode a class A position report, message type 1, 2 or 3.  Types 1 and 2 use SOTDMA communication state and
+    type 3 uses ITDMA
+    """
+    bits = NmeaBits(position_report_fields.nbits + 19)
+    bits.pack(position_report_fields, message)
+    if message['id'] == 3:
+        bits.pack(ais_commstate_ITDMA, message)
+    else:
+        bits.pack(ais_commstate_SOTDMA, message)
+        bits.pack(ais_commstate_SOTDMA_timeout_0, message)
+    return bits.to_nmea()
+
+
+def static_voyage_encode(message):
+    """Encode a class A static and voyage data report, message type 5"""
+    name = pad_ascii6(message.get('name', ''), 20)
+    destination = pad_ascii6(message.get('destination', ''), 20)
+    fields = dict(message, name_1=name[:10], name_2=name[10:], destination_1=destination[:10],
+                  destination_2=destination[10:], callsign=pad_ascii6(message.get('callsign', ''), 7))
+    bits = NmeaBits(static_voyage_fields.nbits)
+    bits.pack(static_voyage_fields, fields)
+    return bits.to_nmea()
+
+
+def pad_ascii6(value, length):
+    """Truncate or pad a string with '@' to exactly length characters"""
+    return value[:length].ljust(length, '@')
+
+
+def parse_type_mix(value):
+    """
+    Parse a message type mix given as a string like '1:45,5:10,18:20' into a dict of message type to weight
+
+    raises ValueError if the string is malformed or contains a message type that cannot be generated
+    """
+    mix = {}
+    for item in value.split(','):
+        try:
+            message_type, weight = item.split(':')
+            message_type, weight = int(message_type), float(weight)
+        except ValueError:
+            raise ValueError(f'Invalid type mix entry {item!r}.  Expected TYPE:WEIGHT')
+        if message_type not in DEFAULT_TYPE_MIX:
+            raise ValueError('Unable to generate message type {}.  Must be one of {}'.format(
+                message_type, ', '.join(str(t) for t in DEFAULT_TYPE_MIX)))
+        mix[message_type] = weight
+    return mix
+
+
+def split_payload(body, pad, channel='A', sequence_id=None, talker='AIVDM'):
+    """
+    Split a payload into one or more NMEA sentences.  sequence_id is used for multipart messages only
+    """
+    chunks = [body[i:i + MAX_SENTENCE_PAYLOAD] for i in range(0, len(body), MAX_SENTENCE_PAYLOAD)] or ['']
+    total = len(chunks)
+    seq = '' if total == 1 or sequence_id is None else str(sequence_id)
+    sentences = []
+    for i, chunk in enumerate(chunks, 1):
+        sentence = '{},{},{},{},{},{},{}'.format(talker, total, i, seq, channel, chunk, pad if i == total else 0)
+        sentences.append('!{}*{}'.format(sentence, checksum_str(sentence)))
+    return sentences
+
+
+def corrupt_line(line, rng):
+    """
+    Damage a line in one of the ways seen in real feeds: a changed payload character, a truncated line, or a
+    missing tagblock delimiter
+    """
+    kind = rng.randrange(3)
+    start = line.find('!')
+    if kind == 0 and start >= 0:
+        i = rng.randrange(start + 1, len(line))
+        c = line[i]
+        return line[:i] + ('0' if c != '0' else '1') + line[i + 1:]
+    elif kind == 1:
+        return line[:rng.randrange(1, len(line))]
+    else:
+        return line.lstrip('\\')
+
+
+class SyntheticVessel:
+    """
+    A simulated vessel moving along a track.  Course and speed change by a small random amount each time the
+    vessel moves
+    """
+
+    def __init__(self, rng, mmsi, latitude, longitude, timestamp):
+        self.rng = rng
+        self.mmsi = mmsi
+        self.point = GPXTrackPoint(latitude=latitude, longitude=longitude)
+        self.timestamp = timestamp
+        self.sog = round(rng.uniform(0, 20), 1)
+        self.cog = rng.uniform(0, 360)
+        self.nav_status = 0 if self.sog > 0.5 else 1
+        self.name = 'SYNTHETIC {}'.format(mmsi % 100000)
+        self.callsign = 'S{:05d}'.format(mmsi % 100000)
+        self.imo_num = 9000000 + mmsi % 1000000
+        self.type_and_cargo = rng.choice([30, 31, 36, 37, 52, 60, 70, 80])
+        self.dim_a = rng.randrange(5, 200)
+        self.dim_b = rng.randrange(5, 100)
+        self.dim_c = rng.randrange(2, 30)
+        self.dim_d = rng.randrange(2, 30)
+        self.draught = round(rng.uniform(1, 15), 1)
+        self.destination = rng.choice(['ROTTERDAM', 'SINGAPORE', 'SHANGHAI', 'LOS ANGELES', 'SANTOS', 'BUSAN'])
+
+    def move(self, timestamp):
+        """Move the vessel to where it will be at timestamp"""
+        seconds = timestamp - self.timestamp
+        if seconds > 0:
+            distance = self.sog * KNOTS_TO_METERS_PER_SECOND * seconds
+            self.point.move(LocationDelta(distance=distance, angle=self.cog))
+            if abs(self.point.latitude) > 80:
+                self.point.latitude = max(-80.0, min(80.0, self.point.latitude))
+                self.cog = (180 - self.cog) % 360
+            self.point.longitude = (self.point.longitude + 180) % 360 - 180
+            self.cog = (self.cog + self.rng.gauss(0, 2)) % 360
+            self.sog = round(max(0.0, min(30.0, self.sog + self.rng.gauss(0, 0.2))), 1)
+            self.timestamp = timestamp
+
+    def message(self, message_type, timestamp):
+        """Create a message of the given type with the current state of the vessel"""
+        message = dict(id=message_type, mmsi=self.mmsi)
+        if message_type in (1, 2, 3, 18, 19):
+            message.update(
+                x=round(self.point.longitude, 6),
+                y=round(self.point.latitude, 6),
+                sog=self.sog,
+                cog=round(self.cog, 1) % 360,
+                true_heading=round(self.cog) % 360,
+                timestamp=int(timestamp) % 60,
+            )
+        if message_type in (1, 2, 3):
+            message.update(nav_status=self.nav_status, sync_state=0, slot_timeout=0, slot_offset=0)
+        elif message_type == 18:
+            message.update(unit_flag=1)
+        elif message_type in (5, 19, 24):
+            message.update(
+                name=pad_ascii6(self.name, 20),
+                callsign=self.callsign,
+                imo_num=self.imo_num,
+                type_and_cargo=self.type_and_cargo,
+                dim_a=self.dim_a,
+                dim_b=self.dim_b,
+                dim_c=self.dim_c,
+                dim_d=self.dim_d,
+                draught=self.draught,
+                destination=self.destination,
+            )
+            if message_type == 24:
+                message['part_num'] = self.rng.randrange(2)
+                message['callsign'] = pad_ascii6(self.callsign, 7)
+                message['vendor_id'] = '@@@@@@@'
+        return message
+
+
+encoders = {
+    1: position_report_encode,
+    2: position_report_encode,
+    3: position_report_encode,
+    5: static_voyage_encode,
+    18: ais18_encode,
+    19: ais19_encode,
+    24: ais24_encode,
+}
+
+
+class SyntheticAIS:
+    """
+    Generate a stream of synthetic AIS messages as NMEA lines with tagblocks
+
+    vessels is the number of simulated vessels, which report on average once every report_interval seconds, and
+    stations is the number of receiving stations.  type_mix is a dict of message type to relative frequency,
+    see DEFAULT_TYPE_MIX.
+
+    duplicate_ratio is the fraction of messages that are also received by a second station, corruption_rate is
+    the fraction of lines that are damaged, and out_of_order_rate is the fraction of multipart messages that are
+    delivered with the parts in reverse order.  The parts of a multipart message may be separated by up to
+    max_delay other lines.
+
+    Timestamps start at start_time and advance by report_interval / vessels for each message, so a file can be
+    written as fast as possible.  If rate is given, lines() instead emits rate messages per second of real time,
+    using the current time for the timestamps.
+
+    Use seed to make the output repeatable
+    """
+
+    def __init__(self, vessels=100, stations=1, type_mix=None, duplicate_ratio=0.0, corruption_rate=0.0,
+                 out_of_order_rate=0.0, max_delay=3, start_time=1700000000.0, report_interval=10.0, rate=None,
+                 seed=None):
+        self.rng = random.Random(seed)
+        self.type_mix = type_mix or DEFAULT_TYPE_MIX
+        self.duplicate_ratio = duplicate_ratio
+        self.corruption_rate = corruption_rate
+        self.out_of_order_rate = out_of_order_rate
+        self.max_delay = max_delay
+        self.start_time = start_time
+        self.interval = report_interval / vessels
+        self.rate = rate
+        self.stations = ['synthetic-{}'.format(i) for i in range(stations)]
+
+        rng = self.rng
+        # with rate, messages use the current time, so the vessels start moving from now
+        vessel_start_time = time.time() if rate else start_time
+        self.vessels = [SyntheticVessel(rng, 200000000 + i * 1009 + rng.randrange(1000),
+                                        rng.uniform(-60, 60), rng.uniform(-180, 180), vessel_start_time)
+                        for i in range(vessels)]
+
+        self.group_id = 0
+        self.sequence_id = 0
+        self.counts = dict(messages=0, lines=0, duplicates=0, corrupted=0, out_of_order=0)
+        self.type_counts = {}
+
+    def message_lines(self, body, pad, channel, station, timestamp):
+        """
+        Make the NMEA lines with tagblocks for an encoded payload.  Payloads that do not fit in a single sentence
+        are split into a multipart message with a tagblock group
+        """
+        c = round(timestamp * 1000)
+        if len(body) <= MAX_SENTENCE_PAYLOAD:
+            sentence, = split_payload(body, pad, channel)
+            return ['\\{}\\{}'.format(encode_tagblock(tagblock_timestamp=c, tagblock_station=station), sentence)]
+
+        self.group_id = self.group_id % 9999 + 1
+        self.sequence_id = (self.sequence_id + 1) % 10
+        sentences = split_payload(body, pad, channel, self.sequence_id)
+        lines = []
+        for i, sentence in enumerate(sentences, 1):
+            group = dict(tagblock_sentence=i, tagblock_groupsize=len(sentences), tagblock_id=self.group_id)
+            if i == 1:
+                tagblock = encode_tagblock(tagblock_timestamp=c, tagblock_station=station, **group)
+            else:
+                tagblock = encode_tagblock(**group)
+            lines.append('\\{}\\{}'.format(tagblock, sentence))
+        return lines
+
+    def lines(self, count):
+        """Generate count messages, and yield the NMEA lines.  Multipart messages yield more than one line"""
+        rng = self.rng
+        types = list(self.type_mix)
+        weights = [self.type_mix[t] for t in types]
+        pending = []
+        index = 0
+        start = time.monotonic()
+
+        for i in range(count):
+            if self.rate:
+                delay = start + i / self.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                timestamp = time.time()
+            else:
+                timestamp = self.start_time + i * self.interval
+
+            vessel = rng.choice(self.vessels)
+            vessel.move(timestamp)
+            message_type = rng.choices(types, weights)[0]
+            message = vessel.message(message_type, timestamp)
+            self.type_counts[message_type] = self.type_counts.get(message_type, 0) + 1
+
+            receptions = [rng.choice(self.stations)]
+            if self.duplicate_ratio and rng.random() < self.duplicate_ratio:
+                receptions.append(rng.choice(self.stations))
+                self.counts['duplicates'] += 1
+
+            body, pad = encoders[message_type](message)
+            channel = rng.choice('AB')
+            for station in receptions:
+                self.counts['messages'] += 1
+                lines = self.message_lines(body, pad, channel, station, timestamp)
+                if len(lines) > 1 and self.out_of_order_rate and rng.random() < self.out_of_order_rate:
+                    lines.reverse()
+                    self.counts['out_of_order'] += 1
+                for n, line in enumerate(lines):
+                    if self.corruption_rate and rng.random() < self.corruption_rate:
+                        line = corrupt_line(line, rng)
+                        self.counts['corrupted'] += 1
+                    release = index + (rng.randint(0, self.max_delay) if n else 0)
+                    heapq.heappush(pending, (release, index, line))
+                    index += 1
+
+                while pending and pending[0][0] <= index:
+                    self.counts['lines'] += 1
+                    yield heapq.heappop(pending)[2]
+
+        while pending:
+            self.counts['lines'] += 1
+            yield heapq.heappop(pending)[2]
+
+    def stats(self):
+        return dict(self.counts, types={str(t): n for t, n in sorted(self.type_counts.items())})
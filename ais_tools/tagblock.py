@@ -2,16 +2,30 @@
 Utilities for encoding, decoding, and manipulating NMEA tagblocks.
 """
 
+from collections import OrderedDict
 from datetime import datetime
 from datetime import timezone
 
 from ais import DecodeError
+from ais_tools.core import checksum
 from ais_tools.core import checksum_str
+from ais_tools.core import extract_tagblock_fields
 from ais_tools.core import is_checksum_valid
 
 TAGBLOCK_T_FORMAT = '%Y-%m-%d %H.%M.%S'
 
 
+def timestamp_second(t):
+    """Returns the whole second that datetime.fromtimestamp() rounds the unix timestamp t to"""
+    second = int(t)
+    microseconds = round((t - second) * 1e6)
+    if microseconds >= 1000000:
+        second += 1
+    elif microseconds < 0:
+        second -= 1
+    return second
+
+
 def safe_tagblock_timestamp(line):
     """
     attempt to extract the tagblock timestamp without triggering any exceptions
@@ -20,20 +34,32 @@ def safe_tagblock_timestamp(line):
     """
 
     try:
-        if line.startswith("\\"):
-            tagblock = line[1:].split("\\", 1)[0]
-            tagblock = tagblock.split("*")[0]
-            for field in tagblock.split(","):
-                parts = field.split(":")
-                if len(parts) == 2:
-                    key, value = parts
-                    if key == 'c':
-                        t = int(value)
-                        return t if t <= 40000000000 else t/1000
-    except ValueError:
-        pass
+        t, = extract(line, keys=('c',))
+    except DecodeError:
+        return 0
+
+    return t or 0
+
+
+def extract(line, keys=('c', 's')):
+    """
+    Extract selected fields from the tagblock at the start of a line of nmea without parsing the whole tagblock.
+    The scan is done in C by ais_tools.core.extract_tagblock_fields()
+
+    keys are the raw tagblock keys, for example 'c' for the timestamp and 's' for the station.
 
-    return 0
+    Returns a tuple with the value for each key, or None if the key is not present. Values for c, n and r are
+    converted to numbers the same as decode_tagblock(), all other values are returned as str.  If there is more
+    than one line in a concatenated multipart message, only the tagblock of the first line is used
+
+    line may be either str or bytes
+
+    raises DecodeError if one of the requested values cannot be converted
+    """
+    try:
+        return extract_tagblock_fields(line, keys)
+    except ValueError as e:
+        raise DecodeError(str(e))
 
 
 def create_tagblock(station, timestamp=None, add_tagblock_t=True):
@@ -49,16 +75,61 @@ def create_tagblock(station, timestamp=None, add_tagblock_t=True):
     return '{}*{}'.format(param_str, checksum_str(param_str))
 
 
+class TagblockFactory:
+    """
+    Create new tagblock strings for a single station.  This gives the same result as create_tagblock(), but
+    is faster when creating a tagblock for every message in a high rate stream.
+
+    The station field is formatted once, the T field is only re-formatted when the timestamp moves into a
+    different second, and the checksum is computed by combining the cached checksum of these fields
+    with the checksum of the c field
+    """
+
+    def __init__(self, station, add_tagblock_t=True):
+        self.station = station
+        self.add_tagblock_t = add_tagblock_t
+        self._station_str = ',s:{}'.format(station)
+        self._second = None
+        self._suffix = None
+        self._suffix_checksum = None
+
+    def _update_suffix(self, t, second):
+        suffix = self._station_str
+        if self.add_tagblock_t:
+            suffix += ',T:' + datetime.fromtimestamp(t, tz=timezone.utc).strftime(TAGBLOCK_T_FORMAT)
+        self._second = second
+        self._suffix = suffix
+        self._suffix_checksum = checksum('c:') ^ checksum(suffix)
+
+    def create(self, timestamp=None):
+        """Create a new tagblock string for the given timestamp, or for the current time if not given"""
+        t = timestamp or datetime.now().timestamp()
+
+        second = timestamp_second(t)
+        if second != self._second:
+            self._update_suffix(t, second)
+
+        c = str(round(t * 1000))
+        return 'c:{}{}*{:02X}'.format(c, self._suffix, self._suffix_checksum ^ checksum(c))
+
+
 def split_tagblock(nmea):
     """
     Split off the tagblock from the rest of the message
 
     Note that if the nmea is a concatenated multipart message then only the tagblock of
     the first message will be split off
+
+    nmea may be either str or bytes, and the returned parts are the same type as nmea
     """
-    tagblock = ''
-    if nmea.startswith("\\") and not nmea.startswith("\\!"):
-        parts = nmea[1:].split("\\", 1)
+    if isinstance(nmea, bytes):
+        backslash, backslash_bang = b"\\", b"\\!"
+    else:
+        backslash, backslash_bang = "\\", "\\!"
+
+    tagblock = nmea[:0]
+    if nmea.startswith(backslash) and not nmea.startswith(backslash_bang):
+        parts = nmea[1:].split(backslash, 1)
         if len(parts) == 2:
             tagblock, nmea = parts
     return tagblock, nmea
@@ -122,7 +193,17 @@ def encode_tagblock(**kwargs):
 
 
 def decode_tagblock(tagblock_str, validate_checksum=False):
-    """Parse a tagblock string into a dict of field names and values."""
+    """
+    Parse a tagblock string into a dict of field names and values.
+
+    tagblock_str may be either str or bytes.  The field values in the returned dict are always str or int
+    """
+    if isinstance(tagblock_str, bytes):
+        try:
+            tagblock_str = tagblock_str.decode('ascii')
+        except UnicodeDecodeError:
+            raise DecodeError('Unable to decode tagblock string')
+
     tagblock = tagblock_str.rsplit("*", 1)[0]
 
     fields = {}
@@ -157,6 +238,58 @@ def decode_tagblock(tagblock_str, validate_checksum=False):
     return fields
 
 
+class TagblockCache:
+    """
+    A bounded least-recently-used cache in front of decode_tagblock(), keyed by the raw tagblock string.
+
+    Each call returns a new copy of the cached dict, so the caller is free to modify it.
+    Call stats() to get the hit rate, which can be used to decide if the cache is worth using for a feed
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, tagblock_str, validate_checksum=False):
+        return self.decode(tagblock_str, validate_checksum=validate_checksum)
+
+    def decode(self, tagblock_str, validate_checksum=False):
+        """Same as decode_tagblock(), but returns a copy of the cached result if there is one"""
+        entry = self.cache.get(tagblock_str)
+        if entry is None:
+            self.misses += 1
+            fields = decode_tagblock(tagblock_str, validate_checksum=validate_checksum)
+            self.cache[tagblock_str] = (fields, validate_checksum)
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        else:
+            self.hits += 1
+            fields, validated = entry
+            if validate_checksum and not validated:
+                if not is_checksum_valid(tagblock_str):
+                    raise DecodeError('Invalid checksum')
+                self.cache[tagblock_str] = (fields, True)
+            self.cache.move_to_end(tagblock_str)
+
+        return fields.copy()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, hit_rate=self.hit_rate,
+                    size=len(self.cache), maxsize=self.maxsize)
+
+    def clear(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+
 def update_tagblock(nmea, **kwargs):
     """Decode the existing tagblock, merge in kwargs, and re-encode."""
     tagblock_str, nmea = split_tagblock(nmea)
@@ -173,3 +306,80 @@ def safe_update_tagblock(nmea, **kwargs):
     except DecodeError:
         pass
     return nmea
+
+
+_int_keys = frozenset(['c', 'n', 'r'])
+
+
+def rewrite_tagblock(nmea, **kwargs):
+    """
+    Replace or add fields in an existing tagblock without decoding and re-encoding the whole tagblock.
+    Takes the same field names as update_tagblock().  If there is no tagblock, a new one is created
+
+    Fields that are replaced keep their position and new fields are added at the end. All other fields,
+    including the g: group, are left exactly as they are. The new checksum is computed by updating the
+    existing checksum with the xor of the old and new fields, so a tagblock with an invalid checksum
+    still has an invalid checksum afterwards.  If there is no checksum a new one is computed
+
+    raises DecodeError if the existing tagblock cannot be decoded
+    """
+    tagblock_str, nmea = split_tagblock(nmea)
+    if not tagblock_str:
+        return join_tagblock(encode_tagblock(**kwargs), nmea)
+
+    new_values = {tagblock_fields_reversed.get(k, k.replace('tagblock_', '')): v for k, v in kwargs.items()}
+
+    checksum_pos = tagblock_str.rfind('*')
+    if checksum_pos < 0:
+        body, old_checksum = tagblock_str, None
+    else:
+        body, old_checksum = tagblock_str[:checksum_pos], tagblock_str[checksum_pos + 1:]
+
+    fields = body.split(',') if body else []
+    delta = 0
+    try:
+        for i, field in enumerate(fields):
+            if not field:
+                continue
+
+            # check that the field can be decoded the same as decode_tagblock() would
+            key, value = field.split(':')
+            if key == 'g':
+                if len([int(part) for part in value.split("-") if part]) != 3:
+                    raise DecodeError('Unable to decode tagblock group')
+            elif key in _int_keys:
+                int(value)
+
+            if key in new_values:
+                new_field = key + ':' + str(new_values.pop(key))
+                delta ^= checksum(field) ^ checksum(new_field)
+                fields[i] = new_field
+    except ValueError:
+        raise DecodeError('Unable to decode tagblock string')
+
+    for key, value in new_values.items():
+        new_field = key + ':' + str(value)
+        if fields and not fields[-1]:
+            # re-use a trailing empty field
+            fields[-1] = new_field
+            delta ^= checksum(new_field)
+        else:
+            delta ^= checksum(',' + new_field if fields else new_field)
+            fields.append(new_field)
+
+    body = ','.join(fields)
+    try:
+        new_checksum = '{:02X}'.format(int(old_checksum, 16) ^ delta)
+    except (TypeError, ValueError):
+        new_checksum = checksum_str(body)
+
+    return join_tagblock('{}*{}'.format(body, new_checksum), nmea)
+
+
+def safe_rewrite_tagblock(nmea, **kwargs):
+    """Like rewrite_tagblock but returns the original nmea on DecodeError."""
+    try:
+        nmea = rewrite_tagblock(nmea, **kwargs)
+    except DecodeError:
+        pass
+    return nmea
@@ -15,6 +15,8 @@ from ais import DecodeError
 
 AIS6toASCII8 = [chr(i+48) for i in range(40)] + [chr(i+96) for i in range(24)]
 ASCII8toAIS6 = {c: i for i, c in enumerate(AIS6toASCII8)}
+# AIS message type for each value of the first byte of an armored payload, or None if it is not an armored character
+ARMORED_MESSAGE_TYPES = tuple(ASCII8toAIS6.get(chr(i)) for i in range(256))
 ASCII8toAIS6_bits = {c: int2ba(i, length=6) for i, c in enumerate(AIS6toASCII8)}
 ASCII8toAIS6_decode_tree = decodetree(ASCII8toAIS6_bits)
 
@@ -17,6 +17,7 @@ sources = [
     f"{source_path}methods.c",
     f"{source_path}module.c",
     f"{source_path}strcpy.c",
+    f"{source_path}tagblock.c",
 ]
 
 setup(
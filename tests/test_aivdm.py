@@ -3,6 +3,7 @@ import pytest
 from ais_tools import aivdm
 from ais_tools.aivdm import AIVDM
 from ais_tools.message import Message
+from ais_tools.tagblock import TagblockCache
 
 
 @pytest.mark.parametrize("nmea,expected", [
@@ -92,3 +93,26 @@ def test_missing_part():
     msg = decoder.safe_decode(nmea=nmea, best_effort=True)
     assert msg['error'] == 'Expected 2 message parts to decode but found 1'
     assert msg['tagblock_timestamp'] == 1668472438
+
+
+@pytest.mark.parametrize("nmea", [
+    '\\c:1577762601537,s:sdr-experiments,T:2019-12-30 22.23.21*5D\\!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49\n',
+    '!AIVDM,2,1,7,A,<M000000000000000000GcMvmEEEOPB6??uR0001np`R0;gbpaR@gP7GbSeH,0*63!AIVDM,2,2,7,A,OeEEEGp4Qf<,2*74',
+    '{"nmea": "!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49"}',
+])
+def test_decode_bytes(nmea):
+    decoder = AIVDM()
+    assert decoder.decode(nmea.encode()) == decoder.decode(nmea)
+
+
+def test_decode_tagblock_cache():
+    cache = TagblockCache()
+    decoder = AIVDM(tagblock_decoder=cache)
+    nmea = '\\g:1-2-2243,s:66,c:1664582400*47' \
+           '\\!AIVDM,2,1,1,B,5:U7dET2B4iE17KOS:0@Di0PTqE>22222222220l1@F65ut8?=lhCU3l,0*71' \
+           '\\g:2-2-2243*5A' \
+           '\\!AIVDM,2,2,1,B,p4l888888888880,2*36'
+    expected = AIVDM().decode(nmea)
+    assert decoder.decode(nmea) == expected
+    assert decoder.decode(nmea) == expected
+    assert cache.hits == 2
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from ais_tools.bench import build_cases
+from ais_tools.bench import compare_results
+from ais_tools.bench import load_corpus
+from ais_tools.bench import run_benchmarks
+from ais_tools.bench import run_case
+
+
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'sample', 'sample.nmea')
+
+
+def test_load_corpus_default():
+    raw, joined = load_corpus()
+    assert len(joined) == 12
+    assert len(raw) == 13
+    assert all(line.startswith('\\') for line in joined)
+
+
+def test_load_corpus_file():
+    raw, joined = load_corpus([SAMPLE_PATH])
+    assert joined
+    assert len(raw) >= len(joined)
+
+
+def test_build_cases():
+    cases = build_cases(*load_corpus())
+    for name in ['checksum', 'tagblock_parse', 'expand_nmea', 'decode_type_1', 'decode_type_5', 'decode_type_27',
+                 'encode', 'join_multipart', 'normalize', 'decode_and_normalize']:
+        assert name in cases
+    for fn, inputs in cases.values():
+        fn(inputs[0])
+
+
+@pytest.mark.parametrize("count,chunk_size,expected_count", [
+    (10, 3, 10),
+    (1, 100, 1),
+    (200, 100, 200),
+])
+def test_run_case(count, chunk_size, expected_count):
+    calls = []
+    result = run_case(calls.append, [1, 2, 3], count=count, chunk_size=chunk_size)
+    assert result['count'] == expected_count
+    assert len(calls) == expected_count + chunk_size
+    assert result['p50_us'] <= result['p90_us'] <= result['p99_us']
+    assert result['msgs_per_sec'] > 0
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(count=10, names=['checksum', 'decode'])
+    assert results['corpus'] == 'default'
+    assert 'checksum' in results['results']
+    assert 'decode_type_5' in results['results']
+    assert 'normalize' not in results['results']
+
+
+@pytest.mark.parametrize("current,base,threshold,expected", [
+    (100, 100, 0.1, False),
+    (91, 100, 0.1, False),
+    (89, 100, 0.1, True),
+    (89, 100, 0.2, False),
+    (200, 100, 0.1, False),
+])
+def test_compare_results(current, base, threshold, expected):
+    results = {'results': {'a': {'msgs_per_sec': current}, 'b': {'msgs_per_sec': 1}}}
+    baseline = {'results': {'a': {'msgs_per_sec': base}}}
+    comparison = compare_results(results, baseline, threshold)
+    assert list(comparison) == ['a']
+    assert comparison['a']['regressed'] == expected
+    assert comparison['a']['change'] == pytest.approx(current / base - 1)
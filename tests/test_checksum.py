@@ -51,3 +51,14 @@ def test_checksum_str(str, expected):
 ])
 def test_is_checksum_valid(str, expected):
     assert is_checksum_valid(str) == expected
+
+
+@pytest.mark.parametrize("str", [
+    'test',
+    '',
+    "!AIVDM,1,1,,B,35MsUdPOh8JwI:0HUwquiIFH21>i,0*09",
+])
+def test_checksum_bytes(str):
+    assert checksum(str.encode()) == checksum(str)
+    assert checksum_str(str.encode()) == checksum_str(str)
+    assert is_checksum_valid(str.encode()) == is_checksum_valid(str)
@@ -1,14 +1,23 @@
 from click.testing import CliRunner
 
+import gzip
+import io
 import json
+import pytest
 import re
 
 from ais_tools.cli import add_tagblock
 from ais_tools.cli import update_tagblock
 from ais_tools.cli import decode
+from ais_tools.cli import read_line_batches
 from ais_tools.cli import encode
 from ais_tools.cli import join_multipart
 from ais_tools.cli import cli
+from ais_tools.cli import normalize
+from ais_tools.cli import bench
+from ais_tools.cli import synthetic
+from ais_tools.cli import stats
+from ais_tools.cli import partition
 from ais_tools.tagblock import split_tagblock
 from ais_tools.tagblock import decode_tagblock
 import ais_tools
@@ -76,6 +85,38 @@ def test_decode_fail():
     assert msg['error'] == 'no valid AIVDM message detected'
 
 
+class ChunkedInput:
+    """A binary stream that returns one chunk for each read, and records the output written before each read"""
+
+    def __init__(self, chunks, output):
+        self.chunks = list(chunks)
+        self.output = output
+        self.seen = []
+
+    def read1(self, size):
+        self.seen.append(self.output.getvalue())
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+@pytest.mark.parametrize("chunks,expected", [
+    ([b'a\nb\n', b'c\n'], [[b'a\n', b'b\n'], [b'c\n']]),
+    ([b'a\nb', b'c\nd'], [[b'a\n'], [b'bc\n'], [b'd']]),
+    ([b'ab', b'c', b'\n\n'], [[b'abc\n', b'\n']]),
+    ([], []),
+])
+def test_read_line_batches(chunks, expected):
+    assert list(read_line_batches(ChunkedInput(chunks, io.BytesIO()))) == expected
+
+
+def test_decode_streaming():
+    line = b'!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73\n'
+    output = io.BytesIO()
+    input = ChunkedInput([line, line * 2], output)
+    decode.callback(input=input, output=output, quiet=True, tagblock_cache=0, use_mmap=False, workers=1)
+    # the messages from each read are written before the next read
+    assert [value.count(b'\n') for value in input.seen] == [0, 1, 3]
+
+
 def test_encode():
     runner = CliRunner()
     input = '{"id":25, "text": "TEST", "mmsi": 123456789}'
@@ -119,3 +160,232 @@ def test_join_multipart():
     expected = ['1', '3', ['2.1', '2.2'], '4', '6', ['5.1', '5.2'], ['7.1', '7.2'], '8.2']
 
     assert expected == actual
+
+
+def test_join_multipart_state_file(tmp_path):
+    state_file = str(tmp_path / 'state.json')
+    runner = CliRunner()
+    args = ['--state-file', state_file]
+    nmea = [
+        '\\t:1,s:station1*00\\!AIVDM,1,1,1,A,@,0*57',
+        '\\t:5.2*00\\!AIVDM,2,2,5,B,@,0*50',
+    ]
+    result = runner.invoke(join_multipart, input='\n'.join(nmea), args=args)
+    assert not result.exception
+    assert result.output.split() == nmea[:1]
+
+    nmea = ['\\t:5.1*00\\!AIVDM,2,1,5,B,@,0*53']
+    result = runner.invoke(join_multipart, input='\n'.join(nmea), args=args)
+    assert not result.exception
+    assert result.output.split() == ['\\t:5.1*00\\!AIVDM,2,1,5,B,@,0*53\\t:5.2*00\\!AIVDM,2,2,5,B,@,0*50']
+
+
+def test_join_multipart_workers():
+    runner = CliRunner()
+    nmea = [
+        '\\t:1,s:station1*00\\!AIVDM,1,1,1,A,@,0*57',
+        '\\t:5.2,s:station2*00\\!AIVDM,2,2,5,B,@,0*50',
+        '\\t:5.1,s:station2*00\\!AIVDM,2,1,5,B,@,0*53',
+    ]
+    result = runner.invoke(join_multipart, input='\n'.join(nmea), args=['--workers', '2'])
+    assert not result.exception
+    assert sorted(result.output.split()) == sorted([nmea[0], nmea[2] + nmea[1]])
+
+
+def test_decode_tagblock_cache():
+    runner = CliRunner()
+    input = '\\c:1599239526500,s:ais-tools,T:2020-09-04 18.12.06*5D\\!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73'
+    result = runner.invoke(decode, input='\n'.join([input, input]), args=['--tagblock-cache', '10'])
+    assert not result.exception
+    assert [json.loads(line)['mmsi'] for line in result.stdout.split('\n') if line] == [985200250, 985200250]
+    assert '"hit_rate": 0.5' in result.stderr
+
+
+NORMALIZE_INPUT = '\n'.join([
+    '\\c:1599239526500,s:ais-tools*00\\!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73',
+    '\\c:1599239526500,s:ais-tools*00\\!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73',
+    '\\c:1599239526500,s:ais-tools*00\\!AIVDM,1,1,,A,85NTES0P00J>tC4@@FOhMgvD0D0M,0*49',
+    '\\g:1-2-2243,s:66,c:1664582400*47\\!AIVDM,2,1,1,B,5:U7dET2B4iE17KOS:0@Di0PTqE>22222222220l1@F65ut8?=lhCU3l,0*71',
+    '\\g:2-2-2243*5A\\!AIVDM,2,2,1,B,p4l888888888880,2*36',
+    'INVALID NMEA',
+])
+
+
+@pytest.mark.parametrize("args", [[], ['--workers', '2']])
+def test_normalize(args):
+    runner = CliRunner()
+    result = runner.invoke(normalize, input=NORMALIZE_INPUT, args=['--source', 'test'] + args)
+    assert not result.exception
+    messages = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [m['ssvid'] for m in messages] == ['985200250', '985200250', '710011990']
+    assert all(m['source'] == 'test' for m in messages)
+    assert all('msgid' in m for m in messages)
+    stats = json.loads(result.stderr.split(':', 1)[1])
+    assert stats == {'skipped_type': 1, 'skipped_timestamp': 0, 'decoded': 4, 'filtered': 1, 'normalized': 3}
+
+
+def test_normalize_dedup():
+    runner = CliRunner()
+    result = runner.invoke(normalize, input=NORMALIZE_INPUT, args=['--dedup-window', '10', '--quiet'])
+    assert not result.exception
+    assert len(result.stdout.splitlines()) == 2
+    assert not result.stderr
+
+
+def test_normalize_dedup_workers():
+    runner = CliRunner()
+    result = runner.invoke(normalize, input=NORMALIZE_INPUT, args=['--dedup-window', '10', '--workers', '2'])
+    assert result.exit_code == 2
+    assert '--dedup-window cannot be used with more than one worker' in result.output
+
+
+def test_normalize_parquet(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    runner = CliRunner()
+    path = str(tmp_path / 'test.parquet')
+    result = runner.invoke(normalize, input=NORMALIZE_INPUT, args=['-', path, '--format', 'parquet', '--quiet'])
+    assert not result.exception
+    assert pq.read_table(path).column('ssvid').to_pylist() == ['985200250', '985200250', '710011990']
+
+
+def test_bench(tmp_path):
+    runner = CliRunner()
+    path = str(tmp_path / 'bench.json')
+    result = runner.invoke(bench, args=['-n', '10', '-b', 'checksum', '-b', 'normalize', '-o', path])
+    assert not result.exception
+    assert 'checksum' in result.stdout
+    with open(path) as f:
+        saved = json.load(f)
+    assert set(saved['results']) == {'checksum', 'normalize'}
+
+    # compare with a baseline that is much faster than any real run
+    for r in saved['results'].values():
+        r['msgs_per_sec'] *= 1000
+    with open(path, 'w') as f:
+        json.dump(saved, f)
+    result = runner.invoke(bench, args=['-n', '10', '-b', 'checksum', '--baseline', path])
+    assert result.exit_code == 1
+    assert 'regressions: checksum' in result.stderr
+
+    result = runner.invoke(bench, args=['-n', '10', '-b', 'checksum', '--baseline', path, '--threshold', '1'])
+    assert result.exit_code == 0
+
+
+def test_bench_synthetic():
+    runner = CliRunner()
+    result = runner.invoke(bench, args=['-n', '10', '--synthetic', '100', '-b', 'decode_type_5'])
+    assert not result.exception
+    assert 'decode_type_5' in result.stdout
+
+
+def test_synthetic():
+    runner = CliRunner()
+    result = runner.invoke(synthetic, args=['-n', '20', '--seed', '1', '--type-mix', '1:1,5:1', '--stations', '2'])
+    assert not result.exception
+    stats = json.loads(result.stderr.split(':', 1)[1])
+    assert stats['messages'] == 20
+    assert stats['lines'] == len(result.stdout.splitlines())
+    assert set(stats['types']) == {'1', '5'}
+
+
+def test_synthetic_bad_type_mix():
+    runner = CliRunner()
+    result = runner.invoke(synthetic, args=['-n', '20', '--type-mix', '4:1'])
+    assert result.exit_code == 2
+    assert 'Unable to generate message type 4' in result.output
+
+
+def test_decode_mmap(tmp_path):
+    path = tmp_path / 'test.nmea'
+    path.write_text('\n'.join(NORMALIZE_INPUT.splitlines()[:2] + ['', 'invalid']))
+    runner = CliRunner()
+    expected = runner.invoke(decode, input=path.read_text(), args=['--quiet'])
+    result = runner.invoke(decode, args=[str(path), '--mmap', '--workers', '2'])
+    assert not result.exception
+    assert result.stdout == expected.stdout
+    assert result.stdout.count('\n') == 4
+    assert result.stderr.count('\n') == 2
+
+
+def test_normalize_mmap(tmp_path):
+    input = NORMALIZE_INPUT + '\n\n' + NORMALIZE_INPUT
+    path = tmp_path / 'test.nmea'
+    path.write_text(input)
+    runner = CliRunner()
+    expected = runner.invoke(normalize, input=input, args=['--source', 'test'])
+    result = runner.invoke(normalize, args=[str(path), '--mmap', '--workers', '2', '--source', 'test'])
+    assert not result.exception
+    assert result.stdout == expected.stdout
+    assert result.stderr == expected.stderr
+
+
+@pytest.mark.parametrize("command", [decode, normalize, stats])
+def test_mmap_stdin(command):
+    runner = CliRunner()
+    result = runner.invoke(command, input=NORMALIZE_INPUT, args=['--mmap'])
+    assert result.exit_code == 2
+    assert '--mmap requires INPUT to be an uncompressed file' in result.output
+
+
+@pytest.mark.parametrize("command", [decode, normalize, stats])
+def test_mmap_compressed(tmp_path, command):
+    path = tmp_path / 'test.nmea.gz'
+    with gzip.open(path, 'wt') as f:
+        f.write(NORMALIZE_INPUT)
+    runner = CliRunner()
+    result = runner.invoke(command, args=[str(path), '--mmap', '--workers', '2'])
+    assert result.exit_code == 2
+    assert '--mmap requires INPUT to be an uncompressed file' in result.output
+    assert result.stdout == ''
+
+
+@pytest.mark.parametrize("ext", ['.gz', '.bz2'])
+def test_compressed_input_output(tmp_path, ext):
+    from ais_tools.fileio import open_compressed
+    input_path = str(tmp_path / f'input.nmea{ext}')
+    output_path = str(tmp_path / f'output.json{ext}')
+    with open_compressed(input_path, 'w') as f:
+        f.write(NORMALIZE_INPUT)
+
+    runner = CliRunner()
+    expected = runner.invoke(normalize, input=NORMALIZE_INPUT, args=['--quiet'])
+    result = runner.invoke(cli, args=['--compression-level', '1', 'normalize', '--quiet', input_path, output_path])
+    assert not result.exception
+    with open_compressed(output_path, 'rb') as f:
+        assert f.read() == expected.stdout_bytes
+
+
+@pytest.mark.parametrize("args", [[], ['--decode']])
+def test_stats(tmp_path, args):
+    runner = CliRunner()
+    result = runner.invoke(stats, input=NORMALIZE_INPUT, args=args)
+    assert not result.exception
+    summary = json.loads(result.stdout)
+    assert summary['lines'] == 6
+    assert summary['types'] == {'5': 1, '8': 1, '18': 2}
+    assert summary['multipart']['complete'] == 1
+    assert ('decode_errors' in summary) == bool(args)
+
+    path = tmp_path / 'test.nmea'
+    path.write_text(NORMALIZE_INPUT)
+    result = runner.invoke(stats, args=[str(path), '--mmap', '--workers', '2'] + args)
+    assert not result.exception
+    assert json.loads(result.stdout) == summary
+
+
+def test_partition(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(cli, input=NORMALIZE_INPUT,
+                           args=['--compression-level', '1', 'partition', str(tmp_path), '-t', '{station}/{type}.nmea.gz'])
+    assert not result.exception
+    stats = json.loads(result.stderr.split(':', 1)[1])
+    assert stats['lines'] == 6
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['66', 'ais-tools', 'unknown']
+    assert sorted(p.name for p in (tmp_path / 'ais-tools').iterdir()) == ['18.nmea.gz', '8.nmea.gz']
+
+
+def test_partition_bad_template(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(partition, input=NORMALIZE_INPUT, args=[str(tmp_path), '-t', '{foo}.nmea'])
+    assert result.exit_code == 2
+    assert 'Unknown template field {foo}' in result.output
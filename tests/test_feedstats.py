@@ -0,0 +1,78 @@
+import pytest
+
+from ais_tools.feedstats import FeedStats
+from ais_tools.feedstats import error_category
+from ais_tools.feedstats import feed_stats
+from ais_tools.feedstats import feed_stats_file
+from ais_tools.synthetic import SyntheticAIS
+
+
+LINES = [
+    b'\\s:66,c:1661782369*3D\\!AIVDM,1,1,,A,13VPgj0viKV8dtr3Fc7:m`e000SA,0*16',
+    b'\\s:66,c:1661782375*30\\!AIVDM,1,1,,B,H>cSnNP@4eEL544000000000000,0*3E',
+    b'\\s:99,c:1661782435*33\\!AIVDM,1,1,,B,H>cSnNP@4eEL544000000000000,0*3F',
+    b'!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73',
+    b'\\g:1-2-1278,s:66,c:1661782369*43\\!AIVDM,2,1,3,A,56=nR7D00003A<I@E=@TmDh637OS60mA:222220N1@6427?P00888888,0*66',
+    b'\\g:2-2-1278*51\\!AIVDM,2,2,3,A,888888888888880,2*27',
+    b'\\g:1-2-1279,s:66,c:1661782369*42\\!AIVDM,2,1,4,A,56=nR7D00003A<I@E=@TmDh637OS60mA:222220N1@6427?P00888888,0*61',
+    b'invalid',
+]
+
+
+@pytest.mark.parametrize("line,expected", [
+    ('Expected 2 message parts to decode but found 1', 'Expected N message parts to decode but found N'),
+    ('Invalid checksum', 'Invalid checksum'),
+])
+def test_error_category(line, expected):
+    assert error_category(line) == expected
+
+
+def test_feed_stats():
+    summary = feed_stats(LINES).summary()
+    assert summary['lines'] == 8
+    assert summary['no_tagblock'] == 2
+    assert summary['tagblock_checksum_errors'] == 0
+    assert summary['malformed'] == 1
+    assert summary['checksum_errors'] == 1
+    assert summary['checksum_failure_rate'] == round(1 / 7, 6)
+    assert summary['types'] == {'1': 1, '5': 2, '18': 1, '24': 2}
+    assert summary['stations'] == {'66': 4, '99': 1, 'unknown': 1}
+    assert summary['minutes'] == {'2022-08-29T14:12': 4, '2022-08-29T14:13': 1}
+    assert summary['multipart'] == dict(parts=3, joined=0, complete=1, incomplete=1)
+    assert 'decode_errors' not in summary
+
+
+def test_feed_stats_joined():
+    summary = feed_stats([LINES[4] + LINES[5]]).summary()
+    assert summary['types'] == {'5': 1}
+    assert summary['checksum_errors'] == 0
+    assert summary['multipart'] == dict(parts=0, joined=1, complete=0, incomplete=0)
+
+
+def test_feed_stats_decode():
+    summary = feed_stats(LINES, decode=True).summary()
+    assert summary['decoded'] == 5
+    assert summary['decode_errors'] == {'Expected N message parts to decode but found N': 1}
+
+
+def test_feed_stats_batches():
+    lines = [line.encode() for line in SyntheticAIS(seed=1, corruption_rate=0.05).lines(1000)]
+    expected = feed_stats(lines, decode=True).summary()
+    assert feed_stats(lines, decode=True, batch_size=7).summary() == expected
+    assert expected['lines'] == len(lines)
+
+
+def test_merge():
+    first, second = FeedStats(), FeedStats()
+    first.add_lines(LINES[:5])
+    second.add_lines(LINES[5:])
+    assert first.merge(second).finish().summary() == feed_stats(LINES).summary()
+
+
+@pytest.mark.parametrize("decode", [False, True])
+def test_feed_stats_file(tmp_path, decode):
+    lines = list(SyntheticAIS(vessels=20, seed=1, corruption_rate=0.05).lines(500))
+    path = tmp_path / 'synthetic.nmea'
+    path.write_text('\n'.join(lines) + '\n')
+    expected = feed_stats([line.encode() for line in lines], decode=decode).summary()
+    assert feed_stats_file(str(path), decode=decode, workers=2, chunk_size=1000).summary() == expected
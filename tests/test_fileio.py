@@ -0,0 +1,154 @@
+import bz2
+import gzip
+
+import click
+import pytest
+
+from ais_tools.fileio import CompressedFile
+from ais_tools.fileio import ThreadedReader
+from ais_tools.fileio import ThreadedWriter
+from ais_tools.fileio import compression_for_path
+from ais_tools.fileio import open_compressed
+from ais_tools.synthetic import SyntheticAIS
+
+
+LINES = ['!AIVDM,1,1,,A,13VPgj0viKV8dtr3Fc7:m`e000SA,0*16\n'] * 1000
+
+
+@pytest.mark.parametrize("path,expected", [
+    ('test.nmea', None),
+    ('test.nmea.gz', 'gzip'),
+    ('test.nmea.GZ', 'gzip'),
+    ('test.nmea.bz2', 'bz2'),
+    ('test.nmea.zst', 'zstd'),
+    ('test.nmea.zstd', 'zstd'),
+    ('test', None),
+])
+def test_compression_for_path(path, expected):
+    assert compression_for_path(path) == expected
+
+
+@pytest.mark.parametrize("ext", ['', '.gz', '.bz2', '.zst'])
+def test_round_trip(tmp_path, ext):
+    if ext == '.zst':
+        pytest.importorskip('zstandard')
+    path = str(tmp_path / f'test.nmea{ext}')
+    with open_compressed(path, 'w') as f:
+        f.writelines(LINES)
+    with open_compressed(path, 'r') as f:
+        assert list(f) == LINES
+    with open_compressed(path, 'rb') as f:
+        assert f.read() == ''.join(LINES).encode()
+
+
+@pytest.mark.parametrize("ext,open_fn", [('.gz', gzip.open), ('.bz2', bz2.open)])
+def test_compatible(tmp_path, ext, open_fn):
+    path = str(tmp_path / f'test.nmea{ext}')
+    with open_fn(path, 'wt') as f:
+        f.writelines(LINES)
+    with open_compressed(path, 'rt') as f:
+        assert list(f) == LINES
+
+    with open_compressed(path, 'wt') as f:
+        f.writelines(LINES)
+    with open_fn(path, 'rt') as f:
+        assert list(f) == LINES
+
+
+def test_compression_level(tmp_path):
+    data = '\n'.join(SyntheticAIS(seed=1).lines(5000)).encode()
+    sizes = []
+    for level in [1, 9]:
+        path = tmp_path / f'test{level}.gz'
+        with open_compressed(str(path), 'wb', level=level) as f:
+            f.write(data)
+        sizes.append(path.stat().st_size)
+    assert sizes[0] > sizes[1]
+
+
+def test_threaded_reader_small_blocks(tmp_path):
+    path = tmp_path / 'test.nmea'
+    path.write_text(''.join(LINES))
+    with ThreadedReader(open(path, 'rb'), block_size=7, queue_size=2) as f:
+        assert f.readall() == path.read_bytes()
+
+
+def test_threaded_reader_close_early(tmp_path):
+    path = tmp_path / 'test.nmea'
+    path.write_text(''.join(LINES))
+    f = ThreadedReader(open(path, 'rb'), block_size=1, queue_size=1)
+    assert f.read(10) == b'!'
+    f.close()
+    assert not f.thread.is_alive()
+
+
+class FailingStream:
+    def __init__(self):
+        self.closed = False
+
+    def read(self, size):
+        raise OSError('read failed')
+
+    def write(self, data):
+        raise OSError('write failed')
+
+    def close(self):
+        self.closed = True
+
+
+def test_threaded_reader_error():
+    f = ThreadedReader(FailingStream(), name='failing.gz')
+    with pytest.raises(OSError, match='Error reading failing.gz: read failed'):
+        f.read(10)
+    f.close()
+
+
+@pytest.mark.parametrize("ext", ['.gz', '.bz2', '.zst'])
+def test_truncated_file(tmp_path, ext):
+    if ext == '.zst':
+        pytest.importorskip('zstandard')
+    path = str(tmp_path / f'test.nmea{ext}')
+    with open_compressed(path, 'wb') as f:
+        f.write(b'!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73\n' * 1000)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+
+    with open_compressed(path, 'rb') as f:
+        with pytest.raises(OSError, match='Error reading .*test.nmea'):
+            f.read()
+
+
+def test_threaded_writer_error():
+    stream = FailingStream()
+    f = ThreadedWriter(stream)
+    f.write(b'data')
+    with pytest.raises(OSError, match='write failed'):
+        f.close()
+    assert stream.closed
+
+
+def test_compressed_file_param(tmp_path):
+    path = tmp_path / 'test.nmea.gz'
+
+    @click.command()
+    @click.argument('output', type=CompressedFile('w'))
+    def write(output):
+        output.writelines(LINES)
+
+    @click.command()
+    @click.argument('input', type=CompressedFile('r'))
+    def read(input):
+        click.echo(len(list(input)))
+
+    from click.testing import CliRunner
+    runner = CliRunner()
+    assert runner.invoke(write, [str(path)]).exit_code == 0
+    with gzip.open(path, 'rt') as f:
+        assert list(f) == LINES
+    assert runner.invoke(read, [str(path)]).output == '1000\n'
+
+    result = runner.invoke(read, [str(tmp_path / 'missing.gz')])
+    assert result.exit_code == 2
+    assert 'No such file or directory' in result.output
@@ -0,0 +1,63 @@
+import io
+import json
+import pytest
+
+from ais_tools import jsoncodec
+from ais_tools.message import Message
+
+
+@pytest.fixture(params=jsoncodec.available_backends())
+def backend(request):
+    jsoncodec.set_backend(request.param)
+    yield request.param
+    jsoncodec.set_backend()
+
+
+@pytest.mark.parametrize("obj", [
+    {},
+    {'nmea': '!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49', 'id': 1, 'x': -80.62191666666666, 'raim': False},
+    {'name': 'ü', 'list': [1, 2.5, None], 'nested': {'a': 'b'}},
+    {'big': 2 ** 70},
+])
+def test_round_trip(backend, obj):
+    assert jsoncodec.loads(jsoncodec.dumpb(obj)) == obj
+    assert jsoncodec.loads(jsoncodec.dumpb(obj).decode('utf-8')) == obj
+    assert json.loads(jsoncodec.dumpb(obj)) == obj
+
+
+@pytest.mark.parametrize("obj,expected", [
+    ({'name': 'ü'}, '{"name":"ü"}'.encode('utf-8')),
+    ({'x': float('nan'), 'y': [float('inf'), -float('inf')], 'z': 1.5}, b'{"x":null,"y":[null,null],"z":1.5}'),
+])
+def test_dumpb_same_for_all_backends(backend, obj, expected):
+    assert jsoncodec.dumpb(obj) == expected
+    assert jsoncodec.dumps_lines([obj]) == expected + b'\n'
+
+
+def test_dumps_lines(backend):
+    objs = [{'a': 1}, {'b': 'two'}, {'big': 2 ** 70}]
+    data = jsoncodec.dumps_lines(objs)
+    assert data.endswith(b'\n')
+    assert [json.loads(line) for line in data.splitlines()] == objs
+    assert jsoncodec.dumps_lines([]) == b''
+
+
+def test_decode_error(backend):
+    with pytest.raises(jsoncodec.DecodeError):
+        jsoncodec.loads('{not valid JSON}')
+    assert Message('{not valid JSON}')['error'].startswith('JSONDecodeError')
+
+
+def test_set_backend_unknown():
+    with pytest.raises(ValueError, match='JSON backend xml is not available'):
+        jsoncodec.set_backend('xml')
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 1000])
+def test_json_lines_writer(batch_size):
+    stream = io.BytesIO()
+    objs = [{'id': i} for i in range(5)]
+    with jsoncodec.JSONLinesWriter(stream, batch_size=batch_size) as writer:
+        for obj in objs:
+            writer.write(obj)
+    assert [json.loads(line) for line in stream.getvalue().splitlines()] == objs
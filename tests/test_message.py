@@ -2,6 +2,8 @@ import pytest
 import ais_tools
 from ais_tools.message import Message
 from ais_tools.message import UUID
+from ais_tools.message import add_uuids
+import uuid
 import itertools as it
 
 
@@ -64,6 +66,38 @@ def test_add_uuid(msg, overwrite, expected):
     assert msg['uuid'] == expected
 
 
+@pytest.mark.parametrize("msg,algorithm,expected", [
+    ({'nmea': '!AVIDM123'}, 'md5', '1d469a2d-5b2f-4ef9-f5ac-fb4e336e91da'),
+    ({'nmea': '!AVIDM123'}, 'xxh3_128', '98087757-ae8d-8dff-a27e-8a81a0a934d8'),
+    ({'nmea': '!AVIDM123'}, lambda name: name, '||!AVIDM123|'),
+])
+def test_add_uuid_algorithm(msg, algorithm, expected):
+    msg = Message(msg).add_uuid(algorithm=algorithm)
+    assert msg['uuid'] == expected
+
+
+@pytest.mark.parametrize("name", ['', 'test', '||!AVIDM123|', 'ü'])
+def test_xxh3_128_uuid_valid(name):
+    msg = Message(nmea=name)
+    u = uuid.UUID(msg.create_uuid(algorithm='xxh3_128'))
+    assert u.version == 8
+    assert u.variant == uuid.RFC_4122
+
+
+def test_add_uuid_unknown_algorithm():
+    with pytest.raises(ValueError, match='Unknown uuid algorithm'):
+        Message().add_uuid(algorithm='sha1')
+
+
+@pytest.mark.parametrize("algorithm", ['md5', 'xxh3_128'])
+@pytest.mark.parametrize("overwrite", [True, False])
+def test_add_uuids(algorithm, overwrite):
+    messages = [{'nmea': '!AVIDM123', 'source': 'test'}, {'nmea': '!AVIDM456', 'uuid': 'old'}]
+    expected = [Message(m).add_uuid(overwrite=overwrite, algorithm=algorithm) for m in messages]
+    actual = list(add_uuids(Message.stream(messages), overwrite=overwrite, algorithm=algorithm))
+    assert actual == expected
+
+
 @pytest.mark.parametrize("msg", [
     ({}),
     ({'nmea': '!AVIDM123'}),
@@ -0,0 +1,99 @@
+import pytest
+
+from ais_tools import jsoncodec
+from ais_tools.aivdm import AIVDM
+from ais_tools.mmapfile import decode_file
+from ais_tools.mmapfile import file_ranges
+from ais_tools.mmapfile import normalize_file
+from ais_tools.mmapfile import read_range_lines
+from ais_tools.nmea import join_multipart_stream
+from ais_tools.nmea import split_multipart
+from ais_tools.normalize_transform import LineNormalizer
+from ais_tools.normalize_transform import MessageDeduplicator
+from ais_tools.synthetic import SyntheticAIS
+
+
+@pytest.fixture
+def synthetic_file(tmp_path):
+    path = tmp_path / 'synthetic.nmea'
+    lines = list(SyntheticAIS(vessels=20, seed=1, max_delay=2).lines(500))
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path), lines
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100, 1000, 1000000])
+def test_file_ranges(synthetic_file, chunk_size):
+    path, lines = synthetic_file
+    ranges = file_ranges(path, chunk_size)
+    assert ranges[0][0] == 0
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert [line.decode() for r in ranges for line in read_range_lines(path, *r)] == lines
+    for start, end in ranges[1:]:
+        assert ',2,2,' not in read_range_lines(path, start, end)[0].decode()
+
+
+def test_file_ranges_empty(tmp_path):
+    path = tmp_path / 'empty.nmea'
+    path.write_text('')
+    assert file_ranges(str(path), 100) == []
+
+
+def test_file_ranges_no_trailing_newline(tmp_path):
+    path = tmp_path / 'test.nmea'
+    path.write_bytes(b'aaa\nbbb\nccc')
+    assert file_ranges(str(path), 2) == [(0, 4), (4, 8), (8, 11)]
+
+
+def test_decode_file(tmp_path, synthetic_file):
+    path, lines = synthetic_file
+    joined_path = tmp_path / 'joined.nmea'
+    joined = list(join_multipart_stream(lines)) + ['invalid']
+    joined_path.write_text('\n'.join(joined))
+
+    results = list(decode_file(str(joined_path), workers=2, tagblock_cache=10, chunk_size=1000))
+    assert len(results) > 2
+    decoder = AIVDM()
+    expected = [decoder.safe_decode(line) for line in joined]
+    assert b''.join(data for data, _, _ in results) == jsoncodec.dumps_lines(expected)
+    assert [e for _, errors, _ in results for e in errors] == [expected[-1]['error']]
+    assert sum(stats['hits'] + stats['misses'] for _, _, stats in results) >= len(joined) - 1
+
+
+def test_normalize_file(synthetic_file):
+    path, lines = synthetic_file
+    expected_normalizer = LineNormalizer(source='test')
+    expected = list(expected_normalizer.normalize(join_multipart_stream(lines)))
+
+    normalizer = LineNormalizer(source='test')
+    actual = list(normalize_file(path, normalizer, workers=2, chunk_size=1000))
+    assert actual == expected
+    assert normalizer.stats() == expected_normalizer.stats()
+
+
+def test_normalize_file_split_message(tmp_path, synthetic_file):
+    # a multipart message with the parts in reverse order and a range boundary between them
+    _, lines = synthetic_file
+    joined = list(join_multipart_stream(lines))
+    single = [line for line in joined if len(split_multipart(line)) == 1][:20]
+    part1, part2 = next(split_multipart(line) for line in joined if len(split_multipart(line)) == 2)
+    lines = single[:10] + [part2, part1] + single[10:]
+    path = tmp_path / 'split.nmea'
+    path.write_text('\n'.join(lines) + '\n')
+    chunk_size = len('\n'.join(single[:10] + [part2])) + 1
+    assert read_range_lines(str(path), *file_ranges(str(path), chunk_size)[1])[0].decode() == part1
+
+    expected_normalizer = LineNormalizer(source='test')
+    expected = list(expected_normalizer.normalize(join_multipart_stream(lines)))
+    assert len(expected) == len(single) + 1
+
+    normalizer = LineNormalizer(source='test')
+    actual = list(normalize_file(str(path), normalizer, workers=2, chunk_size=chunk_size))
+    assert actual == expected
+    assert normalizer.stats() == expected_normalizer.stats()
+
+
+def test_normalize_file_dedup(synthetic_file):
+    path, _ = synthetic_file
+    normalizer = LineNormalizer(deduplicator=MessageDeduplicator())
+    with pytest.raises(ValueError, match='Deduplication is not supported'):
+        list(normalize_file(path, normalizer))
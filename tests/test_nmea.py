@@ -1,10 +1,20 @@
+import json
+import multiprocessing
+import os
 import pytest
 import re
 
 from ais_tools.nmea import join_multipart
 from ais_tools.nmea import split_multipart
+from ais_tools.nmea import scan_multipart
+from ais_tools.nmea import split_multipart_sentences
 from ais_tools.nmea import join_multipart_stream
 from ais_tools.nmea import expand_nmea
+from ais_tools.nmea import MultipartJoiner
+from ais_tools.nmea import join_multipart_stream_sharded
+from ais_tools.nmea import multipart_shard_key
+from ais_tools.nmea import vdm_sentence
+from ais_tools.normalize import REGEX_NMEA
 from ais_tools.ais import DecodeError
 
 
@@ -203,3 +213,191 @@ def test_talker_id(line, expected):
     tagblock, body, pad = expand_nmea(line)
     assert tagblock['talker_id'] == expected
 
+
+
+def test_multipart_joiner_snapshot_restore():
+    nmea = [
+        '\\t:1,s:station1*00\\!AIVDM,1,1,1,A,@,0*57',
+        '\\t:2.1,g:1-2-001,s:station1*00\\!AIVDM,2,1,1,B,@,0*57',
+        '\\t:5.2*00\\!AIVDM,2,2,5,B,@,0*50',
+    ]
+    joiner = MultipartJoiner()
+    output = [line for line in nmea for line in joiner.process(line)]
+    assert output == nmea[:1]
+
+    state = json.loads(json.dumps(joiner.snapshot()))
+    assert state['index'] == 3
+    assert [part[0] for part in state['parts']] == nmea[1:]
+
+    joiner = MultipartJoiner()
+    joiner.restore(state)
+    assert joiner.process('\\t:5.1*00\\!AIVDM,2,1,5,B,@,0*53') == ['\\t:5.1*00\\!AIVDM,2,1,5,B,@,0*53' + nmea[2]]
+    assert joiner.process('\\t:2.2,g:2-2-001,s:station1*00\\!AIVDM,2,2,1,B,@,0*54') == \
+        [nmea[1] + '\\t:2.2,g:2-2-001,s:station1*00\\!AIVDM,2,2,1,B,@,0*54']
+    assert joiner.flush() == []
+
+
+def test_multipart_joiner_snapshot_restore_bytes():
+    # a byte that is not ascii after the checksum is passed through unchanged
+    nmea = b'\\t:2.1,g:1-2-001,s:station1*00\\!AIVDM,2,1,1,B,@,0*57\xe9'
+    joiner = MultipartJoiner()
+    assert joiner.process(nmea) == []
+
+    state = json.loads(json.dumps(joiner.snapshot()))
+    assert state['bytes']
+
+    joiner = MultipartJoiner()
+    joiner.restore(state)
+    assert joiner.flush() == [nmea]
+
+
+def test_multipart_joiner_restore_stale():
+    nmea = [
+        '\\t:2.1,g:1-2-001,s:station1*00\\!AIVDM,2,1,1,B,@,0*57',
+        '\\t:5.2*00\\!AIVDM,2,2,5,B,@,0*50',
+    ]
+    joiner = MultipartJoiner(max_message_window=2)
+    for line in nmea:
+        joiner.process(line)
+    state = joiner.snapshot()
+
+    joiner = MultipartJoiner(max_message_window=2)
+    joiner.restore(state)
+    # the stream index continues from the snapshot, so the first part is now too old
+    assert joiner.process('\\t:1,s:station1*00\\!AIVDM,1,1,1,A,@,0*57') == ['\\t:1,s:station1*00\\!AIVDM,1,1,1,A,@,0*57']
+    assert joiner.process('\\t:1,s:station1*00\\!AIVDM,1,1,1,A,@,0*57') == ['\\t:1,s:station1*00\\!AIVDM,1,1,1,A,@,0*57',
+                                                                            nmea[0]]
+    assert joiner.flush() == nmea[1:]
+
+
+def test_multipart_joiner_restore_bad_version():
+    with pytest.raises(ValueError, match='Unsupported joiner snapshot version'):
+        MultipartJoiner().restore({'version': 0})
+
+
+@pytest.mark.parametrize("line,expected", [
+    ('!AIVDM,1,1,1,A,@,0*57', None),
+    ('\\t:1,s:station1*00\\!AIVDM,1,1,1,A,@,0*57', 'station1'),
+    ('\\g:2-2-1786*55\\!AIVDM,2,2,6,B,88888888880,2*21', 1786),
+    ('\\g:1-2-1786,s:MAEROSPACE-C,c:1516060792*31\\!AIVDM,2,1,6,B,5,0*56', 1786),
+])
+def test_multipart_shard_key(line, expected):
+    assert multipart_shard_key(line) == expected
+
+
+@pytest.mark.parametrize("shards,batch_size", [(1, 1000), (3, 1000), (3, 2)])
+def test_join_multipart_stream_sharded(shards, batch_size):
+    nmea = [
+        '\\t:1,s:station1*00\\!AIVDM,1,1,1,A,@,0*57',
+        '\\t:2.1,g:1-2-001,s:station1*00\\!AIVDM,2,1,1,B,@,0*57',
+        '\\t:3,s:station2*00\\!AIVDM,1,1,1,A,@,0*57',
+        '\\t:2.2,g:2-2-001*00\\!AIVDM,2,2,1,B,@,0*54',
+        '\\t:4,s:station3*00\\!AIVDM,1,1,1,A,@,0*57',
+        '\\t:5.2,s:station2*00\\!AIVDM,2,2,5,B,@,0*50',
+        '\\t:6,s:station1*00\\!AIVDM,1,1,1,A,@,0*57',
+        '\\t:7.1,s:station3*00\\!AIVDM,2,1,7,B,@,0*51',
+        '\\t:5.1,s:station2*00\\!AIVDM,2,1,5,B,@,0*53',
+        '\\t:7.2,s:station3*00\\!AIVDM,2,2,7,B,@,0*52',
+        '\\t:8.2,s:station1*00\\!AIVDM,2,2,8,A,@,0*5E',
+    ]
+    expected = list(join_multipart_stream(nmea))
+    actual = list(join_multipart_stream_sharded(nmea, shards=shards, batch_size=batch_size))
+    assert sorted(actual) == sorted(expected)
+
+    # order is preserved within each shard key
+    for key in set(map(multipart_shard_key, nmea)):
+        assert [line for line in actual if multipart_shard_key(line) == key] == \
+               [line for line in expected if multipart_shard_key(line) == key]
+
+
+def test_join_multipart_stream_sharded_fail():
+    with pytest.raises(DecodeError, match='not enough fields in nmea message'):
+        list(join_multipart_stream_sharded(['invalid'], shards=2))
+
+
+def _raise_error(self, line):
+    raise KeyError('test error')
+
+
+def _exit_worker(self, line):
+    os._exit(3)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason="workers must inherit the monkeypatch")
+@pytest.mark.parametrize("process,error,match", [
+    (_raise_error, KeyError, 'test error'),
+    (_exit_worker, RuntimeError, 'exited unexpectedly with exit code 3'),
+])
+def test_join_multipart_stream_sharded_worker_error(monkeypatch, process, error, match):
+    monkeypatch.setattr(MultipartJoiner, 'process', process)
+    with pytest.raises(error, match=match):
+        list(join_multipart_stream_sharded(['!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49'], shards=2))
+
+
+@pytest.mark.parametrize("line", [
+    "\\g:1-2-4372,s:rORBCOMM109,c:1426032000,T:2015-03-11 00.00.00*32"
+    "\\!AIVDM,2,1,2,B,576u>F02>hOUI8AGR20tt<j104p4l62222222216H14@@Hoe0JPEDp1TQH88,0*16",
+    '!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49',
+])
+def test_expand_nmea_bytes(line):
+    assert expand_nmea(line.encode(), validate_checksum=True) == expand_nmea(line, validate_checksum=True)
+
+
+def test_split_multipart_bytes():
+    nmea = '\\t:1*00\\!AIVDM,2,1,7,A,@*00\\t:2*00\\!AIVDM,2,2,7,A,@*00'
+    assert split_multipart(nmea.encode()) == [line.encode() for line in split_multipart(nmea)]
+
+
+def test_join_multipart_stream_bytes():
+    nmea = ['\\t:1*00\\!AIVDM,2,1,7,B,@,0*51', '\\t:2*00\\!AIVDM,2,2,7,B,@,0*52', '!AIVDM,1,1,1,A,@,0*57']
+    combined = list(join_multipart_stream([line.encode() for line in nmea]))
+    assert combined == [''.join(nmea[:2]).encode(), nmea[2].encode()]
+
+
+@pytest.mark.parametrize("nmea,expected", [
+    ('!AIVDM,2,1,7,A,@*6F', [(0, 0, 19)]),
+    ('\\!AIVDM,2,1,7,A,@*6F\\!AIVDM,2,1,7,A,@*6F', [(0, 0, 20), (20, 20, 40)]),
+    ('\\t:1*00\\!AIVDM,2,1,7,A,@*00\\t:2*00\\!AIVDM,2,2,7,A,@*00', [(0, 8, 27), (27, 35, 54)]),
+    ('!AIVDM,2,1,7,A,@*00\\t:2*00\\!AIVDM,2,2,7,A,@*00', [(0, 0, 19), (19, 27, 46)]),
+    ('!', []),
+])
+def test_scan_multipart(nmea, expected):
+    assert scan_multipart(nmea) == expected
+    assert scan_multipart(nmea.encode()) == expected
+
+
+@pytest.mark.parametrize("nmea,error", [
+    ('', 'no valid AIVDM message detected'),
+    ('not_nmea', 'no valid AIVDM message detected'),
+    ('\\t:1*00!AIVDM,2,1,7,A,@*00', 'tagblock is missing the closing delimiter'),
+])
+def test_scan_multipart_fail(nmea, error):
+    with pytest.raises(DecodeError, match=error):
+        scan_multipart(nmea)
+
+
+def test_split_multipart_sentences():
+    nmea = '!AIVDM,2,1,7,A,@*00\\t:2*00\\!AIVDM,2,2,7,A,@*00'
+    assert split_multipart_sentences(nmea) == [('', '!AIVDM,2,1,7,A,@*00'), ('t:2*00', '!AIVDM,2,2,7,A,@*00')]
+
+
+@pytest.mark.parametrize("sentence,expected", [
+    ('!AIVDM,2,2,2,A,@,0*57', '!AIVDM,2,2,2,A,@,0*57'),
+    ('\\!AIVDM,2,2,2,A,@,0*57', '!AIVDM,2,2,2,A,@,0*57'),
+    ('!BSVDO,2,2,2,A,@,0*5f', '!BSVDO,2,2,2,A,@,0*5f'),
+    ('!AIVDM_*00', '!AIVDM_*00'),
+    ('!AIVDM*00', None),
+    ('!AIVDM_*0', None),
+    ('!AIVDM_*0G', None),
+    ('!AIVDM,*,*00', None),
+    ('!XXVDM_*00', None),
+    ('!AIVDX_*00', None),
+    ('!AIVDM,2,2,2,A,@,0*57 ', None),
+    ('', None),
+])
+def test_vdm_sentence(sentence, expected):
+    assert vdm_sentence(sentence) == expected
+    assert vdm_sentence(sentence.encode()) == (expected.encode() if expected else None)
+    # must agree with the regex used by normalize_dedup_key()
+    matches = REGEX_NMEA.findall(sentence)
+    assert (matches == [expected]) if expected else (matches != [sentence.lstrip('\\')])
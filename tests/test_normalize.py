@@ -1,5 +1,6 @@
 import pytest
 import re
+from datetime import datetime, timezone
 
 from ais_tools.normalize import normalize_timestamp
 from ais_tools.normalize import normalize_tx_timestamp
@@ -19,10 +20,21 @@ from ais_tools.normalize import normalize_message_type
 from ais_tools.normalize import normalize_dedup_key
 from ais_tools.normalize import normalize_shiptype
 from ais_tools.normalize import normalize_message
+from ais_tools.normalize import compile_transforms
+from ais_tools.normalize import MAX_COMPILED_TRANSFORMS
+from ais_tools.normalize import _compiled_transforms
+from ais_tools.normalize import map_field
 from ais_tools.normalize_transform import normalize_and_filter_messages
 from ais_tools.normalize_transform import DEFAULT_FIELD_TRANSFORMS
+from ais_tools.normalize_transform import MessageDeduplicator
+from ais_tools.normalize_transform import dedup_messages
+from ais_tools.normalize_transform import armored_message_type
+from ais_tools.normalize_transform import LineNormalizer
+from ais_tools.normalize_transform import decode_and_normalize
+from ais_tools.normalize_transform import transform_field_types
 from ais_tools.shiptypes import SHIPTYPE_MAP
 from ais_tools.normalize import REGEX_NMEA
+from ais_tools.aivdm import AIVDM
 
 
 @pytest.mark.parametrize("t,expected", [
@@ -30,16 +42,33 @@ from ais_tools.normalize import REGEX_NMEA
     (1672531200.0, '2023-01-01T00:00:00Z', ),
     (1672531200.123, '2023-01-01T00:00:00Z'),
     (0, '1970-01-01T00:00:00Z'),
+    (1672531199.9999994, '2022-12-31T23:59:59Z'),
+    (1672531199.9999996, '2023-01-01T00:00:00Z'),
+    (-0.0000004, '1970-01-01T00:00:00Z'),
+    (-0.0000006, '1969-12-31T23:59:59Z'),
 ])
 def test_normalize_timestamp(t, expected):
     message = {'tagblock_timestamp': t}
     assert normalize_timestamp(message) == expected
+    # check against the value from datetime directly
+    t = datetime.fromtimestamp(t, tz=timezone.utc).isoformat(timespec='seconds').replace("+00:00", "Z")
+    assert normalize_timestamp(message) == t
+
+
+@pytest.mark.parametrize("t,error", [
+    (float('nan'), ValueError),
+    ('1672531200', TypeError),
+])
+def test_normalize_timestamp_invalid(t, error):
+    with pytest.raises(error):
+        normalize_timestamp({'tagblock_timestamp': t})
 
 @pytest.mark.parametrize("year, month, day, hour, minute, second,expected", [
     (2024, 1, 2, 3, 4, 5, '2024-01-02T03:04:05Z'),
     (None, 1, 2, 3, 4, 5, None),
     (2024, 0, 2, 3, 4, 5, None),
     (2024, 1, 2, 3, 4, 60, None),
+    (2024, 2, 30, 3, 4, 5, None),
 ])
 def test_normalize_tx_timestamp(year, month, day, hour, minute, second, expected):
     message = {
@@ -53,6 +82,14 @@ def test_normalize_tx_timestamp(year, month, day, hour, minute, second, expected
     assert normalize_tx_timestamp(message) == expected
 
 
+def test_normalize_tx_timestamp_float():
+    message = {'year': 2024, 'month': 1, 'day': 2, 'hour': 3, 'minute': 4, 'second': 5}
+    assert normalize_tx_timestamp(message) == '2024-01-02T03:04:05Z'
+    # cached results for int values must not be returned for equal floats, which datetime does not accept
+    with pytest.raises(TypeError):
+        normalize_tx_timestamp({**message, 'second': 5.0})
+
+
 @pytest.mark.parametrize("value,expected", [
     (0, 0),
     (1.23456789, 1.23457),
@@ -241,6 +278,20 @@ def test_normalize_dedup_key(message, expected):
     assert normalize_dedup_key(message) == expected
 
 
+@pytest.mark.parametrize("nmea", [
+    '\\s:66,c:1664582400*32\\!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05',
+    '\\g:1-2-2243,s:66,c:1664582400*47\\!AIVDM,2,1,1,B,5:U7dET2B4iE17KOS:0@Di0PTqE>22222222220l1@F65ut8?=lhCU3l,0*71'
+    '\\g:2-2-2243*5A\\!AIVDM,2,2,1,B,p4l888888888880,2*36',
+    '!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05',
+])
+def test_normalize_dedup_key_decoded(nmea):
+    decoder = AIVDM()
+    for line in (nmea, nmea.encode()):
+        message = decoder.decode(line)
+        assert message.nmea_sentences is not None
+        assert normalize_dedup_key(message) == normalize_dedup_key(dict(message))
+
+
 @pytest.mark.parametrize("message,expected", [
     ({}, None),
     ({'type_and_cargo': 30}, 'Fishing'),
@@ -295,6 +346,44 @@ def test_filter_message(message, expected):
 ])
 def test_normalize_message(message, expected):
     assert normalize_message(message, DEFAULT_FIELD_TRANSFORMS) == expected
+    actual = compile_transforms(DEFAULT_FIELD_TRANSFORMS)(message)
+    assert actual == expected
+    assert list(actual) == list(normalize_message(message, DEFAULT_FIELD_TRANSFORMS))
+
+
+@pytest.mark.parametrize("transforms,message,expected", [
+    ((('lat', normalize_latitude, {}),), {'x': 1, 'y': 2}, {'lat': 2}),
+    ((('pos_type', normalize_pos_type, {}), ('lon', normalize_longitude, {})),
+        {'x': 1, 'y': 2}, {'pos_type': 'VALID', 'lon': 1}),
+    ((('*', lambda message: {'a': 1, 'b': 2}, {}), ('c', map_field, {'source_field': 'c'})),
+        {'c': 3}, {'a': 1, 'b': 2, 'c': 3}),
+    ((('*', lambda message: None, {}),), {'c': 3}, {}),
+    ((('name', normalize_text_field, {'source_field': 'callsign'}),), {'callsign': 'ABC@@'}, {'name': 'ABC'}),
+    ((('c', map_field, {}),), {None: 1}, {'c': 1}),
+])
+def test_compile_transforms(transforms, message, expected):
+    assert normalize_message(message, transforms) == expected
+    assert compile_transforms(transforms)(message) == expected
+
+
+def test_compile_transforms_cached():
+    assert compile_transforms(DEFAULT_FIELD_TRANSFORMS) is compile_transforms(DEFAULT_FIELD_TRANSFORMS)
+
+
+def test_compile_transforms_cache_size():
+    lists = [list(DEFAULT_FIELD_TRANSFORMS) for _ in range(MAX_COMPILED_TRANSFORMS * 2)]
+    for transforms in lists:
+        compile_transforms(transforms)
+    assert len(_compiled_transforms) == MAX_COMPILED_TRANSFORMS
+    assert _compiled_transforms[id(lists[-1])][0] is lists[-1]
+
+
+def test_compile_transforms_id_reused():
+    # an entry for a different object with the same id, as if the id had been reused, is not returned
+    transforms = (('lat', normalize_latitude, {}),)
+    _compiled_transforms[id(transforms)] = ((('lon', normalize_longitude, {}),), lambda message: {'lon': 0})
+    assert compile_transforms(transforms)({'x': 1, 'y': 2}) == {'lat': 2}
+    assert _compiled_transforms[id(transforms)][0] is transforms
 
 
 def test_normalize_and_filter_messages():
@@ -305,3 +394,125 @@ def test_normalize_and_filter_messages():
     expected = [{'type': 'AIS.1', 'ssvid': '1', 'timestamp': '2000-01-01T00:00:00Z'}]
     actual = list(normalize_and_filter_messages(messages))
     assert actual == expected
+
+
+def test_dedup_messages():
+    nmea = '!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05'
+    messages = [
+        {'nmea': nmea, 'tagblock_timestamp': 1664582400},
+        {'nmea': '\\s:other*00\\' + nmea, 'tagblock_timestamp': 1664582410},   # duplicate
+        {'nmea': nmea, 'tagblock_timestamp': 1664582460},                        # next minute
+        {'nmea': 'invalid', 'tagblock_timestamp': 1664582460},
+        {'nmea': 'invalid', 'tagblock_timestamp': 1664582460},
+        {'nmea': nmea, 'tagblock_timestamp': 1664582520},                        # expires first minute
+        {'nmea': nmea, 'tagblock_timestamp': 1664582401},                        # too late to check
+        {'nmea': nmea, 'tagblock_timestamp': 1664582461},                        # duplicate
+    ]
+    deduplicator = MessageDeduplicator(window_minutes=2)
+    actual = list(dedup_messages(messages, deduplicator=deduplicator))
+    assert actual == [messages[i] for i in (0, 2, 3, 4, 5, 6)]
+    assert deduplicator.stats() == {'kept': 6, 'dropped': 2, 'late': 1, 'buckets': 2, 'keys': 2}
+
+
+def test_dedup_key_int():
+    message = {'nmea': '!AIVDM,2,2,2,A,@,0*57', 'tagblock_timestamp': 1707443048}
+    deduplicator = MessageDeduplicator()
+    deduplicator.is_duplicate(message)
+    assert deduplicator.buckets == {28457384: {int(normalize_dedup_key(message), 16)}}
+
+
+def test_normalize_and_filter_messages_dedup():
+    messages = [
+        {'id': 1, 'mmsi': 1, 'tagblock_timestamp': 946684800, 'nmea': '!AIVDM,2,2,2,A,@,0*57'},
+        {'id': 1, 'mmsi': 1, 'tagblock_timestamp': 946684801, 'nmea': '!AIVDM,2,2,2,A,@,0*57'},
+    ]
+    deduplicator = MessageDeduplicator()
+    actual = list(normalize_and_filter_messages(messages, deduplicator=deduplicator))
+    assert len(actual) == 1
+    assert deduplicator.dropped == 1
+
+
+@pytest.mark.parametrize("line,expected", [
+    ('!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49', 1),
+    ('\\s:66,c:1663170168*0B\\!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49', 1),
+    ('\\!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73', 18),
+    ('!AIVDM,1,1,,B,H>cSnNP@4eEL544000000000000,0*3E', 24),
+    ('!AIVDM,1,1,,A,85NTES0P00J>tC4@@FOhMgvD0D0M,0*49', 8),
+    ('!AIVDM,1,1,,A,w,0*49', 63),
+    ('!AIVDM,1,1,,A,~,0*49', None),
+    ('!AIVDM,2,1,1,B,55NOvQP1u>QIL@O??SL985`u>0EQ18E=>222221J1p`884i6N344Sll1@m80,0*0C', 5),
+    ('!AIVDM,2,2,1,B,TUPhhhhhhhhhhhhhhhh,2*1F', None),
+    ('!AIVDM,1,1,,A,,0*49', None),
+    ('!AIVDM,1,1', None),
+    ('\\s:66*00', None),
+    ('invalid', None),
+])
+def test_armored_message_type(line, expected):
+    assert armored_message_type(line) == expected
+    assert armored_message_type(line.encode()) == expected
+
+
+NORMALIZE_LINES = [
+    '\\s:66,c:1664582400*32\\!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05',
+    '\\s:66,c:1664582400*32\\!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05',
+    '\\s:66,c:1664582400*32\\!AIVDM,1,1,,A,85NTES0P00J>tC4@@FOhMgvD0D0M,0*49',
+    '\\s:66,c:900000000*00\\!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05',
+    '!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05',
+    '\\s:66,c:1664582400*32\\!AIVDM,1,1,,A,1,0*05',
+    '{"nmea": "!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05", "tagblock_timestamp": 1664582400}',
+    '\\g:1-2-2243,s:66,c:1664582400*47\\!AIVDM,2,1,1,B,5:U7dET2B4iE17KOS:0@Di0PTqE>22222222220l1@F65ut8?=lhCU3l,0*71'
+    '\\g:2-2-2243*5A\\!AIVDM,2,2,1,B,p4l888888888880,2*36',
+]
+
+
+@pytest.mark.parametrize("as_bytes", [False, True])
+def test_line_normalizer(as_bytes):
+    lines = [line.encode() if as_bytes else line for line in NORMALIZE_LINES]
+    decoder = AIVDM()
+    expected = list(normalize_and_filter_messages(decoder.safe_decode(line).add_source('test').add_uuid()
+                                                  for line in lines))
+    normalizer = LineNormalizer(source='test')
+    assert list(normalizer.normalize(lines)) == expected
+    assert normalizer.stats() == {'skipped_type': 1, 'skipped_timestamp': 2, 'decoded': 5,
+                                  'filtered': 1, 'normalized': 4}
+
+
+def test_normalize_worker_batches():
+    from ais_tools import normalize_transform
+    normalizer = LineNormalizer(source='test')
+    expected = list(normalizer.normalize(NORMALIZE_LINES))
+
+    normalize_transform._init_worker_normalizer(normalizer._worker_config())
+    compiled = len(_compiled_transforms)
+    for _ in range(3):
+        messages, stats = normalize_transform._normalize_batch(NORMALIZE_LINES)
+        assert messages == expected
+        assert stats == normalizer.stats()
+    assert len(_compiled_transforms) == compiled
+
+
+def test_normalize_parallel():
+    normalizer = LineNormalizer(source='test')
+    expected = list(normalizer.normalize(NORMALIZE_LINES * 10))
+    parallel = LineNormalizer(source='test')
+    assert list(parallel.normalize_parallel(NORMALIZE_LINES * 10, workers=2, batch_size=3)) == expected
+    assert parallel.stats() == normalizer.stats()
+
+
+def test_decode_and_normalize_dedup():
+    deduplicator = MessageDeduplicator()
+    actual = list(decode_and_normalize(NORMALIZE_LINES, deduplicator=deduplicator, uuid_algorithm=None))
+    # the second line and the json line are duplicates of the first
+    assert len(actual) == 2
+    assert 'msgid' not in actual[0]
+    assert deduplicator.dropped == 2
+
+
+def test_transform_field_types():
+    types = transform_field_types()
+    assert list(types) == [key for key, _, _ in DEFAULT_FIELD_TRANSFORMS]
+    assert types['lon'] is float
+    assert types['imo'] is int
+    assert types['msgid'] is str
+    with pytest.raises(ValueError, match="Unable to determine the type of field 'msgid'"):
+        transform_field_types(overrides={})
@@ -0,0 +1,64 @@
+import math
+import pytest
+
+from ais_tools.normalize import filter_message
+from ais_tools.normalize import compile_transforms
+from ais_tools.normalize_transform import DEFAULT_FIELD_TRANSFORMS
+
+np = pytest.importorskip('numpy')
+
+from ais_tools.normalize_columnar import filter_mask  # noqa: E402
+from ais_tools.normalize_columnar import messages_to_columns  # noqa: E402
+from ais_tools.normalize_columnar import normalize_columns  # noqa: E402
+from ais_tools.normalize_columnar import round_half_even  # noqa: E402
+
+
+MESSAGES = [
+    {},
+    {'id': 1, 'mmsi': 123, 'tagblock_timestamp': 946684800, 'x': 1.2345678, 'y': 1.2345678},
+    {'id': 1, 'mmsi': 123, 'tagblock_timestamp': 946684799, 'x': 181, 'y': 91},
+    {'id': 18, 'mmsi': 123, 'tagblock_timestamp': 1672531199.9999996, 'x': 1.2345678},
+    {'id': 8, 'mmsi': 123, 'tagblock_timestamp': 1672531200, 'x': 200, 'y': 0},
+    {'id': 1, 'mmsi': 123, 'tagblock_timestamp': 1672531200, 'error': 'failed'},
+    {'id': 1, 'mmsi': 123, 'tagblock_timestamp': 1672531200, 'error': None},
+    {'id': 1, 'tagblock_timestamp': 1672531200},
+    {'sog': 102.2, 'cog': 359.9, 'true_heading': 359},
+    {'sog': 102.3, 'cog': 360, 'true_heading': 511},
+    {'sog': 1.25, 'cog': 1.2345678, 'true_heading': 1.5},
+    {'x': -179.999965, 'y': 89.999995},
+    {'dim_a': 1, 'dim_b': 2, 'dim_c': 3},
+    {'draught': 0, 'imo_num': 0},
+    {'draught': 2.5, 'imo_num': 999},
+]
+
+
+def test_normalize_columns():
+    normalized, mask = normalize_columns(messages_to_columns(MESSAGES))
+    normalize_message = compile_transforms(DEFAULT_FIELD_TRANSFORMS)
+
+    assert list(mask) == [filter_message(m) for m in MESSAGES]
+    for i, message in enumerate(MESSAGES):
+        expected = normalize_message(message)
+        for key, values in normalized.items():
+            value = values[i]
+            if isinstance(value, float) and math.isnan(value):
+                value = None
+            assert value == expected.get(key), (key, message)
+
+
+def test_normalize_columns_missing_columns():
+    normalized, mask = normalize_columns({'x': [1.0, None], 'y': np.array([2.0, np.nan])})
+    assert list(normalized['pos_type']) == ['VALID', None]
+    assert list(normalized['timestamp']) == [None, None]
+    assert list(mask) == [False, False]
+
+
+def test_filter_mask_error_values():
+    columns = {'id': [1, 1], 'mmsi': [123, 123], 'tagblock_timestamp': [1672531200, 1672531200],
+               'error': np.array([None, 'failed'], dtype=object)}
+    assert list(filter_mask(columns)) == [True, False]
+
+
+def test_round_half_even():
+    values = np.arange(-108000000, 108000001, 997) / 600000
+    assert list(round_half_even(values, 5)) == [round(v, 5) for v in values.tolist()]
@@ -0,0 +1,54 @@
+import pytest
+
+from ais_tools.normalize import normalize_ssvid
+from ais_tools.normalize_transform import decode_and_normalize
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+from ais_tools.parquet import ParquetMessageWriter  # noqa: E402
+from ais_tools.parquet import transforms_schema  # noqa: E402
+
+
+LINES = [
+    '\\s:66,c:1664582400*32\\!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05',
+    '\\g:1-2-2243,s:66,c:1664582400*47\\!AIVDM,2,1,1,B,5:U7dET2B4iE17KOS:0@Di0PTqE>22222222220l1@F65ut8?=lhCU3l,0*71'
+    '\\g:2-2-2243*5A\\!AIVDM,2,2,1,B,p4l888888888880,2*36',
+    '\\s:66,c:1664582460*32\\!AIVDM,1,1,,A,15D`f63P003R@s6@@`D<Mwwp2`Rq,0*05',
+]
+
+
+def test_transforms_schema():
+    schema = transforms_schema()
+    assert schema.field('lon').type == pa.float64()
+    assert schema.field('ssvid').type == pa.string()
+    assert schema.field('status').type == pa.int64()
+
+
+def test_transforms_schema_overrides():
+    transforms = [('ssvid', normalize_ssvid, {}), ('other', lambda message: message.get('x'), {})]
+    schema = transforms_schema(transforms, overrides={'other': pa.float32()})
+    assert schema.names == ['ssvid', 'other']
+    assert schema.field('other').type == pa.float32()
+    with pytest.raises(ValueError, match="Unable to determine the type of field 'other'"):
+        transforms_schema(transforms)
+
+
+@pytest.mark.parametrize("row_group_size,row_group_bytes,expected_row_groups", [
+    (100000, None, 1),
+    (2, None, 2),
+    (1, None, 3),
+    (100000, 1, 3),
+])
+@pytest.mark.parametrize("compression", ['zstd', 'none'])
+def test_parquet_writer(tmp_path, row_group_size, row_group_bytes, expected_row_groups, compression):
+    messages = list(decode_and_normalize(LINES, source='test'))
+    path = tmp_path / 'test.parquet'
+    with ParquetMessageWriter(str(path), row_group_size=row_group_size, row_group_bytes=row_group_bytes,
+                              compression=compression, batch_size=1) as writer:
+        writer.write_all(messages)
+
+    assert writer.count == len(messages)
+    assert pq.ParquetFile(path).metadata.num_row_groups == expected_row_groups
+    rows = pq.read_table(path).to_pylist()
+    assert [{k: v for k, v in row.items() if v is not None} for row in rows] == messages
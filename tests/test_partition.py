@@ -0,0 +1,130 @@
+import os
+from collections import Counter
+
+import pytest
+
+from ais_tools.fileio import open_compressed
+from ais_tools.partition import OpenFileCache
+from ais_tools.partition import Partitioner
+from ais_tools.partition import safe_path_value
+from ais_tools.partition import template_fields
+from ais_tools.synthetic import SyntheticAIS
+from ais_tools.tagblock import encode_tagblock
+
+
+LINES = [
+    b'\\s:66,c:1661782369*3D\\!AIVDM,1,1,,A,13VPgj0viKV8dtr3Fc7:m`e000SA,0*16',
+    b'\\s:99,c:1661786435*3C\\!AIVDM,1,1,,B,H>cSnNP@4eEL544000000000000,0*3E',
+    b'!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73',
+    b'\\g:2-2-1278*51\\!AIVDM,2,2,3,A,888888888888880,2*27',
+    b'\\g:1-2-1278,s:66,c:1661782369*43\\!AIVDM,2,1,3,A,56=nR7D00003A<I@E=@TmDh637OS60mA:222220N1@6427?P00888888,0*66',
+    b'\\g:2-2-1279*50\\!AIVDM,2,2,4,A,888888888888880,2*27',
+    b'invalid',
+]
+
+
+def read_partitions(path):
+    partitions = {}
+    for root, _, files in os.walk(path):
+        for filename in files:
+            with open_compressed(os.path.join(root, filename), 'rb') as f:
+                partitions[os.path.relpath(os.path.join(root, filename), path)] = f.read().splitlines()
+    return partitions
+
+
+@pytest.mark.parametrize("template,expected", [
+    ('{station}/{date}/{hour}.nmea', {'station', 'date', 'hour'}),
+    ('{type}.nmea.gz', {'type'}),
+    ('all.nmea', set()),
+])
+def test_template_fields(template, expected):
+    assert template_fields(template) == expected
+
+
+@pytest.mark.parametrize("template", ['{foo}.nmea', '{}.nmea'])
+def test_template_fields_fail(template):
+    with pytest.raises(ValueError, match='Unknown template field'):
+        template_fields(template)
+
+
+@pytest.mark.parametrize("value,expected", [
+    ('66', '66'),
+    ('rORBCOMM000', 'rORBCOMM000'),
+    ('../x', '.._x'),
+    ('..', 'unknown'),
+    ('', 'unknown'),
+])
+def test_safe_path_value(value, expected):
+    assert safe_path_value(value) == expected
+
+
+def test_partition(tmp_path):
+    with Partitioner(str(tmp_path), '{station}/{date}/{hour}.nmea') as partitioner:
+        partitioner.write_lines(LINES)
+    assert read_partitions(tmp_path) == {
+        os.path.join('66', '2022-08-29', '14.nmea'): [LINES[0], LINES[4], LINES[3]],
+        os.path.join('99', '2022-08-29', '15.nmea'): [LINES[1]],
+        os.path.join('unknown', 'unknown', 'unknown.nmea'): [LINES[2], LINES[6], LINES[5]],
+    }
+    assert partitioner.stats() == dict(lines=7, partitions=3, opens=3, evictions=0, unmatched_parts=1)
+
+
+def test_partition_type(tmp_path):
+    with Partitioner(str(tmp_path), '{type}.nmea.gz') as partitioner:
+        partitioner.write_lines(LINES)
+    partitions = read_partitions(tmp_path)
+    assert set(partitions) == {'1.nmea.gz', '5.nmea.gz', '18.nmea.gz', '24.nmea.gz', 'unknown.nmea.gz'}
+    assert partitions['5.nmea.gz'] == [LINES[4], LINES[3]]
+
+
+def multipart_lines(station, group, sequence_id):
+    part1 = '!AIVDM,2,1,{},A,56=nR7D00003A<I@E=@TmDh637OS60mA:222220N1@6427?P00888888,0*66'.format(sequence_id)
+    part2 = '!AIVDM,2,2,{},A,888888888888880,2*27'.format(sequence_id)
+    group_fields = dict(tagblock_groupsize=2, tagblock_id=group) if group else {}
+    tagblock1 = encode_tagblock(tagblock_station=station, tagblock_timestamp=1700000000000, tagblock_sentence=1,
+                                **group_fields)
+    # without a tagblock group, parts are matched by station, sequence id and channel
+    tagblock2 = encode_tagblock(tagblock_sentence=2, **group_fields) if group else encode_tagblock(tagblock_station=station)
+    return [('\\{}\\{}'.format(tagblock1, part1)).encode(), ('\\{}\\{}'.format(tagblock2, part2)).encode()]
+
+
+@pytest.mark.parametrize("group", [7, None])
+def test_partition_reused_group(tmp_path, group):
+    # the second message reuses the group id or sequence id of the first, and arrives with its parts reversed
+    a = multipart_lines('A', group, 3)
+    b = multipart_lines('B' if group else 'A', group, 3)
+    if not group:
+        # use a different file for the second message from the same station
+        b[0] = b[0].replace(b'c:1700000000000', b'c:1700003600000')
+    with Partitioner(str(tmp_path), '{station}/{hour}.nmea') as partitioner:
+        partitioner.write_lines(a + b[::-1])
+    partitions = read_partitions(tmp_path)
+    assert list(partitions.values()).count(a) == 1
+    assert list(partitions.values()).count(b) == 1
+    assert partitioner.stats()['unmatched_parts'] == 0
+
+
+@pytest.mark.parametrize("max_open", [1, 3, 1000])
+def test_partition_max_open(tmp_path, max_open):
+    lines = [line.encode() for line in SyntheticAIS(stations=5, seed=1, out_of_order_rate=0.2).lines(1000)]
+    with Partitioner(str(tmp_path), '{station}/{type}.nmea.zst', max_open=max_open, buffer_size=100) as partitioner:
+        partitioner.write_lines(lines)
+    stats = partitioner.stats()
+    assert stats['lines'] == len(lines)
+    assert stats['partitions'] <= stats['opens'] <= stats['partitions'] + stats['evictions']
+    assert (stats['evictions'] > 0) == (max_open < stats['partitions'])
+
+    partitions = read_partitions(tmp_path)
+    assert len(partitions) == stats['partitions']
+    assert Counter(line for p in partitions.values() for line in p) == Counter(lines)
+
+
+@pytest.mark.parametrize("append,expected", [(False, [b'b']), (True, [b'a', b'b'])])
+def test_open_file_cache_append(tmp_path, append, expected):
+    path = str(tmp_path / 'test' / 'test.nmea.gz')
+    with OpenFileCache() as files:
+        files.write(path, b'a\n')
+    with OpenFileCache(append=append) as files:
+        files.write(path, b'b\n')
+    with open_compressed(path, 'rb') as f:
+        assert f.read().splitlines() == expected
@@ -0,0 +1,85 @@
+import pytest
+
+from ais_tools.aivdm import AIVDM
+from ais_tools.message import Message
+from ais_tools.record import Record
+from ais_tools.record import MessageRecord
+from ais_tools.record import PositionRecord
+from ais_tools.record import StaticRecord
+
+
+@pytest.mark.parametrize("nmea,record_type", [
+    ('\\s:66,c:1663170168*0B\\!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49', PositionRecord),
+    ('!AIVDM,1,1,,A,B>cSnNP00FVur7UaC7WQ3wS1jCJJ,0*73', PositionRecord),
+    ('!AIVDM,1,1,,B,H>cSnNP@4eEL544000000000000,0*3E', StaticRecord),
+    ('invalid', MessageRecord),
+    ('!AIVDM,1,1,,A,D02E3kiLhbfp00N000,0*4D', MessageRecord),
+])
+def test_decode_record(nmea, record_type):
+    decoder = AIVDM()
+    record = decoder.safe_decode_record(nmea)
+    assert type(record) is record_type
+    assert record.to_message() == decoder.safe_decode(nmea)
+    assert not hasattr(record, '__dict__')
+
+
+@pytest.mark.parametrize("message", [
+    {},
+    {'nmea': '!AIVDM', 'id': 1, 'mmsi': 123, 'x': 1.0, 'y': 2.0},
+    {'nmea': '!AIVDM', 'id': 5, 'name': 'BOAT', 'unknown_field': [1, 2]},
+    {'nmea': '!AIVDM', 'id': 99, 'error': 'failed'},
+])
+def test_record_round_trip(message):
+    message = Message(message)
+    record = Record.from_message(message)
+    assert record == message
+    assert Record.from_message(record.to_message()) == record
+
+
+def test_record_access():
+    record = Record.from_message({'nmea': '!AIVDM', 'id': 1, 'mmsi': 123, 'other': 'value'})
+    assert record['mmsi'] == 123
+    assert record.mmsi == 123
+    assert record['other'] == 'value'
+    assert record.get('sog') is None
+    assert record.get('sog', 0) == 0
+    assert 'mmsi' in record
+    assert 'sog' not in record
+    assert record.nmea == '!AIVDM'
+    with pytest.raises(KeyError):
+        record['sog']
+
+    record['sog'] = 1.5
+    record['another'] = 1
+    assert record.to_message() == {'nmea': '!AIVDM', 'id': 1, 'mmsi': 123, 'sog': 1.5, 'other': 'value', 'another': 1}
+
+
+def test_record_message_methods():
+    message = Message(nmea='!AVIDM123', source='test')
+    record = Record.from_message(message)
+    record.add_uuid().add_source('other').add_parser_version()
+    message.add_uuid().add_source('other').add_parser_version()
+    assert record.to_message() == message
+    assert record['uuid'] == '123c397d-7053-8788-5984-74c73f833f37'
+
+
+@pytest.mark.parametrize("nmea", [
+    '\\s:66,c:1663170168*0B\\!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49',
+    '!AIVDM,1,1,,B,H>cSnNP@4eEL544000000000000,0*3E',
+    'invalid',
+])
+def test_record_key_order(nmea):
+    message = AIVDM().safe_decode(nmea).add_source('test')
+    record = Record.from_message(message)
+    assert list(record.to_message().items()) == list(message.items())
+
+
+def test_record_none_values():
+    message = Message(nmea='!AIVDM', id=1, mmsi=None, other=None)
+    record = Record.from_message(message)
+    assert list(record.to_message().items()) == list(message.items())
+    assert 'mmsi' in record
+    assert 'other' in record
+    assert record['mmsi'] is None
+    assert record.get('mmsi', 0) is None
+    assert 'sog' not in record
@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+from ais_tools.aivdm import AIVDM
+from ais_tools.nmea import join_multipart_stream
+from ais_tools.synthetic import SyntheticAIS
+from ais_tools.synthetic import parse_type_mix
+from ais_tools.synthetic import position_report_encode
+from ais_tools.synthetic import split_payload
+from ais_tools.synthetic import static_voyage_encode
+
+
+@pytest.mark.parametrize("message_type", [1, 2, 3])
+def test_position_report_encode(message_type):
+    message = dict(id=message_type, mmsi=123456789, x=-73.12345, y=40.54321, sog=12.3, cog=271.5, true_heading=272,
+                   timestamp=15, nav_status=0)
+    body, pad = position_report_encode(message)
+    decoded = AIVDM().decode_payload(body, pad)
+    for key, value in message.items():
+        assert decoded[key] == pytest.approx(value, abs=1e-4)
+
+
+def test_static_voyage_encode():
+    message = dict(id=5, mmsi=123456789, imo_num=9123456, callsign='ABC123', name='TEST VESSEL',
+                   type_and_cargo=70, dim_a=100, dim_b=20, dim_c=10, dim_d=12, draught=8.5, destination='ROTTERDAM')
+    body, pad = static_voyage_encode(message)
+    assert (len(body), pad) == (71, 2)
+    decoded = AIVDM().decode_payload(body, pad)
+    assert decoded['name'] == 'TEST VESSEL@@@@@@@@@'
+    assert decoded['callsign'] == 'ABC123@'
+    assert decoded['destination'] == 'ROTTERDAM@@@@@@@@@@@'
+    for key in ['mmsi', 'imo_num', 'type_and_cargo', 'dim_a', 'dim_b', 'dim_c', 'dim_d', 'draught']:
+        assert decoded[key] == pytest.approx(message[key])
+
+
+@pytest.mark.parametrize("body,expected", [
+    ('1' * 28, ['AIVDM,1,1,,A,' + '1' * 28 + ',0']),
+    ('5' * 71, ['AIVDM,2,1,7,A,' + '5' * 60 + ',0', 'AIVDM,2,2,7,A,' + '5' * 11 + ',2']),
+])
+def test_split_payload(body, expected):
+    pad = 0 if len(body) == 28 else 2
+    sentences = split_payload(body, pad, 'A', 7)
+    assert [s[1:s.index('*')] for s in sentences] == expected
+
+
+@pytest.mark.parametrize("value,expected", [
+    ('1:10', {1: 10}),
+    ('1:45,5:10,18:20.5', {1: 45, 5: 10, 18: 20.5}),
+])
+def test_parse_type_mix(value, expected):
+    assert parse_type_mix(value) == expected
+
+
+@pytest.mark.parametrize("value,error", [
+    ('1', 'Invalid type mix entry'),
+    ('1:x', 'Invalid type mix entry'),
+    ('4:10', 'Unable to generate message type 4'),
+])
+def test_parse_type_mix_fail(value, error):
+    with pytest.raises(ValueError, match=error):
+        parse_type_mix(value)
+
+
+def test_generate_decodes():
+    generator = SyntheticAIS(vessels=20, stations=3, seed=1)
+    lines = list(generator.lines(500))
+    decoder = AIVDM()
+    messages = [decoder.safe_decode(line) for line in join_multipart_stream(lines)]
+    assert len(messages) == 500
+    assert not [m for m in messages if 'error' in m]
+    assert set(m['id'] for m in messages) == {1, 2, 3, 5, 18, 19, 24}
+    assert set(m['tagblock_station'] for m in messages) == {'synthetic-0', 'synthetic-1', 'synthetic-2'}
+    assert all(-180 <= m['x'] <= 180 and -90 <= m['y'] <= 90 for m in messages if 'x' in m)
+
+    stats = generator.stats()
+    assert stats['messages'] == 500
+    assert stats['lines'] == len(lines)
+    assert sum(stats['types'].values()) == 500
+
+
+def test_generate_repeatable():
+    assert list(SyntheticAIS(seed=3).lines(100)) == list(SyntheticAIS(seed=3).lines(100))
+    assert list(SyntheticAIS(seed=3).lines(100)) != list(SyntheticAIS(seed=4).lines(100))
+
+
+def test_generate_timestamps():
+    generator = SyntheticAIS(vessels=10, report_interval=10, start_time=1700000000, seed=1, type_mix={1: 1})
+    messages = [AIVDM().decode(line) for line in generator.lines(5)]
+    assert [m['tagblock_timestamp'] for m in messages] == [1700000000, 1700000001, 1700000002, 1700000003,
+                                                           1700000004]
+
+
+def test_generate_rate():
+    generator = SyntheticAIS(vessels=5, rate=1000, seed=1, type_mix={1: 1})
+    messages = [AIVDM().decode(line) for line in generator.lines(20)]
+    assert all(abs(m['tagblock_timestamp'] - time.time()) < 60 for m in messages)
+    # the vessels have only moved for a fraction of a second, so none have been pushed to the latitude limit
+    assert all(abs(vessel.point.latitude) < 80 for vessel in generator.vessels)
+
+
+def test_generate_duplicates():
+    generator = SyntheticAIS(duplicate_ratio=1.0, seed=1, type_mix={18: 1})
+    lines = list(generator.lines(10))
+    assert len(lines) == 20
+    assert generator.stats()['duplicates'] == 10
+    assert len(set(line.split('\\')[2] for line in lines)) == 10
+
+
+def test_generate_out_of_order():
+    generator = SyntheticAIS(out_of_order_rate=1.0, max_delay=0, seed=1, type_mix={5: 1})
+    lines = list(generator.lines(10))
+    assert len(lines) == 20
+    assert all(',2,2,' in line for line in lines[::2])
+    assert all(',2,1,' in line for line in lines[1::2])
+    messages = [AIVDM().safe_decode(line) for line in join_multipart_stream(lines)]
+    assert [m['id'] for m in messages] == [5] * 10
+
+
+def test_generate_corrupted():
+    generator = SyntheticAIS(corruption_rate=1.0, seed=1, type_mix={1: 1})
+    lines = list(generator.lines(50))
+    clean = list(SyntheticAIS(seed=1, type_mix={1: 1}).lines(50))
+    assert generator.stats()['corrupted'] == 50
+    assert all(a != b for a, b in zip(lines, clean))
@@ -132,3 +132,122 @@ def test_decode_tagblock_invalid(tagblock_str):
 ])
 def test_update_tagblock(tagblock_str, new_fields, expected):
     assert expected == tagblock.update_tagblock(tagblock_str, **new_fields)
+
+
+@pytest.mark.parametrize("nmea", [
+    "!AIVDM",
+    "\\!AIVDM",
+    "\\c:1000,s:sta*5B\\!AIVDM",
+])
+def test_split_tagblock_bytes(nmea):
+    assert tagblock.split_tagblock(nmea.encode()) == tuple(part.encode() for part in tagblock.split_tagblock(nmea))
+
+
+def test_decode_tagblock_bytes():
+    tagblock_str = 'c:123456789,s:test,g:1-2-3*5A'
+    assert tagblock.decode_tagblock(tagblock_str.encode(), validate_checksum=True) == \
+           tagblock.decode_tagblock(tagblock_str)
+
+
+@pytest.mark.parametrize("add_tagblock_t", [True, False])
+def test_tagblock_factory(add_tagblock_t):
+    factory = tagblock.TagblockFactory('sta', add_tagblock_t)
+    for t in [1, 1.5, 1.9999996, 2, 1577762601.537, 1577762601.9999, 1577762602.0004, 1577762601.001, -1.5]:
+        assert factory.create(t) == tagblock.create_tagblock('sta', t, add_tagblock_t)
+
+
+def test_tagblock_factory_now():
+    t = tagblock.TagblockFactory('sta').create()
+    fields = tagblock.decode_tagblock(t, validate_checksum=True)
+    assert fields['tagblock_station'] == 'sta'
+
+
+def test_tagblock_cache():
+    cache = tagblock.TagblockCache(maxsize=2)
+    tagblock_str = 'c:123456789,s:test,g:1-2-3*5A'
+    expected = tagblock.decode_tagblock(tagblock_str)
+
+    actual = cache(tagblock_str)
+    assert actual == expected
+    actual['tagblock_station'] = 'modified'
+    assert cache(tagblock_str, validate_checksum=True) == expected
+    assert cache.stats() == dict(hits=1, misses=1, hit_rate=0.5, size=1, maxsize=2)
+
+    cache('z:123*70')
+    cache('r:123*78')
+    assert list(cache.cache.keys()) == ['z:123*70', 'r:123*78']
+
+
+def test_tagblock_cache_invalid_checksum():
+    cache = tagblock.TagblockCache()
+    assert cache('z:123*00') == {'z': '123'}
+    with pytest.raises(DecodeError, match='Invalid checksum'):
+        cache('z:123*00', validate_checksum=True)
+    with pytest.raises(DecodeError, match='Invalid checksum'):
+        cache('s:123*00', validate_checksum=True)
+    assert cache.stats()['size'] == 1
+
+
+@pytest.mark.parametrize("line,keys,expected", [
+    ("\\s:rORBCOMM000,q:u,c:1509502436,T:2017-11-01 02.13.56*50\\!AIVDM,1,1,,A,13`el0gP000H=3JN9jb>4?wb0>`<,0*7B",
+     ('c', 's'), (1509502436, 'rORBCOMM000')),
+    ("\\c:1577762601537,s:sdr-experiments,T:2019-12-30 22.23.21*5D\\!AIVDM,1,1,,A,15NTES0P00J>tC4@@FOhMgvD0D0M,0*49",
+     ('s', 'c', 'T'), ('sdr-experiments', 1577762601.537, '2019-12-30 22.23.21')),
+    ("\\g:1-2-9907,n:12,s:rORBCOMM00,c:1327423135*6d\\!AIVDM,2,1,7,B,5,0*10", ('g', 'n', 'x'), ('1-2-9907', 12, None)),
+    ("\\s:missing-checksum\\!AIVDM,1,1,,A,1,0*7B", ('s',), ('missing-checksum',)),
+    ("\\s:missing-delimiter*50!AIVDM,1,1,,A,1,0*7B", ('s',), ('missing-delimiter',)),
+    ("\\ss:not-s,xs:not-s*00\\!AIVDM,1,1,,A,1,0*7B", ('s',), (None,)),
+    ("\\!AIVDM,1,1,,A,1,0*7B", ('c', 's'), (None, None)),
+    ("!AIVDM,1,1,,A,1,0*7B", ('c', 's'), (None, None)),
+    ("", ('c', 's'), (None, None)),
+])
+def test_extract(line, keys, expected):
+    assert tagblock.extract(line, keys) == expected
+    assert tagblock.extract(line.encode(), keys) == expected
+
+
+def test_extract_invalid():
+    with pytest.raises(DecodeError, match='Unable to decode tagblock field c'):
+        tagblock.extract('\\c:invalid*6d\\!AIVDM', keys=('c',))
+
+
+@pytest.mark.parametrize("nmea,new_fields,expected", [
+    ('!AIVDM', {'q': 123}, '\\q:123*7B\\!AIVDM'),
+    ('\\!AIVDM', {'q': 123}, '\\q:123*7B\\!AIVDM'),
+    ('\\s:00*00\\!AIVDM', {'tagblock_station': 99}, '\\s:99*00\\!AIVDM'),
+    ('\\s:00*30\\!AIVDM', {'tagblock_station': 99}, '\\s:99*30\\!AIVDM'),
+    ('\\s:00*31\\!AIVDM\\s:00*00\\!AIVDM', {'tagblock_station': 99}, '\\s:99*31\\!AIVDM\\s:00*00\\!AIVDM'),
+    ('\\c:123456789*68\\!AIVDM', {}, '\\c:123456789*68\\!AIVDM'),
+    ('\\c:123456789*68\\!AIVDM', {'tagblock_station': 99}, '\\c:123456789,s:99*0D\\!AIVDM'),
+    ('\\c:123456789\\!AIVDM', {'tagblock_station': 99}, '\\c:123456789,s:99*0D\\!AIVDM'),
+    ('\\s:rMT5858,*0E\\!AIVDM', {'tagblock_text': 'x'}, '\\s:rMT5858,t:x*38\\!AIVDM'),
+    ('\\g:1-2-3456,s:old,c:1577762601537*1C\\!AIVDM', {'tagblock_station': 'new', 'tagblock_text': 'text'},
+     '\\g:1-2-3456,s:new,c:1577762601537,t:text*78\\!AIVDM'),
+])
+def test_rewrite_tagblock(nmea, new_fields, expected):
+    assert expected == tagblock.rewrite_tagblock(nmea, **new_fields)
+
+
+def test_rewrite_tagblock_checksum():
+    nmea = '\\g:1-2-3456,s:old,c:1577762601537*1C\\!AIVDM'
+    for station in ['new', 'x', '', 'a-much-longer-station-name']:
+        t, _ = tagblock.split_tagblock(tagblock.rewrite_tagblock(nmea, tagblock_station=station, q='u'))
+        assert tagblock.decode_tagblock(t, validate_checksum=True)['tagblock_station'] == station
+
+
+@pytest.mark.parametrize("nmea", [
+    '\\g:BAD-GROUP,c:1326055296*3C\\!AIVDM',
+    '\\c:invalid*3C\\!AIVDM',
+    '\\s:missing:delimiter*3C\\!AIVDM',
+])
+def test_rewrite_tagblock_invalid(nmea):
+    with pytest.raises(DecodeError, match='Unable to decode tagblock'):
+        tagblock.rewrite_tagblock(nmea, tagblock_station='test')
+    assert tagblock.safe_rewrite_tagblock(nmea, tagblock_station='test') == nmea
+
+
+@pytest.mark.parametrize("t", [0, 1.0, 1599239526.5, 1599239526.9999996, 1599239526.9999994, -0.0000004, -1.5])
+def test_timestamp_second(t):
+    from datetime import datetime, timezone
+    expected = datetime.fromtimestamp(t, tz=timezone.utc).replace(microsecond=0).timestamp()
+    assert tagblock.timestamp_second(t) == expected
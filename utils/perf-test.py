@@ -34,8 +34,8 @@ def checksum_compare():
     str = 'A' * 30
     num_iterations = 1000000
     print('checksum_str',
-          timeit.timeit(f'checksumstr("{str}")',
-                        setup='from ais_tools.checksum import checksumstr',
+          timeit.timeit(f'checksum_str("{str}")',
+                        setup='from ais_tools.core import checksum_str',
                         number=num_iterations)
           )
     print('checksumStr',
@@ -61,6 +61,14 @@ def full_decode(n):
         msg.add_parser_version()
 
 
+def full_decode_xxh3(n):
+    for i in range(n):
+        msg = decoder.safe_decode(message1, best_effort=True)
+        msg.add_source('source')
+        msg.add_uuid(algorithm='xxh3_128')
+        msg.add_parser_version()
+
+
 def test_normalize_dedup_key(n):
     msg = {
         'tagblock_timestamp': 123456789,